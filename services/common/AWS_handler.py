@@ -1,8 +1,12 @@
 from services.indexing.env import AWS_S3_BUCKET, AWS_RDS
-from services.common.config import AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, USER_NAME
+from services.common.config import (
+    AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, USER_NAME, S3_MULTIPART_THRESHOLD, S3_MULTIPART_CHUNKSIZE
+)
 
+import io
 import os
 import boto3
+from boto3.s3.transfer import TransferConfig
 import pymysql
 from botocore.exceptions import NoCredentialsError, ClientError
 import logging
@@ -15,6 +19,11 @@ class S3Handler:
             aws_access_key_id=AWS_ACCESS_KEY_ID,
             aws_secret_access_key=AWS_SECRET_ACCESS_KEY
         )
+        # Objects above the threshold are sent and fetched as parallel multipart transfers
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNKSIZE
+        )
 
     def upload_file(self, file_name, folder_prefix=None, object_name=None, metadata=None):
         """Upload a file to an S3 bucket."""
@@ -39,7 +48,9 @@ class S3Handler:
             else:
                 extra_args = None
 
-            response = self.s3.upload_file(file_name, AWS_S3_BUCKET, f"{user_folder}{object_name}", ExtraArgs=extra_args)
+            response = self.s3.upload_file(
+                file_name, AWS_S3_BUCKET, f"{user_folder}{object_name}", ExtraArgs=extra_args, Config=self.transfer_config
+            )
         except ClientError as e:
             logging.error(e)
             return False
@@ -68,8 +79,11 @@ class S3Handler:
                 if object_key.endswith('/') and obj['Size'] == 0:
                     continue
 
-                file_name = os.path.join(dst_folder, os.path.basename(object_key))
-                self.s3.download_file(AWS_S3_BUCKET, object_key, file_name)
+                # Keep sub folders below the folder prefix (e.g. vectorized_db/docstore/)
+                relative_dir = os.path.dirname(object_key[len(f"{USER_NAME}/{folder_prefix}/"):])
+                os.makedirs(os.path.join(dst_folder, relative_dir), exist_ok=True)
+                file_name = os.path.join(dst_folder, relative_dir, os.path.basename(object_key))
+                self.s3.download_file(AWS_S3_BUCKET, object_key, file_name, Config=self.transfer_config)
             
             return True
         
@@ -99,6 +113,76 @@ class S3Handler:
             print(f"Error listing files: {e}")
             return None
         
+    def upload_bytes(self, data, folder_prefix, object_name):
+        """Upload in-memory data to USER_NAME/folder_prefix/object_name.
+
+        :return: True if the object was written, else False
+        """
+        try:
+            self.s3.upload_fileobj(
+                io.BytesIO(data), AWS_S3_BUCKET, f"{USER_NAME}/{folder_prefix}/{object_name}", Config=self.transfer_config
+            )
+            return True
+        except ClientError as e:
+            logging.error(e)
+            return False
+
+    def download_bytes(self, folder_prefix, object_name):
+        """Download USER_NAME/folder_prefix/object_name into memory.
+
+        :return: The object's bytes, or None if it does not exist
+        """
+        buffer = io.BytesIO()
+        try:
+            self.s3.download_fileobj(
+                AWS_S3_BUCKET, f"{USER_NAME}/{folder_prefix}/{object_name}", buffer, Config=self.transfer_config
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+                return None
+            raise
+        return buffer.getvalue()
+
+    def list_objects(self, folder_prefix, object_name_prefix=""):
+        """Return the objects (dicts with Key, ETag and Size) below USER_NAME/folder_prefix/object_name_prefix."""
+        full_prefix = f"{USER_NAME}/{folder_prefix}/{object_name_prefix}"
+        response = self.s3.list_objects_v2(Bucket=AWS_S3_BUCKET, Prefix=full_prefix)
+        return [obj for obj in response.get('Contents', []) if not (obj['Key'].endswith('/') and obj['Size'] == 0)]
+
+    def object_etag(self, object_key):
+        """Return the ETag of object_key with a HEAD request, or None if the object does not exist."""
+        try:
+            return self.s3.head_object(Bucket=AWS_S3_BUCKET, Key=object_key)['ETag']
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def download_object(self, object_key, file_name):
+        """Download object_key to file_name."""
+        self.s3.download_file(AWS_S3_BUCKET, object_key, file_name, Config=self.transfer_config)
+
+    def list_object_names(self, folder_prefix):
+        """Return the names of all objects below USER_NAME/folder_prefix/, relative to it."""
+        full_prefix = f"{USER_NAME}/{folder_prefix}/"
+        names = []
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=AWS_S3_BUCKET, Prefix=full_prefix):
+            names.extend(obj['Key'][len(full_prefix):] for obj in page.get('Contents', []) if obj['Key'] != full_prefix)
+        return names
+
+    def delete_objects(self, folder_prefix, object_names):
+        """Delete objects below USER_NAME/folder_prefix/, 1000 per request."""
+        object_names = list(object_names)
+        try:
+            for start in range(0, len(object_names), 1000):
+                keys = [{'Key': f"{USER_NAME}/{folder_prefix}/{name}"} for name in object_names[start:start + 1000]]
+                self.s3.delete_objects(Bucket=AWS_S3_BUCKET, Delete={'Objects': keys, 'Quiet': True})
+            return True
+        except ClientError as e:
+            logging.error(e)
+            return False
+
     def delete_file(self, file_key):
         """Delete a file from an S3 bucket."""
         try:
@@ -130,7 +130,7 @@ class RedisHandler:
     - Managing conversation blocks
     - Generating conversation IDs
     """
-    def __init__(self):
+    def __init__(self, client: Optional[redis.StrictRedis] = None):
         """Initialize RedisHandler with Redis client and MessageBuilder.
         
         Establishes connection to Redis server using configuration parameters:
@@ -138,8 +138,11 @@ class RedisHandler:
         - REDIS_PORT: Redis server port number
         - db=0: Default Redis database
         - decode_responses=True: Automatically decode Redis responses to strings
+
+        Args:
+            client: Optional existing Redis client to share instead of opening a new one
         """
-        self.client = redis.StrictRedis(
+        self.client = client or redis.StrictRedis(
             host=REDIS_HOST, 
             port=REDIS_PORT, 
             db=0, 
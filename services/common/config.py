@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -21,6 +22,122 @@ LOCAL_FOLDER = fr"{os.getenv('LOCAL_FOLDER')}"
 REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
 REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
 
+# Indexing: "summary" embeds one LLM summary per document, "chunks" embeds passages
+# linked to the parent document, "both" does both
+INDEX_MODE = os.getenv('INDEX_MODE', 'summary')
+CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', 1000))
+CHUNK_OVERLAP = int(os.getenv('CHUNK_OVERLAP', 100))
+# Derive doc_id from the file's content hash instead of a random UUID
+DETERMINISTIC_DOC_IDS = os.getenv('DETERMINISTIC_DOC_IDS', 'false').lower() == 'true'
+
+# Vector store backend: "chroma", "numpy" (exact search over one in-memory float32 matrix per collection,
+# persisted under LOCAL_FOLDER/flat_index) or "ivf" (the same files plus an inverted file of IVF_LISTS k-means
+# lists, 0 for about sqrt(rows), scanning the IVF_NPROBE nearest lists per search); the backends do not
+# share files, so re-index after switching
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'chroma').lower()
+FLAT_INDEX_COMPACT_ROWS = int(os.getenv('FLAT_INDEX_COMPACT_ROWS', 4096))
+IVF_LISTS = int(os.getenv('IVF_LISTS', 0))
+IVF_NPROBE = int(os.getenv('IVF_NPROBE', 16))
+
+# PARTITION_BY "workspace" gives every workspace its own summaries/chunks collections, so searches only scan
+# the workspace's vectors instead of $in-filtering one global collection; uploads without a workspace go to
+# DEFAULT_WORKSPACE. Documents indexed before partitioning stay in the unpartitioned collections.
+PARTITION_BY = os.getenv('PARTITION_BY', 'none').lower()
+DEFAULT_WORKSPACE = os.getenv('DEFAULT_WORKSPACE', USER_NAME or 'default')
+
+# Ingestion keeps a BM25 inverted index of document text (LOCAL_FOLDER/keywords.sqlite3). RETRIEVAL_MODE
+# "vector" searches summary vectors only, "hybrid" fuses the best HYBRID_CANDIDATES of BM25 and vector search
+# with reciprocal rank fusion (RRF_K), "prefilter" scores only the vectors of the best PREFILTER_CANDIDATES
+# BM25 documents
+KEYWORD_INDEX_ENABLED = os.getenv('KEYWORD_INDEX_ENABLED', 'true').lower() == 'true'
+RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'vector').lower()
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', 20))
+RRF_K = int(os.getenv('RRF_K', 60))
+PREFILTER_CANDIDATES = int(os.getenv('PREFILTER_CANDIDATES', 200))
+# Threads shared by the retrieval searches that run concurrently for one request
+SEARCH_WORKERS = int(os.getenv('SEARCH_WORKERS', 8))
+
+# Query vectors are cached per process (LRU of QUERY_CACHE_SIZE, QUERY_CACHE_TTL_SECONDS each)
+# and, with QUERY_CACHE_REDIS, in Redis shared by all server processes
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', 1024))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv('QUERY_CACHE_TTL_SECONDS', 3600))
+QUERY_CACHE_REDIS = os.getenv('QUERY_CACHE_REDIS', 'false').lower() == 'true'
+QUERY_CACHE_REDIS_TTL_SECONDS = int(os.getenv('QUERY_CACHE_REDIS_TTL_SECONDS', 86400))
+
+# Retrieval results are reused for queries within RESULT_CACHE_THRESHOLD cosine similarity of a cached
+# query under the same filter; RESULT_CACHE_SIZE=0 disables the cache
+RESULT_CACHE_THRESHOLD = float(os.getenv('RESULT_CACHE_THRESHOLD', 0.95))
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', 1024))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv('RESULT_CACHE_TTL_SECONDS', 600))
+
+# Full documents fetched from S3 for /retrieve are kept in DOCUMENT_CACHE_FOLDER, least recently used first
+# out once they exceed DOCUMENT_CACHE_MAX_BYTES (0 downloads every time); a cached copy is served without
+# any S3 call for DOCUMENT_CACHE_REVALIDATE_SECONDS, then revalidated against the object's ETag
+DOCUMENT_CACHE_FOLDER = os.getenv('DOCUMENT_CACHE_FOLDER') or os.path.join(tempfile.gettempdir(), 'rag_document_cache')
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv('DOCUMENT_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+DOCUMENT_CACHE_REVALIDATE_SECONDS = float(os.getenv('DOCUMENT_CACHE_REVALIDATE_SECONDS', 60))
+
+# Embedding backend: "openai" or "hashing" (local NumPy feature hashing into EMBEDDING_DIM dimensions,
+# no network); vectors of different backends are not comparable, so re-index after switching
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'openai').lower()
+EMBEDDING_DIM = int(os.getenv('EMBEDDING_DIM', 384))
+
+# Persistent embedding cache shared by indexing and retrieval (defaults to LOCAL_FOLDER/embedding_cache.sqlite3)
+EMBEDDING_CACHE_ENABLED = os.getenv('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH')
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', 100000))
+
+# Summarization: documents over SUMMARY_MAX_TOKENS are map-reduced in SUMMARY_CHUNK_TOKENS chunks,
+# with up to SUMMARY_FAN_OUT concurrent LLM calls
+SUMMARY_MODEL = os.getenv('SUMMARY_MODEL', 'gpt-3.5-turbo')
+SUMMARY_MAX_TOKENS = int(os.getenv('SUMMARY_MAX_TOKENS', 12000))
+SUMMARY_CHUNK_TOKENS = int(os.getenv('SUMMARY_CHUNK_TOKENS', 3000))
+SUMMARY_FAN_OUT = int(os.getenv('SUMMARY_FAN_OUT', 8))
+
+# Client-side OpenAI rate limits: requests and tokens per minute per model, AIMD concurrency up to
+# SCHEDULER_MAX_CONCURRENCY, and a share of the budget kept free for live queries during bulk ingestion
+SUMMARY_RPM = int(os.getenv('SUMMARY_RPM', 3500))
+SUMMARY_TPM = int(os.getenv('SUMMARY_TPM', 160000))
+SUMMARY_OUTPUT_TOKENS = int(os.getenv('SUMMARY_OUTPUT_TOKENS', 512))
+EMBEDDING_RPM = int(os.getenv('EMBEDDING_RPM', 3000))
+EMBEDDING_TPM = int(os.getenv('EMBEDDING_TPM', 1000000))
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 512))
+EMBEDDING_BATCH_TOKENS = int(os.getenv('EMBEDDING_BATCH_TOKENS', 100000))
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv('SCHEDULER_MAX_CONCURRENCY', 16))
+SCHEDULER_LATENCY_TARGET = float(os.getenv('SCHEDULER_LATENCY_TARGET', 30))
+SCHEDULER_INTERACTIVE_RESERVE = float(os.getenv('SCHEDULER_INTERACTIVE_RESERVE', 0.1))
+SCHEDULER_MAX_RETRIES = int(os.getenv('SCHEDULER_MAX_RETRIES', 6))
+
+# Large TXT/DOCX inputs are streamed in segments of about READ_SEGMENT_CHARS characters
+READ_SEGMENT_CHARS = int(os.getenv('READ_SEGMENT_CHARS', 64000))
+
+# PDFs with at least PDF_PARALLEL_MIN_PAGES pages are extracted by PDF_WORKERS processes,
+# PDF_PAGES_PER_TASK pages per task
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', os.cpu_count() or 1))
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', 16))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 32))
+
+# Vector DB sync: files are shipped to S3 as content-addressed SYNC_BLOCK_SIZE blocks,
+# SYNC_MAX_WORKERS at a time; objects above S3_MULTIPART_THRESHOLD use multipart transfers
+SYNC_BLOCK_SIZE = int(os.getenv('SYNC_BLOCK_SIZE', 8 * 1024 * 1024))
+SYNC_MAX_WORKERS = int(os.getenv('SYNC_MAX_WORKERS', 8))
+S3_MULTIPART_THRESHOLD = int(os.getenv('S3_MULTIPART_THRESHOLD', 16 * 1024 * 1024))
+S3_MULTIPART_CHUNKSIZE = int(os.getenv('S3_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024))
+
+# Uploads are spooled to UPLOAD_FOLDER (kept off the vector DB folder) in UPLOAD_CHUNK_SIZE writes
+UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER') or os.path.join(tempfile.gettempdir(), 'rag_uploads')
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 1024 * 1024))
+
+# Ingestion job queue: failed jobs are retried up to INGEST_MAX_ATTEMPTS times with exponential
+# backoff; running jobs without a heartbeat for INGEST_STALE_SECONDS are handed to another worker
+INGEST_MAX_ATTEMPTS = int(os.getenv('INGEST_MAX_ATTEMPTS', 3))
+INGEST_RETRY_BASE_SECONDS = float(os.getenv('INGEST_RETRY_BASE_SECONDS', 5))
+INGEST_RETRY_MAX_SECONDS = float(os.getenv('INGEST_RETRY_MAX_SECONDS', 300))
+INGEST_STALE_SECONDS = float(os.getenv('INGEST_STALE_SECONDS', 600))
+INGEST_JOB_TTL_SECONDS = int(os.getenv('INGEST_JOB_TTL_SECONDS', 7 * 24 * 3600))
+# API servers reopen the vector DB to see newly ingested documents at most once per INDEX_RELOAD_MIN_SECONDS
+INDEX_RELOAD_MIN_SECONDS = float(os.getenv('INDEX_RELOAD_MIN_SECONDS', 5))
+
 # can use os.environ if need environment variables
 os.environ['LANGCHAIN_TRACING_V2'] = LANGCHAIN_TRACING_V2
 os.environ['LANGCHAIN_ENDPOINT'] = LANGCHAIN_ENDPOINT
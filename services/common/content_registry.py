@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+from services.common.config import INGEST_STALE_SECONDS
+from services.common.document_registry import DocumentRegistry
+
+
+class ContentHashRegistry:
+    """Map from file content hash to the doc_id it was indexed under.
+
+    Lets ingestion short-circuit re-uploads of identical bytes to the existing
+    doc_id instead of summarizing, embedding and uploading them again. Entries are
+    claimed while a file is in flight so concurrent uploads of the same content
+    are processed once, and only written to the DocumentRegistry, together with
+    the document's metadata, after the file was indexed.
+
+    Claims live in content_claims.sqlite3 next to the document registry, so
+    ingestion workers in different processes see each other's claims; a claim is
+    taken with one INSERT ... ON CONFLICT in an immediate transaction. A claim
+    older than `stale_seconds` belongs to a worker that died mid-file (its job is
+    retried after the same timeout) and may be taken over.
+    """
+    FILE_NAME = "content_claims.sqlite3"
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, local_folder, stale_seconds=INGEST_STALE_SECONDS):
+        self.documents = DocumentRegistry.for_folder(local_folder)
+        self.stale_seconds = stale_seconds
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(local_folder, self.FILE_NAME), timeout=30,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # Workspace "" stands for documents outside any partition, since NULLs never conflict in a primary key
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS claims (content_hash TEXT NOT NULL, workspace TEXT NOT NULL, "
+            "doc_id TEXT NOT NULL, record TEXT NOT NULL, token TEXT NOT NULL, claimed_at REAL NOT NULL, "
+            "PRIMARY KEY (content_hash, workspace))"
+        )
+        self.connection.commit()
+
+    @classmethod
+    def for_folder(cls, local_folder):
+        """Return the registry shared by everything indexing into local_folder."""
+        with cls._instances_lock:
+            if local_folder not in cls._instances:
+                cls._instances[local_folder] = cls(local_folder)
+            return cls._instances[local_folder]
+
+    def lookup(self, content_hash, workspace=None):
+        """Return the doc_id indexed for content_hash in workspace, or None."""
+        return self.documents.find_by_hash(content_hash, workspace)
+
+    def claim(self, content_hash, doc_id, record=None, workspace=None):
+        """Reserve content_hash for doc_id.
+
+        Content is deduplicated per workspace, since each workspace searches only its own partition.
+
+        :param record: Document metadata (name, doc_type, size) stored on commit.
+        :return: The doc_id already indexed (or being indexed) for this content, or
+                 None if the caller now owns it and must `commit` or `release` it.
+        """
+        existing = self.documents.find_by_hash(content_hash, workspace)
+        if existing:
+            return existing
+        # Deterministic doc_ids are the same for every upload of the content, so a token tells who won the claim
+        token, now = uuid.uuid4().hex, time.time()
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.execute(
+                    "INSERT INTO claims (content_hash, workspace, doc_id, record, token, claimed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(content_hash, workspace) DO UPDATE SET "
+                    "doc_id = excluded.doc_id, record = excluded.record, token = excluded.token, "
+                    "claimed_at = excluded.claimed_at WHERE claimed_at < ?",
+                    (content_hash, workspace or "", doc_id, json.dumps(dict(record or {}, workspace=workspace)), token,
+                     now, now - self.stale_seconds)
+                )
+                owner, owner_token = self.connection.execute(
+                    "SELECT doc_id, token FROM claims WHERE content_hash = ? AND workspace = ?",
+                    (content_hash, workspace or "")
+                ).fetchone()
+                self.connection.commit()
+            except BaseException:
+                self.connection.rollback()
+                raise
+        if owner_token != token:
+            return owner
+        # The document may have been committed between the lookup and the claim
+        existing = self.documents.find_by_hash(content_hash, workspace)
+        if existing:
+            self.release(content_hash, workspace)
+        return existing
+
+    def _claim(self, content_hash, workspace):
+        row = self.connection.execute("SELECT doc_id, record FROM claims WHERE content_hash = ? AND workspace = ?",
+                                      (content_hash, workspace or "")).fetchone()
+        return (row[0], json.loads(row[1])) if row else (None, None)
+
+    def commit(self, content_hash, workspace=None):
+        """Register a claimed hash's document once it has been indexed."""
+        with self._lock:
+            doc_id, record = self._claim(content_hash, workspace)
+        if doc_id is None:
+            return
+        self.documents.add(doc_id, content_hash=content_hash, **record)
+        self.release(content_hash, workspace)
+
+    def update(self, content_hash, workspace=None, **record):
+        """Add fields to the record a claimed hash's document is registered with on commit.
+
+        :return: False if content_hash is not claimed.
+        """
+        with self._lock:
+            doc_id, stored = self._claim(content_hash, workspace)
+            if doc_id is None:
+                return False
+            stored.update(record)
+            self.connection.execute("UPDATE claims SET record = ? WHERE content_hash = ? AND workspace = ?",
+                                    (json.dumps(stored), content_hash, workspace or ""))
+            self.connection.commit()
+            return True
+
+    def release(self, content_hash, workspace=None):
+        """Drop a claim after indexing failed, so the content can be retried."""
+        with self._lock:
+            self.connection.execute("DELETE FROM claims WHERE content_hash = ? AND workspace = ?",
+                                    (content_hash, workspace or ""))
+            self.connection.commit()
+
+    def remove_doc_id(self, doc_id):
+        """Forget doc_id and its hash (called when the document is deleted)."""
+        return self.documents.remove(doc_id)
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
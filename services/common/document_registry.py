@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+RECORD_FIELDS = ("name", "doc_type", "content_hash", "size", "indexed_at", "workspace", "chars", "tokens")
+# Columns added after the first release, created on open when missing
+ADDED_COLUMNS = {"workspace": "TEXT", "chars": "INTEGER", "tokens": "INTEGER"}
+
+
+class DocumentRegistry:
+    """Registry of indexed documents, kept in documents.sqlite3 next to chroma.sqlite3.
+
+    One row per doc_id with its name, doc_type, content_hash, size, indexed_at,
+    workspace (None for documents outside any vector partition) and the length of
+    its extracted text in chars and tokens,
+    so inserts, lookups and deletes are single indexed statements instead of a
+    rewrite of the whole id list. The database runs in WAL mode, so readers do not
+    block the writer and several processes can share it. Ids tracked by the older
+    doc_id.json / content_hashes.json files are imported once when the registry is
+    first opened.
+    """
+    FILE_NAME = "documents.sqlite3"
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, local_folder):
+        self.local_folder = local_folder
+        self.path = os.path.join(local_folder, self.FILE_NAME)
+        self._lock = threading.Lock()
+        os.makedirs(local_folder, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "doc_id TEXT PRIMARY KEY, name TEXT, doc_type TEXT, content_hash TEXT, size INTEGER, indexed_at REAL, "
+            "workspace TEXT, chars INTEGER, tokens INTEGER)"
+        )
+        columns = {row["name"] for row in self.connection.execute("PRAGMA table_info(documents)")}
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE documents ADD COLUMN {column} {column_type}")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_documents_workspace ON documents(workspace)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash)")
+        self.connection.commit()
+        self.migrate_json()
+
+    @classmethod
+    def for_folder(cls, local_folder):
+        """Return the registry shared by everything using local_folder in this process."""
+        key = os.path.abspath(local_folder)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(local_folder)
+            return cls._instances[key]
+
+    def add(self, doc_id, **record):
+        """Insert or update the row for doc_id.
+
+        Fields left out (or None) keep their stored value; indexed_at defaults to now
+        for new rows.
+        """
+        self.add_many([(doc_id, record)])
+
+    def add_many(self, entries):
+        """Insert or update (doc_id, record) pairs in a single transaction."""
+        rows = []
+        for doc_id, record in entries:
+            unknown = set(record) - set(RECORD_FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown document fields: {sorted(unknown)}")
+            values = {field: record.get(field) for field in RECORD_FIELDS}
+            if values["indexed_at"] is None:
+                values["indexed_at"] = time.time()
+            rows.append((doc_id, *(values[field] for field in RECORD_FIELDS)))
+        if not rows:
+            return
+        with self._lock:
+            self.connection.executemany(
+                f"INSERT INTO documents (doc_id, {', '.join(RECORD_FIELDS)}) "
+                f"VALUES ({', '.join('?' * (len(RECORD_FIELDS) + 1))}) ON CONFLICT(doc_id) DO UPDATE SET "
+                + ", ".join(f"{field} = COALESCE(excluded.{field}, {field})" for field in RECORD_FIELDS
+                            if field != "indexed_at"),
+                rows
+            )
+            self.connection.commit()
+
+    def get(self, doc_id):
+        """Return the record for doc_id as a dict, or None."""
+        with self._lock:
+            row = self.connection.execute("SELECT * FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return dict(row) if row else None
+
+    def find_by_hash(self, content_hash, workspace=None):
+        """Return the doc_id indexed for content_hash in workspace, or None."""
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT doc_id FROM documents WHERE content_hash = ? AND workspace IS ? LIMIT 1", (content_hash, workspace)
+            ).fetchone()
+        return row["doc_id"] if row else None
+
+    def workspaces(self, doc_ids):
+        """Return {doc_id: workspace} for the registered doc_ids (workspace None outside any partition)."""
+        doc_ids = list(dict.fromkeys(doc_ids))
+        found = {}
+        with self._lock:
+            for start in range(0, len(doc_ids), 500):
+                batch = doc_ids[start:start + 500]
+                rows = self.connection.execute(
+                    f"SELECT doc_id, workspace FROM documents WHERE doc_id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update((row["doc_id"], row["workspace"]) for row in rows)
+        return found
+
+    def count(self, workspace=None):
+        """Return the number of documents registered in workspace."""
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM documents WHERE workspace IS ?", (workspace,)).fetchone()[0]
+
+    def remove(self, doc_id):
+        """Delete the row for doc_id; return True if it existed."""
+        with self._lock:
+            cursor = self.connection.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            self.connection.commit()
+        return cursor.rowcount > 0
+
+    def doc_ids(self):
+        """Return every registered doc_id, oldest first."""
+        with self._lock:
+            rows = self.connection.execute("SELECT doc_id FROM documents ORDER BY indexed_at, doc_id").fetchall()
+        return [row["doc_id"] for row in rows]
+
+    def __contains__(self, doc_id):
+        with self._lock:
+            return self.connection.execute("SELECT 1 FROM documents WHERE doc_id = ?", (doc_id,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def reopen(self):
+        """Reconnect after documents.sqlite3 was replaced on disk (e.g. restored from S3)."""
+        with self._lock:
+            self.connection.close()
+            self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.connection.row_factory = sqlite3.Row
+            self.connection.execute("PRAGMA journal_mode=WAL")
+
+    def checkpoint(self):
+        """Fold the WAL back into documents.sqlite3 so the file can be copied on its own."""
+        with self._lock:
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def migrate_json(self):
+        """Import doc_id.json and content_hashes.json, then rename them to *.migrated.
+
+        :return: Number of documents imported.
+        """
+        entries = {}
+        doc_id_file_path = os.path.join(self.local_folder, "doc_id.json")
+        hashes_file_path = os.path.join(self.local_folder, "content_hashes.json")
+        if os.path.exists(doc_id_file_path):
+            with open(doc_id_file_path, 'r', encoding='utf-8') as f:
+                entries.update((doc_id, {}) for doc_id in json.load(f))
+        if os.path.exists(hashes_file_path):
+            with open(hashes_file_path, 'r', encoding='utf-8') as f:
+                for content_hash, doc_id in json.load(f).items():
+                    entries.setdefault(doc_id, {})["content_hash"] = content_hash
+        if not entries and not os.path.exists(doc_id_file_path) and not os.path.exists(hashes_file_path):
+            return 0
+
+        self.add_many(entries.items())
+        for file_path in (doc_id_file_path, hashes_file_path):
+            if os.path.exists(file_path):
+                os.replace(file_path, f"{file_path}.migrated")
+        print(f"Migrated {len(entries)} documents into {self.FILE_NAME}")
+        return len(entries)
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
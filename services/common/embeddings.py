@@ -0,0 +1,200 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from services.common.config import (
+    LOCAL_FOLDER, EMBEDDING_BACKEND, EMBEDDING_DIM, EMBEDDING_RPM, EMBEDDING_TPM,
+    EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_TOKENS,
+    EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES
+)
+
+
+class SQLiteEmbeddingStore:
+    """On-disk vector cache keyed by (model, text hash) with size-bounded LRU eviction.
+
+    Vectors are stored as float32 blobs. Every hit refreshes `last_access`; when the
+    table grows past `max_entries` the least recently used rows are deleted.
+    """
+    def __init__(self, path, max_entries=100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self.connection.commit()
+
+    def mget(self, keys):
+        """Return the cached vectors for keys, None where missing."""
+        if not keys:
+            return []
+        found = {}
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ", ".join("?" * len(batch))
+                rows = self.connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update((key, array('f', blob).tolist()) for key, blob in rows)
+            if found:
+                now = time.time()
+                self.connection.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self.connection.commit()
+        return [found.get(key) for key in keys]
+
+    def mset(self, items):
+        """Store (key, vector) pairs and evict the least recently used rows beyond max_entries."""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                [(key, array('f', vector).tobytes(), now) for key, vector in items]
+            )
+            overflow = self._count() - self.max_entries
+            if overflow > 0:
+                self.connection.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)", (overflow,)
+                )
+            self.connection.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._count()
+
+    def _count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves repeated texts from a persistent cache.
+
+    Only cache misses are sent to the underlying model, in a single batched call.
+    `hits` and `misses` count texts served from / not found in the cache.
+    """
+    def __init__(self, underlying: Embeddings, store: SQLiteEmbeddingStore, model_name=None):
+        self.underlying = underlying
+        self.store = store
+        self.model_name = model_name or getattr(underlying, "model", type(underlying).__name__)
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def _key(self, text):
+        return f"{self.model_name}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_cached(texts, self.underlying.embed_documents)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Like embed_documents, but misses are embedded as queries (interactive priority)."""
+        return self._embed_cached(texts, lambda missing_texts: embed_queries(self.underlying, missing_texts))
+
+    def _embed_cached(self, texts, embed_missing):
+        keys = [self._key(text) for text in texts]
+        vectors = self.store.mget(keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        with self._stats_lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            # Embed each distinct missing text once
+            missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+            computed = dict(zip(missing_texts, embed_missing(missing_texts)))
+            for i in missing:
+                vectors[i] = computed[texts[i]]
+            self.store.mset([(self._key(text), vector) for text, vector in computed.items()])
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self.store.mget([key])[0]
+        with self._stats_lock:
+            if vector is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if vector is None:
+            vector = self.underlying.embed_query(text)
+            self.store.mset([(key, vector)])
+        return vector
+
+    def stats(self):
+        """Return hit/miss counters and the number of cached vectors."""
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "model": self.model_name,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "entries": len(self.store),
+        }
+
+
+def embed_queries(embeddings, texts):
+    """Embed several queries in one batched call; embeddings without embed_queries use embed_documents."""
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    return embeddings.embed_documents(texts)
+
+
+def build_embeddings(backend=EMBEDDING_BACKEND):
+    """Create the embeddings configured for this deployment.
+
+    :param backend: "openai" (rate-scheduled, cache-backed unless disabled) or
+                    "hashing" (local, computed in-process, so neither applies).
+    """
+    if backend == "hashing":
+        from services.common.local_embeddings import HashingEmbeddings
+        return HashingEmbeddings(dim=EMBEDDING_DIM)
+    if backend != "openai":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+    from langchain_openai import OpenAIEmbeddings  # imports the openai client, so only on first use
+    from services.common.resources import get_scheduler
+    from services.common.rate_limiter import ScheduledEmbeddings
+    # Retries are left to the scheduler: 429s back off every caller sharing the budget, other transient errors the call
+    model = OpenAIEmbeddings(max_retries=0)
+    embeddings = ScheduledEmbeddings(
+        model, get_scheduler(model.model, EMBEDDING_RPM, EMBEDDING_TPM),
+        batch_size=EMBEDDING_BATCH_SIZE, batch_tokens=EMBEDDING_BATCH_TOKENS
+    )
+    if EMBEDDING_CACHE_ENABLED:
+        cache_path = EMBEDDING_CACHE_PATH or os.path.join(LOCAL_FOLDER, "embedding_cache.sqlite3")
+        store = SQLiteEmbeddingStore(cache_path, max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+        return CachedEmbeddings(embeddings, store)
+    return embeddings
+
+
+def close_embeddings(embeddings):
+    """Close the cache store behind embeddings, if any."""
+    if isinstance(embeddings, CachedEmbeddings):
+        embeddings.store.close()
+
+
+def get_embeddings():
+    """Return the process-wide embeddings used for both indexing and retrieval."""
+    from services.common.resources import get_embeddings as get_shared_embeddings
+    return get_shared_embeddings()
@@ -0,0 +1,367 @@
+import os
+import json
+import uuid
+import threading
+from typing import Any, Iterable, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from services.common.helper import FileLock
+
+META_FILE_NAME = "meta.json"
+
+
+class NumpyFlatIndex(VectorStore):
+    """Exact vector index held in one contiguous float32 NumPy matrix.
+
+    Rows are L2-normalized embeddings with parallel lists of ids, texts and
+    metadata, plus an int32 array of doc_id codes so the `doc_id` `$in` filter
+    is a boolean mask. A search is one matrix-vector product and an
+    `argpartition` top-k, which beats a SQLite-backed store up to a few hundred
+    thousand vectors.
+
+    On disk (`folder`), meta.json points at the current generation: a snapshot
+    (vectors-<gen>.npy, memory-mapped on load, and rows-<gen>.jsonl) and an
+    append-only log of later adds/deletes (log-<gen>.jsonl with the added vectors
+    in log-<gen>.f32). Writes only append to the log; once it outgrows
+    `compact_rows` (or a quarter of the snapshot) it is folded into the next
+    generation, and meta.json is replaced atomically to commit it. A process
+    that only reads (the retrieval server) maps the snapshot without copying it
+    and reloads when another process changed the files.
+    """
+    def __init__(self, embedding_function, folder, collection_name="summaries", compact_rows=4096):
+        self.embedding_function = embedding_function
+        self.folder = folder
+        self.collection_name = collection_name
+        self.compact_rows = compact_rows
+        self._lock = threading.RLock()
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    # ---- loading and persistence -------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.folder, name)
+
+    def _stamp(self):
+        """Fingerprint of the files, used to notice writes made by other processes."""
+        stamp = []
+        for name in (META_FILE_NAME, f"log-{self._generation}.jsonl"):
+            try:
+                stat = os.stat(self._path(name))
+                stamp.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def _load(self):
+        meta = {"generation": 0, "dim": None}
+        if os.path.exists(self._path(META_FILE_NAME)):
+            with open(self._path(META_FILE_NAME), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        self._generation = meta["generation"]
+        self._dim = meta["dim"]
+        self._ids, self._texts, self._metadatas = [], [], []
+        vectors = None
+        snapshot_path = self._path(f"vectors-{self._generation}.npy")
+        if os.path.exists(snapshot_path):
+            vectors = np.load(snapshot_path, mmap_mode='r')
+            with open(self._path(f"rows-{self._generation}.jsonl"), 'r', encoding='utf-8') as f:
+                for line in f:
+                    row = json.loads(line)
+                    self._ids.append(row["id"])
+                    self._texts.append(row["text"])
+                    self._metadatas.append(row["metadata"])
+        self._vectors = vectors if vectors is not None else np.zeros((0, self._dim or 0), dtype=np.float32)
+        self._size = len(self._ids)
+        self._alive = np.ones(self._size, dtype=bool)
+        self._row_of = {row_id: row for row, row_id in enumerate(self._ids)}
+        self._doc_code_of = {}
+        self._doc_codes = np.array([self._doc_code(metadata) for metadata in self._metadatas], dtype=np.int32)
+        self._log_rows = 0
+        self._load_snapshot_extras()
+        self._replay_log()
+        self._loaded_stamp = self._stamp()
+
+    def _replay_log(self):
+        log_path = self._path(f"log-{self._generation}.jsonl")
+        if not os.path.exists(log_path):
+            return
+        with open(log_path, 'r', encoding='utf-8') as f:
+            entries = []
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break  # torn write at the end of the log
+        added = sum(1 for entry in entries if entry["op"] == "add")
+        log_vectors = np.fromfile(self._path(f"log-{self._generation}.f32"), dtype=np.float32) if added else None
+        if added:
+            log_vectors = log_vectors[:(len(log_vectors) // self._dim) * self._dim].reshape(-1, self._dim)
+        index = 0
+        for entry in entries:
+            if entry["op"] == "add":
+                if index >= len(log_vectors):
+                    break
+                self._append_rows([entry["id"]], [entry["text"]], [entry["metadata"]], log_vectors[index:index + 1])
+                index += 1
+            else:
+                self._delete_rows([entry["id"]])
+        self._log_rows = len(entries)
+
+    def _doc_code(self, metadata):
+        doc_id = (metadata or {}).get("doc_id")
+        if doc_id is None:
+            return -1
+        return self._doc_code_of.setdefault(doc_id, len(self._doc_code_of))
+
+    def _writable(self, extra_rows):
+        """Make sure the matrix is an in-memory array with room for extra_rows more rows."""
+        needed = self._size + extra_rows
+        if isinstance(self._vectors, np.memmap) or len(self._vectors) < needed:
+            capacity = max(needed, 2 * len(self._vectors), 1024)
+            vectors = np.empty((capacity, self._dim), dtype=np.float32)
+            vectors[:self._size] = self._vectors[:self._size]
+            self._vectors = vectors
+            alive = np.zeros(capacity, dtype=bool)
+            alive[:self._size] = self._alive[:self._size]
+            self._alive = alive
+            codes = np.full(capacity, -1, dtype=np.int32)
+            codes[:self._size] = self._doc_codes[:self._size]
+            self._doc_codes = codes
+
+    def _append_rows(self, ids, texts, metadatas, vectors):
+        self._delete_rows([row_id for row_id in ids if row_id in self._row_of])
+        self._writable(len(ids))
+        start = self._size
+        self._vectors[start:start + len(ids)] = vectors
+        self._alive[start:start + len(ids)] = True
+        for offset, (row_id, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+            self._ids.append(row_id)
+            self._texts.append(text)
+            self._metadatas.append(metadata)
+            self._doc_codes[start + offset] = self._doc_code(metadata)
+            self._row_of[row_id] = start + offset
+        self._size += len(ids)
+
+    def _delete_rows(self, ids):
+        rows = [self._row_of.pop(row_id) for row_id in ids if row_id in self._row_of]
+        if rows:
+            self._alive[rows] = False
+        return len(rows)
+
+    def _load_snapshot_extras(self):
+        """Hook for subclasses keeping more per-row state next to the snapshot."""
+
+    def _save_snapshot_extras(self, generation, live):
+        """Hook for subclasses: write their files of generation for the live rows before it is committed."""
+
+    def _snapshot_files(self, generation):
+        return [f"vectors-{generation}.npy", f"rows-{generation}.jsonl",
+                f"log-{generation}.jsonl", f"log-{generation}.f32"]
+
+    def _write_meta(self, generation):
+        tmp_path = self._path(f"{META_FILE_NAME}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"generation": generation, "dim": self._dim, "collection": self.collection_name}, f)
+        os.replace(tmp_path, self._path(META_FILE_NAME))
+
+    def _file_lock(self):
+        return FileLock(self._path(".lock"))
+
+    def _refresh(self):
+        """Reload if another process wrote to the index since it was loaded."""
+        if self._stamp() != self._loaded_stamp:
+            self._load()
+
+    def compact(self):
+        """Fold the log into a new snapshot generation holding only live rows."""
+        with self._lock, self._file_lock():
+            self._refresh()
+            self._compact()
+
+    def _compact(self):
+        # Callers hold both locks: flock is per open file, so taking it again here would block
+        live = np.flatnonzero(self._alive[:self._size])
+        generation = self._generation + 1
+        np.save(self._path(f"vectors-{generation}.npy"), np.ascontiguousarray(self._vectors[live]))
+        with open(self._path(f"rows-{generation}.jsonl"), 'w', encoding='utf-8') as f:
+            for row in live:
+                f.write(json.dumps({"id": self._ids[row], "text": self._texts[row],
+                                    "metadata": self._metadatas[row]}) + "\n")
+        self._save_snapshot_extras(generation, live)
+        self._write_meta(generation)
+        for name in self._snapshot_files(self._generation):
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+        self._load()
+
+    def _log(self, entries, vectors=None):
+        """Append entries (and the vectors of added rows) to the log, compacting it when it grows too long."""
+        with open(self._path(f"log-{self._generation}.jsonl"), 'a', encoding='utf-8') as f:
+            if vectors is not None and len(vectors):
+                with open(self._path(f"log-{self._generation}.f32"), 'ab') as vector_file:
+                    vector_file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        self._log_rows += len(entries)
+        self._loaded_stamp = self._stamp()
+        if self._log_rows >= max(self.compact_rows, len(self._ids) // 4):
+            self._compact()
+
+    # ---- VectorStore API ---------------------------------------------------------
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, *,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        vectors = self.embedding_function.embed_documents(texts)
+        return self.add_embeddings(list(zip(texts, vectors)), metadatas, ids=ids)
+
+    def add_embeddings(self, text_embeddings, metadatas=None, *, ids=None) -> List[str]:
+        """Add (text, vector) pairs whose vectors were computed already."""
+        texts = [text for text, _ in text_embeddings]
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors = _normalize_rows(np.asarray([vector for _, vector in text_embeddings], dtype=np.float32))
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                self._vectors = np.zeros((0, self._dim), dtype=np.float32)
+                self._write_meta(self._generation)
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the index ({self._dim}).")
+            self._append_rows(ids, texts, metadatas, vectors)
+            self._log([{"op": "add", "id": row_id, "text": text, "metadata": metadata}
+                       for row_id, text, metadata in zip(ids, texts, metadatas)], vectors)
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[dict] = None, **kwargs: Any) -> Optional[bool]:
+        """Delete the vectors stored under ids and, like Chroma, those whose metadata matches where."""
+        if not ids and not where:
+            return False
+        with self._lock, self._file_lock():
+            self._refresh()
+            if where:
+                ids = list(ids or []) + [self._ids[row] for row in np.flatnonzero(self._mask(where))]
+            deleted = self._delete_rows(ids)
+            if deleted:
+                self._log([{"op": "delete", "id": row_id} for row_id in ids])
+        return deleted > 0
+
+    def get_by_ids(self, ids, /) -> List[Document]:
+        with self._lock:
+            self._refresh()
+            return [self._document(self._row_of[row_id]) for row_id in ids if row_id in self._row_of]
+
+    def count(self):
+        """Number of live vectors."""
+        with self._lock:
+            self._refresh()
+            return len(self._row_of)
+
+    def _document(self, row):
+        return Document(id=self._ids[row], page_content=self._texts[row], metadata=dict(self._metadatas[row]))
+
+    def _mask(self, filter):
+        """Boolean mask of the live rows matching filter ({field: value} or {field: {"$in": [...]}})."""
+        mask = self._alive[:self._size].copy()
+        for field, condition in (filter or {}).items():
+            values = condition["$in"] if isinstance(condition, dict) and "$in" in condition else [condition]
+            if field == "doc_id":
+                codes = [self._doc_code_of[value] for value in values if value in self._doc_code_of]
+                mask &= np.isin(self._doc_codes[:self._size], codes)
+            else:
+                allowed = set(values)
+                mask &= np.fromiter((metadata.get(field) in allowed for metadata in self._metadatas),
+                                    dtype=bool, count=self._size)
+        return mask
+
+    def _candidate_rows(self, query, mask, **kwargs):
+        """Rows to score for query among those selected by mask; every selected row for exact search."""
+        return np.flatnonzero(mask)
+
+    def similarity_search_by_vector_with_scores(self, embedding, k=4, filter=None, **kwargs):
+        """Return the k most similar (Document, cosine similarity) pairs, best first."""
+        query = _normalize_rows(np.asarray(embedding, dtype=np.float32)[None, :])[0]
+        with self._lock:
+            self._refresh()
+            if not self._size or k <= 0:
+                return []
+            mask = self._mask(filter)
+            rows = self._candidate_rows(query, mask, **kwargs)
+            if not len(rows):
+                return []
+            # Score only the candidate rows when the filter is selective, every row otherwise
+            if len(rows) < self._size // 2:
+                scores = self._vectors[rows] @ query
+            else:
+                scores = np.where(mask, self._vectors[:self._size] @ query, -np.inf)
+                rows = np.arange(self._size)
+            k = min(k, int(np.count_nonzero(np.isfinite(scores))))
+            top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+            top = top[np.argsort(-scores[top])][:k]
+            return [(self._document(int(rows[i])), float(scores[i])) for i in top]
+
+    def similarity_search_by_vectors_with_scores(self, embeddings, k=4, filter=None, **kwargs):
+        """Search several query vectors at once: one (Document, score) list per query, best first.
+
+        The candidate rows are scored against every query in a single matrix product.
+        """
+        queries = _normalize_rows(np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1))
+        with self._lock:
+            self._refresh()
+            if not self._size or k <= 0:
+                return [[] for _ in queries]
+            mask = self._mask(filter)
+            rows = np.flatnonzero(mask)
+            k = min(k, len(rows))
+            if not k:
+                return [[] for _ in queries]
+            if len(rows) < self._size // 2:
+                scores = self._vectors[rows] @ queries.T
+            else:
+                scores = self._vectors[:self._size] @ queries.T
+                scores[~mask] = -np.inf
+                rows = np.arange(self._size)
+            results = []
+            for column in scores.T:
+                top = np.argpartition(-column, k - 1)[:k] if k < len(column) else np.arange(len(column))
+                top = top[np.argsort(-column[top])][:k]
+                results.append([(self._document(int(rows[i])), float(column[i])) for i in top])
+            return results
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter=None, **kwargs: Any):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_scores(embedding, k=k, filter=filter, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter=None, **kwargs: Any):
+        embedding = self.embedding_function.embed_query(query)
+        return self.similarity_search_by_vector_with_scores(embedding, k=k, filter=filter, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, filter=None, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, *, ids=None, folder=None, **kwargs):
+        index = cls(embedding, folder, **kwargs)
+        index.add_texts(texts, metadatas, ids=ids)
+        return index
+
+
+def _normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
@@ -0,0 +1,56 @@
+import uuid
+import hashlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers in one process are still serialized by their thread locks
+    fcntl = None
+
+# Namespace for content-derived doc_ids, so the same bytes always map to the same id
+CONTENT_UUID_NAMESPACE = uuid.UUID("6f1c2f4e-3b7a-4d59-9a52-5f0c8e1d7b21")
+
+
+class FileUUIDGenerator:
+    """Generate unique identifiers for uploaded files."""
+
+    def generate_unique_uuid(self):
+        """Return a random UUID4 string used as the document's doc_id."""
+        return str(uuid.uuid4())
+
+    def generate_content_uuid(self, content_hash):
+        """Return a deterministic UUID5 string derived from the file's content hash."""
+        return str(uuid.uuid5(CONTENT_UUID_NAMESPACE, content_hash))
+
+
+def hash_file(file_path, chunk_size=1024 * 1024):
+    """Compute the SHA-256 of a file, reading it in fixed-size chunks.
+
+    :param file_path: Path of the file to hash.
+    :param chunk_size: Number of bytes read per iteration.
+    :return: Hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FileLock:
+    """Exclusive lock on a file, serializing writers across processes (POSIX only)."""
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._file = open(self.path, 'a')
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        return False
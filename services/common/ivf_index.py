@@ -0,0 +1,162 @@
+import os
+import json
+
+import numpy as np
+
+from services.common.flat_index import NumpyFlatIndex, _normalize_rows
+
+
+def train_centroids(vectors, n_lists, iterations=10, seed=0):
+    """Spherical k-means: n_lists unit centroids for L2-normalized vectors."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_lists(vectors, centroids)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=n_lists)
+        sums = np.zeros_like(centroids)
+        filled = counts > 0
+        sums[filled] = np.add.reduceat(vectors[order], np.concatenate([[0], np.cumsum(counts)[:-1]])[filled])
+        empty = ~filled
+        # Restart empty lists from random vectors instead of leaving dead centroids
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = _normalize_rows(sums)
+    return centroids.astype(np.float32)
+
+
+def assign_lists(vectors, centroids, chunk_rows=65536):
+    """Index of the nearest centroid of each vector, computed in chunks to bound memory."""
+    return np.concatenate([np.argmax(vectors[start:start + chunk_rows] @ centroids.T, axis=1)
+                           for start in range(0, len(vectors), chunk_rows)]).astype(np.int32)
+
+
+class NumpyIVFIndex(NumpyFlatIndex):
+    """Approximate NumpyFlatIndex: an inverted file (IVF) over k-means centroids.
+
+    Each row is assigned to its nearest of `n_lists` centroids; a search ranks
+    the centroids against the query and only scores the rows of the best
+    `nprobe` lists, so it touches about nprobe / n_lists of the vectors. Raising
+    nprobe trades speed for recall (nprobe = n_lists is exact search).
+
+    Centroids are trained at compaction once the index holds `min_train_rows`
+    rows per list, and retrained when it has grown `retrain_factor` times since.
+    Rows inserted in between are assigned to the existing centroids; until the
+    first training searches are exact. Centroids and assignments are stored per
+    snapshot generation (centroids-<gen>.npy, lists-<gen>.npy) and are
+    memory-mapped like the vectors, so they ship with the vector DB sync.
+    """
+    def __init__(self, embedding_function, folder, collection_name="summaries", compact_rows=4096,
+                 n_lists=0, nprobe=8, min_train_rows=39, retrain_factor=4.0, max_train_rows=262144):
+        """
+        :param n_lists: Number of inverted lists, 0 for about sqrt(rows) at training time.
+        :param nprobe: Lists scanned per search unless a search passes its own nprobe.
+        """
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.min_train_rows = min_train_rows
+        self.retrain_factor = retrain_factor
+        self.max_train_rows = max_train_rows
+        super().__init__(embedding_function, folder, collection_name, compact_rows)
+
+    # ---- per-row list assignments ------------------------------------------------
+
+    def _load_snapshot_extras(self):
+        self._centroids = None
+        self._trained_rows = 0
+        self._lists = np.zeros(self._size, dtype=np.int32)
+        self._list_order = None
+        centroids_path = self._path(f"centroids-{self._generation}.npy")
+        if os.path.exists(centroids_path):
+            self._centroids = np.load(centroids_path, mmap_mode='r')
+            self._lists = np.load(self._path(f"lists-{self._generation}.npy"), mmap_mode='r')
+            with open(self._path(f"ivf-{self._generation}.json"), 'r', encoding='utf-8') as f:
+                self._trained_rows = json.load(f)["trained_rows"]
+
+    def _append_rows(self, ids, texts, metadatas, vectors):
+        start = self._size
+        super()._append_rows(ids, texts, metadatas, vectors)
+        if isinstance(self._lists, np.memmap) or len(self._lists) < self._size:
+            lists = np.zeros(len(self._vectors), dtype=np.int32)
+            lists[:start] = self._lists[:start]
+            self._lists = lists
+        if self._centroids is not None:
+            self._lists[start:self._size] = assign_lists(np.asarray(vectors, dtype=np.float32), self._centroids)
+        self._list_order = None
+
+    def _save_snapshot_extras(self, generation, live):
+        if not len(live):
+            return
+        vectors = self._vectors[live]
+        if self._centroids is None or len(live) >= self.retrain_factor * self._trained_rows:
+            n_lists = self.n_lists or int(np.sqrt(len(live)))
+            if len(live) < n_lists * self.min_train_rows:
+                return
+            # k-means on about 64 rows per list is enough for good centroids and bounds the training cost
+            sample_rows = min(self.max_train_rows, 64 * n_lists)
+            sample = vectors
+            if len(live) > sample_rows:
+                sample = vectors[np.random.default_rng(0).choice(len(live), sample_rows, replace=False)]
+            centroids = train_centroids(np.asarray(sample), n_lists)
+            lists = assign_lists(vectors, centroids)
+            trained_rows = len(live)
+        else:
+            centroids, lists, trained_rows = self._centroids, self._lists[live], self._trained_rows
+        np.save(self._path(f"centroids-{generation}.npy"), np.ascontiguousarray(centroids, dtype=np.float32))
+        np.save(self._path(f"lists-{generation}.npy"), np.ascontiguousarray(lists, dtype=np.int32))
+        with open(self._path(f"ivf-{generation}.json"), 'w', encoding='utf-8') as f:
+            json.dump({"trained_rows": trained_rows, "n_lists": len(centroids)}, f)
+
+    def _snapshot_files(self, generation):
+        return super()._snapshot_files(generation) + [
+            f"centroids-{generation}.npy", f"lists-{generation}.npy", f"ivf-{generation}.json"]
+
+    def train(self):
+        """Train (or retrain) the centroids now by compacting into a new generation."""
+        with self._lock, self._file_lock():
+            self._refresh()
+            self._centroids = None
+            self._compact()
+
+    # ---- search ------------------------------------------------------------------
+
+    def _inverted_lists(self):
+        """Row numbers sorted by list, and the start offset of every list in that order."""
+        if self._list_order is None:
+            order = np.argsort(self._lists[:self._size], kind="stable")
+            starts = np.searchsorted(self._lists[:self._size][order], np.arange(len(self._centroids) + 1))
+            self._list_order = (order, starts)
+        return self._list_order
+
+    def _candidate_rows(self, query, mask, nprobe=None, **kwargs):
+        if self._centroids is None:
+            return super()._candidate_rows(query, mask)
+        nprobe = min(nprobe or self.nprobe, len(self._centroids))
+        if nprobe >= len(self._centroids):
+            return super()._candidate_rows(query, mask)
+        probed = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+        order, starts = self._inverted_lists()
+        rows = np.concatenate([order[starts[probe]:starts[probe + 1]] for probe in probed])
+        return np.sort(rows[mask[rows]])
+
+    def similarity_search_by_vectors_with_scores(self, embeddings, k=4, filter=None, **kwargs):
+        # Every query probes its own lists, so the batch is searched one query at a time
+        return [self.similarity_search_by_vector_with_scores(embedding, k=k, filter=filter, **kwargs)
+                for embedding in embeddings]
+
+    def stats(self):
+        """Return the size of the index and of its inverted lists."""
+        with self._lock:
+            self._refresh()
+            if self._centroids is None:
+                return {"rows": len(self._row_of), "trained": False}
+            _, starts = self._inverted_lists()
+            sizes = np.diff(starts)
+            return {
+                "rows": len(self._row_of),
+                "trained": True,
+                "n_lists": len(self._centroids),
+                "nprobe": self.nprobe,
+                "trained_rows": self._trained_rows,
+                "max_list_size": int(sizes.max()),
+                "mean_list_size": round(float(sizes.mean()), 1),
+            }
@@ -0,0 +1,189 @@
+import os
+import re
+import math
+import sqlite3
+import threading
+from collections import Counter
+
+# Words, plus compound tokens such as part numbers and error codes ("AB-1234", "0x80070005", "v2.1")
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./:]\w+)*")
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    """Lower-cased terms of text; compound tokens are kept whole and also split into their parts."""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        if not token.isalnum():
+            terms.extend(part for part in re.split(r"[-./:_]", token) if part)
+    return terms
+
+
+def iter_terms(segments):
+    """Tokenize a stream of text segments without cutting a token at a segment boundary."""
+    carry = ""
+    for segment in segments:
+        text = carry + segment
+        cut = max(text.rfind(" "), text.rfind("\n"))
+        if cut < 0:
+            carry = text
+            continue
+        carry = text[cut:]
+        yield from tokenize(text[:cut])
+    yield from tokenize(carry)
+
+
+class KeywordIndex:
+    """BM25 inverted index of document text, kept in keywords.sqlite3 next to documents.sqlite3.
+
+    `terms` maps each term to an integer id and its document frequency,
+    `postings` holds (term_id, doc_id, tf) clustered by term so a query reads
+    only the postings of its own terms, and `documents` holds each document's
+    length for the BM25 length normalization. Like the document registry, the
+    database runs in WAL mode and ships with the vector DB sync.
+    """
+    FILE_NAME = "keywords.sqlite3"
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, local_folder):
+        self.local_folder = local_folder
+        self.path = os.path.join(local_folder, self.FILE_NAME)
+        self._lock = threading.Lock()
+        os.makedirs(local_folder, exist_ok=True)
+        self._connect()
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS terms (term_id INTEGER PRIMARY KEY, term TEXT UNIQUE NOT NULL, df INTEGER NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS postings (term_id INTEGER NOT NULL, doc_id TEXT NOT NULL, tf INTEGER NOT NULL, "
+            "PRIMARY KEY (term_id, doc_id)) WITHOUT ROWID"
+        )
+        self.connection.execute("CREATE TABLE IF NOT EXISTS documents (doc_id TEXT PRIMARY KEY, length INTEGER NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_postings_doc_id ON postings(doc_id)")
+        self.connection.commit()
+
+    def _connect(self):
+        self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+    @classmethod
+    def for_folder(cls, local_folder):
+        """Return the index shared by everything using local_folder in this process."""
+        key = os.path.abspath(local_folder)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(local_folder)
+            return cls._instances[key]
+
+    def add_document(self, doc_id, segments):
+        """Index the text of doc_id (a string or a stream of text segments), replacing what was indexed before.
+
+        :return: Number of terms in the document.
+        """
+        if isinstance(segments, str):
+            segments = [segments]
+        counts = Counter(iter_terms(segments))
+        length = sum(counts.values())
+        with self._lock:
+            try:
+                self._remove(doc_id)
+                self.connection.executemany(
+                    "INSERT INTO terms (term, df) VALUES (?, 1) ON CONFLICT(term) DO UPDATE SET df = df + 1",
+                    ((term,) for term in counts)
+                )
+                term_ids = self._term_ids(counts)
+                self.connection.executemany(
+                    "INSERT INTO postings (term_id, doc_id, tf) VALUES (?, ?, ?)",
+                    ((term_ids[term], doc_id, tf) for term, tf in counts.items())
+                )
+                self.connection.execute("INSERT INTO documents (doc_id, length) VALUES (?, ?)", (doc_id, length))
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+        return length
+
+    def remove(self, doc_id):
+        """Drop doc_id from the index; return True if it was indexed."""
+        with self._lock:
+            removed = self._remove(doc_id)
+            self.connection.commit()
+        return removed
+
+    def _remove(self, doc_id):
+        if self.connection.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,)).rowcount == 0:
+            return False
+        self.connection.execute(
+            "UPDATE terms SET df = df - 1 WHERE term_id IN (SELECT term_id FROM postings WHERE doc_id = ?)", (doc_id,)
+        )
+        self.connection.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+        self.connection.execute("DELETE FROM terms WHERE df <= 0")
+        return True
+
+    def _term_ids(self, terms):
+        terms = list(terms)
+        term_ids = {}
+        # Stay below SQLite's limit on bound parameters
+        for start in range(0, len(terms), 500):
+            batch = terms[start:start + 500]
+            rows = self.connection.execute(
+                f"SELECT term, term_id FROM terms WHERE term IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            term_ids.update(rows)
+        return term_ids
+
+    def search(self, query, k=10, doc_ids=None):
+        """Return up to k (doc_id, BM25 score) pairs for query, best first.
+
+        :param doc_ids: Optional doc_ids to restrict the search to.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or k <= 0:
+            return []
+        with self._lock:
+            documents, total_length = self.connection.execute("SELECT COUNT(*), SUM(length) FROM documents").fetchone()
+            if not documents:
+                return []
+            sql = ("SELECT t.df, p.doc_id, p.tf, d.length FROM terms t JOIN postings p ON p.term_id = t.term_id "
+                   f"JOIN documents d ON d.doc_id = p.doc_id WHERE t.term IN ({','.join('?' * len(terms))})")
+            params = list(terms)
+            if doc_ids is not None:
+                doc_ids = list(doc_ids)
+                if not doc_ids:
+                    return []
+                sql += f" AND p.doc_id IN ({','.join('?' * len(doc_ids))})"
+                params += doc_ids
+            rows = self.connection.execute(sql, params).fetchall()
+        average_length = total_length / documents
+        scores = Counter()
+        for df, doc_id, tf, length in rows:
+            idf = math.log(1 + (documents - df + 0.5) / (df + 0.5))
+            scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length))
+        return scores.most_common(k)
+
+    def __contains__(self, doc_id):
+        with self._lock:
+            return self.connection.execute("SELECT 1 FROM documents WHERE doc_id = ?", (doc_id,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def reopen(self):
+        """Reconnect after keywords.sqlite3 was replaced on disk (e.g. restored from S3)."""
+        with self._lock:
+            self.connection.close()
+            self._connect()
+
+    def checkpoint(self):
+        """Fold the WAL back into keywords.sqlite3 so the file can be copied on its own."""
+        with self._lock:
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
@@ -0,0 +1,64 @@
+import re
+import hashlib
+from functools import lru_cache
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+@lru_cache(maxsize=1 << 18)
+def _hash_feature(feature):
+    """Return the stable 64-bit hash of a feature; Python's hash() is salted per process."""
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class HashingEmbeddings(Embeddings):
+    """Local embeddings built by feature hashing, with no model download or network call.
+
+    Lower-cased word n-grams are hashed into `dim` signed buckets, counts are
+    dampened with log1p and each vector is L2-normalized, so cosine similarity
+    measures lexical overlap. Vectors are deterministic across processes and
+    machines, which makes the whole index/retrieve flow reproducible offline.
+    Texts are embedded `batch_size` at a time as one NumPy matrix.
+    """
+    def __init__(self, dim=384, ngram_range=(1, 2), batch_size=256):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.batch_size = batch_size
+        self.model = f"hashing-{dim}-{ngram_range[0]}{ngram_range[1]}"
+
+    def _features(self, text):
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(tokens) - n + 1):
+                yield " ".join(tokens[i:i + n])
+
+    def _embed_batch(self, texts):
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            features = [_hash_feature(feature) for feature in self._features(text)]
+            rows.extend([row] * len(features))
+            hashes.extend(features)
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        buckets = (hashes % np.uint64(self.dim)).astype(np.int64)
+        signs = np.where((hashes >> np.uint64(63)) == 0, 1.0, -1.0)
+        flat = np.bincount(np.asarray(rows, dtype=np.int64) * self.dim + buckets,
+                           weights=signs, minlength=len(texts) * self.dim)
+        matrix = flat.reshape(len(texts), self.dim)
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix.astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._embed_batch(texts[start:start + self.batch_size]).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([text])[0].tolist()
@@ -0,0 +1,28 @@
+import re
+import hashlib
+
+from services.common.config import PARTITION_BY, DEFAULT_WORKSPACE
+
+# Chroma collection names: 3-63 characters of [A-Za-z0-9._-], starting and ending with a letter or digit
+_UNSAFE_CHARACTERS = re.compile(r"[^A-Za-z0-9_-]")
+
+
+def resolve_workspace(workspace=None):
+    """Workspace whose partition a document or search belongs to; None when the index is not partitioned."""
+    if PARTITION_BY != "workspace":
+        return None
+    return workspace or DEFAULT_WORKSPACE
+
+
+def partition_name(collection_name, workspace=None):
+    """Name of the collection holding collection_name's vectors of workspace (collection_name itself for None).
+
+    Workspace ids that are not safe collection names, or too long, get a short hash suffix
+    so two different ids never share a partition.
+    """
+    if workspace is None:
+        return collection_name
+    slug = _UNSAFE_CHARACTERS.sub("_", workspace)[:40]
+    if slug != workspace or not slug[-1:].isalnum():
+        slug = f"{slug}_{hashlib.sha256(workspace.encode('utf-8')).hexdigest()[:8]}"
+    return f"{collection_name}--{slug}"
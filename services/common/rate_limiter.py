@@ -0,0 +1,315 @@
+import time
+import random
+import logging
+import threading
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+# Priority classes, lower runs first: live queries are never queued behind bulk ingestion
+INTERACTIVE = 0
+BULK = 1
+
+
+class RateLimited(Exception):
+    """Raised when a call is still throttled after every retry."""
+
+
+class TokenBucket:
+    """Budget refilled continuously at `per_minute` units per minute, holding at most `capacity`."""
+    def __init__(self, per_minute, capacity=None, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity or per_minute)
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, floor=0.0):
+        """Seconds until amount can be taken while leaving at least floor in the bucket.
+
+        Requests larger than the capacity are let through once the bucket is full.
+        """
+        self.refill()
+        needed = min(amount + floor, self.capacity) - self.level
+        return max(0.0, needed / self.rate) if self.rate > 0 else (0.0 if needed <= 0 else float("inf"))
+
+    def take(self, amount):
+        self.level -= amount
+
+    def give_back(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class AIMDLimiter:
+    """Concurrency limit with additive increase / multiplicative decrease.
+
+    Every successful call that finishes under latency_target raises the limit by
+    1/limit (about +1 per round of calls); a 429 or a slow call multiplies it by
+    `decrease`, at most once per `cooldown` seconds so one burst of errors counts
+    as a single congestion signal.
+    """
+    def __init__(self, initial=4, minimum=1, maximum=32, decrease=0.5, latency_target=30.0, cooldown=5.0,
+                 clock=time.monotonic):
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.clock = clock
+        self._last_decrease = None
+
+    def on_success(self, latency):
+        if self.latency_target and latency > self.latency_target:
+            self.on_congestion()
+        else:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_congestion(self):
+        now = self.clock()
+        if self._last_decrease is None or now - self._last_decrease >= self.cooldown:
+            self.limit = max(self.minimum, self.limit * self.decrease)
+            self._last_decrease = now
+
+    @property
+    def current(self):
+        return int(self.limit)
+
+
+class RateScheduler:
+    """Client-side scheduler for the calls made to one model.
+
+    A call needs one request from the requests-per-minute bucket, its estimated
+    tokens from the tokens-per-minute bucket and a free slot under the AIMD
+    concurrency limit. Waiting interactive calls always go first. While
+    interactive traffic was seen in the last `reserve_window` seconds, bulk calls
+    also leave `interactive_reserve` of both budgets and one concurrency slot
+    untouched, so ingestion runs at the full quota when no one is querying and
+    backs off just enough when someone is.
+
+    429 responses shrink the concurrency limit, pause the whole scheduler for the
+    server's retry-after (or an exponential backoff) and the call is retried.
+    Server errors, timeouts and dropped connections are retried by the call alone
+    after an exponential backoff, without touching the limit or the other calls.
+    """
+    def __init__(self, name, rpm, tpm, max_concurrency=16, initial_concurrency=4, latency_target=30.0,
+                 interactive_reserve=0.1, reserve_window=60.0, max_retries=6, backoff_base=1.0, backoff_max=60.0,
+                 clock=time.monotonic):
+        self.name = name
+        self.requests = TokenBucket(rpm, clock=clock)
+        self.tokens = TokenBucket(tpm, clock=clock)
+        self.concurrency = AIMDLimiter(initial_concurrency, maximum=max_concurrency,
+                                       latency_target=latency_target, clock=clock)
+        self.interactive_reserve = interactive_reserve
+        self.reserve_window = reserve_window
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.clock = clock
+        self.in_flight = 0
+        self.throttled = 0
+        self.completed = 0
+        self.retried = 0
+        self._waiting = {INTERACTIVE: 0, BULK: 0}
+        self._paused_until = 0.0
+        self._last_interactive = None
+        self._condition = threading.Condition()
+
+    def _reserving(self, priority):
+        return (priority == BULK and self._last_interactive is not None
+                and self.clock() - self._last_interactive < self.reserve_window)
+
+    def _wait_time(self, tokens, priority):
+        """Seconds to wait before the call may start (0 if it may start now), None to wait for a release."""
+        now = self.clock()
+        if self._paused_until > now:
+            return self._paused_until - now
+        if priority == BULK and self._waiting[INTERACTIVE]:
+            return None
+        reserving = self._reserving(priority)
+        limit = self.concurrency.current - (1 if reserving and self.concurrency.current > 1 else 0)
+        if self.in_flight >= limit:
+            return None
+        request_floor = self.requests.capacity * self.interactive_reserve if reserving else 0.0
+        token_floor = self.tokens.capacity * self.interactive_reserve if reserving else 0.0
+        return max(self.requests.wait_time(1, request_floor), self.tokens.wait_time(tokens, token_floor))
+
+    def acquire(self, tokens, priority=BULK):
+        """Block until a call estimated at `tokens` tokens may start."""
+        with self._condition:
+            if priority == INTERACTIVE:
+                self._last_interactive = self.clock()
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    wait = self._wait_time(tokens, priority)
+                    if wait == 0:
+                        break
+                    # Releases notify waiters; timed waits cover budget refills
+                    self._condition.wait(timeout=1.0 if wait is None else min(wait, 1.0))
+            finally:
+                self._waiting[priority] -= 1
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.in_flight += 1
+
+    def release(self, latency=None, throttled=False, retry_after=None, reserved_tokens=0, used_tokens=None):
+        """Return the slot of a finished call and feed its outcome to the concurrency limit.
+
+        :param used_tokens: Actual token usage; the difference to reserved_tokens is
+                            given back to (or taken from) the tokens budget.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if used_tokens is not None:
+                self.tokens.give_back(reserved_tokens - used_tokens)
+            if throttled:
+                self.throttled += 1
+                self.concurrency.on_congestion()
+                if retry_after:
+                    self._paused_until = max(self._paused_until, self.clock() + retry_after)
+            elif latency is not None:
+                self.completed += 1
+                self.concurrency.on_success(latency)
+            self._condition.notify_all()
+
+    def call(self, fn, tokens=1, priority=BULK, usage=None):
+        """Run fn() under the budget, retrying when it is rate limited or fails transiently.
+
+        :param tokens: Estimated tokens of the call (prompt plus expected output).
+        :param usage: Optional callable returning the actual tokens used from fn's result.
+        :raises RateLimited: If fn is still rate limited after max_retries retries.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(tokens, priority)
+            start = self.clock()
+            try:
+                result = fn()
+            except Exception as e:
+                if is_transient_error(e) and attempt < self.max_retries:
+                    # Not a congestion signal: only this call backs off, the limit and the budgets stay as they are
+                    self.release()
+                    with self._condition:
+                        self.retried += 1
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * (1 + random.random() * 0.1)
+                    logging.warning(f"{self.name} call failed ({type(e).__name__}), retrying in {delay:.1f}s "
+                                    f"(attempt {attempt + 1})")
+                    time.sleep(delay)
+                    continue
+                if not is_rate_limit_error(e):
+                    self.release()
+                    raise
+                delay = retry_after(e) or min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                delay *= 1 + random.random() * 0.1
+                self.release(throttled=True, retry_after=delay)
+                logging.warning(f"{self.name} rate limited, retrying in {delay:.1f}s (attempt {attempt + 1})")
+                continue
+            used = usage(result) if usage else None
+            self.release(latency=self.clock() - start, reserved_tokens=tokens, used_tokens=used)
+            return result
+        raise RateLimited(f"{self.name} is still rate limited after {self.max_retries} retries")
+
+    def stats(self):
+        """Return the current limit, load and budget levels."""
+        with self._condition:
+            self.requests.refill()
+            self.tokens.refill()
+            return {
+                "concurrency_limit": self.concurrency.current,
+                "in_flight": self.in_flight,
+                "waiting_interactive": self._waiting[INTERACTIVE],
+                "waiting_bulk": self._waiting[BULK],
+                "requests_available": round(self.requests.level, 1),
+                "tokens_available": round(self.tokens.level),
+                "completed": self.completed,
+                "throttled": self.throttled,
+                "retried": self.retried,
+            }
+
+
+def is_rate_limit_error(error):
+    """Return True if error is an HTTP 429 from the OpenAI client (or anything carrying that status)."""
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+# Errors the OpenAI client itself would retry: timeouts and dropped connections (openai or httpx)
+TRANSIENT_ERRORS = {"APIConnectionError", "APITimeoutError", "TimeoutException", "NetworkError"}
+
+
+def is_transient_error(error):
+    """Return True if error is a 5xx, 408 or 409 response, a timeout or a dropped connection."""
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status >= 500 or status in (408, 409)
+    return (isinstance(error, (ConnectionError, TimeoutError))
+            or any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__))
+
+
+def retry_after(error):
+    """Return the retry delay in seconds the server sent with error, or None."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class ScheduledEmbeddings(Embeddings):
+    """Embeddings whose API calls go through a RateScheduler.
+
+    Document lists are packed into requests of at most `batch_size` texts and
+    `batch_tokens` estimated tokens, which run concurrently under the scheduler
+    as bulk work; queries run as interactive work.
+    """
+    def __init__(self, underlying: Embeddings, scheduler: RateScheduler, batch_size=512, batch_tokens=100_000,
+                 count_tokens=None):
+        self.underlying = underlying
+        self.scheduler = scheduler
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+        self.count_tokens = count_tokens or (lambda text: len(text) // 4 + 1)
+        self.model = getattr(underlying, "model", type(underlying).__name__)
+
+    def batches(self, texts):
+        """Pack texts into consecutive (texts, estimated tokens) batches."""
+        batch, batch_tokens = [], 0
+        for text in texts:
+            tokens = self.count_tokens(text)
+            if batch and (len(batch) >= self.batch_size or batch_tokens + tokens > self.batch_tokens):
+                yield batch, batch_tokens
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            yield batch, batch_tokens
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        batches = list(self.batches(texts))
+        if len(batches) <= 1:
+            return [vector for batch, tokens in batches for vector in self._embed(batch, tokens)]
+        with ThreadPoolExecutor(max_workers=min(len(batches), self.scheduler.concurrency.maximum)) as executor:
+            results = executor.map(lambda item: self._embed(*item), batches)
+            return [vector for vectors in results for vector in vectors]
+
+    def _embed(self, batch, tokens):
+        return self.scheduler.call(lambda: self.underlying.embed_documents(batch), tokens=tokens, priority=BULK)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.scheduler.call(lambda: self.underlying.embed_query(text),
+                                   tokens=self.count_tokens(text), priority=INTERACTIVE)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries in as few requests as possible, as interactive work."""
+        return [vector for batch, tokens in self.batches(texts)
+                for vector in self.scheduler.call(lambda: self.underlying.embed_documents(batch),
+                                                  tokens=tokens, priority=INTERACTIVE)]
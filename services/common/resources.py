@@ -0,0 +1,215 @@
+import os
+import atexit
+import logging
+import threading
+
+import redis
+
+from services.common.config import (
+    LOCAL_FOLDER, REDIS_HOST, REDIS_PORT, SCHEDULER_MAX_CONCURRENCY, SCHEDULER_LATENCY_TARGET,
+    SCHEDULER_INTERACTIVE_RESERVE, SCHEDULER_MAX_RETRIES, QUERY_CACHE_SIZE, QUERY_CACHE_TTL_SECONDS,
+    QUERY_CACHE_REDIS, QUERY_CACHE_REDIS_TTL_SECONDS, RESULT_CACHE_THRESHOLD, RESULT_CACHE_SIZE,
+    RESULT_CACHE_TTL_SECONDS, VECTOR_BACKEND, FLAT_INDEX_COMPACT_ROWS,
+    IVF_LISTS, IVF_NPROBE, SEARCH_WORKERS, DOCUMENT_CACHE_FOLDER, DOCUMENT_CACHE_MAX_BYTES,
+    DOCUMENT_CACHE_REVALIDATE_SECONDS
+)
+from services.common.embeddings import build_embeddings, close_embeddings
+from services.common.rate_limiter import RateScheduler
+
+
+class ResourceRegistry:
+    """Process-wide registry of long-lived client handles.
+
+    Each handle is created on first use by its factory, shared by every caller
+    asking for the same key, and closed in reverse creation order by `close`,
+    which runs at interpreter exit.
+    """
+    def __init__(self):
+        self._resources = {}
+        self._closers = []
+        self._lock = threading.RLock()
+
+    def get(self, key, factory, close=None):
+        """Return the handle stored under key, creating it with factory() if needed.
+
+        :param close: Optional callable receiving the handle at shutdown.
+        """
+        resource = self._resources.get(key)
+        if resource is not None:
+            return resource
+        with self._lock:
+            if key not in self._resources:
+                resource = factory()
+                self._resources[key] = resource
+                if close is not None:
+                    self._closers.append((key, close))
+            return self._resources[key]
+
+    def discard(self, predicate):
+        """Close and forget the handles whose key matches predicate; they are recreated on next use."""
+        with self._lock:
+            for key in [key for key in self._resources if predicate(key)]:
+                close = next((close for closer_key, close in self._closers if closer_key == key), None)
+                self._closers = [(closer_key, c) for closer_key, c in self._closers if closer_key != key]
+                resource = self._resources.pop(key)
+                if close is not None:
+                    close(resource)
+
+    def close(self):
+        """Close every handle and forget them, so later calls create fresh ones."""
+        with self._lock:
+            closers, self._closers = self._closers, []
+            for key, close in reversed(closers):
+                try:
+                    close(self._resources[key])
+                except Exception as e:
+                    logging.error(f"Error closing {key}: {e}")
+            self._resources.clear()
+
+
+registry = ResourceRegistry()
+atexit.register(registry.close)
+
+
+def get_embeddings():
+    """Return the shared embeddings used for both indexing and retrieval."""
+    return registry.get("embeddings", build_embeddings, close=close_embeddings)
+
+
+def open_collection(collection_name, local_folder, embeddings, backend=VECTOR_BACKEND):
+    """Open a vector store collection of the configured backend ("chroma", "numpy" or "ivf")."""
+    if backend == "ivf":
+        from services.common.ivf_index import NumpyIVFIndex
+        return NumpyIVFIndex(
+            embeddings,
+            os.path.join(local_folder, "flat_index", collection_name),
+            collection_name=collection_name,
+            compact_rows=FLAT_INDEX_COMPACT_ROWS,
+            n_lists=IVF_LISTS,
+            nprobe=IVF_NPROBE
+        )
+    if backend == "numpy":
+        from services.common.flat_index import NumpyFlatIndex
+        return NumpyFlatIndex(
+            embeddings,
+            os.path.join(local_folder, "flat_index", collection_name),
+            collection_name=collection_name,
+            compact_rows=FLAT_INDEX_COMPACT_ROWS
+        )
+    if backend == "chroma":
+        from langchain_chroma import Chroma  # chromadb is only loaded by processes that open a collection
+        return Chroma(
+            collection_name=collection_name,
+            embedding_function=embeddings,
+            persist_directory=local_folder
+        )
+    raise ValueError(f"Unknown VECTOR_BACKEND: {backend}")
+
+
+def get_vectorstore(collection_name="summaries", local_folder=LOCAL_FOLDER, embeddings=None):
+    """Return the shared collection for (collection_name, local_folder) of the configured backend.
+
+    Callers passing their own embeddings get a collection bound to those embeddings.
+    """
+    embeddings = embeddings or get_embeddings()
+    key = ("vectorstore", VECTOR_BACKEND, collection_name, os.path.abspath(local_folder), id(embeddings))
+    return registry.get(key, lambda: open_collection(collection_name, local_folder, embeddings))
+
+
+def release_vectorstores():
+    """Drop every shared vector store handle, e.g. after the files below them were replaced on disk.
+
+    Chroma keeps one system per persist directory for the whole process, so that
+    cache is cleared as well and the next call reopens the files. The handles are
+    forgotten, not closed: searches still running on them finish on the old
+    system. Both happen under the registry lock, so no handle is being opened
+    while the system cache is cleared.
+    """
+    with registry._lock:
+        registry.discard(lambda key: isinstance(key, tuple) and key[0] == "vectorstore")
+        if VECTOR_BACKEND == "chroma":
+            from chromadb.api.shared_system_client import SharedSystemClient
+            SharedSystemClient.clear_system_cache()
+
+
+def get_redis_client():
+    """Return the shared Redis client; commands are served from its thread-safe connection pool."""
+    return registry.get(
+        "redis",
+        lambda: redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True),
+        close=lambda client: client.close()
+    )
+
+
+def open_async_redis_client():
+    """Open a redis.asyncio client for the running event loop.
+
+    Its connections belong to the event loop they were opened on, so it is not
+    shared through the registry; close it with `await client.aclose()`.
+    """
+    import redis.asyncio
+    return redis.asyncio.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
+
+
+def get_s3_handler():
+    """Return the shared S3Handler; boto3 clients are safe to use from several threads."""
+    from services.common.AWS_handler import S3Handler
+    return registry.get("s3", S3Handler, close=lambda handler: handler.s3.close())
+
+
+def get_document_cache(folder_prefix="files"):
+    """Return the shared DocumentCache of the documents fetched from S3 folder_prefix.
+
+    Original files are cached in DOCUMENT_CACHE_FOLDER, other folders in a subfolder of it.
+    """
+    from services.retrieval.document_cache import DocumentCache
+    folder = DOCUMENT_CACHE_FOLDER if folder_prefix == "files" else os.path.join(DOCUMENT_CACHE_FOLDER, folder_prefix)
+    return registry.get(("document_cache", folder_prefix), lambda: DocumentCache(
+        folder,
+        get_s3_handler(),
+        max_bytes=DOCUMENT_CACHE_MAX_BYTES,
+        revalidate_seconds=DOCUMENT_CACHE_REVALIDATE_SECONDS,
+        folder_prefix=folder_prefix
+    ), close=lambda cache: cache.close())
+
+
+def get_scheduler(model_name, rpm, tpm):
+    """Return the shared RateScheduler for model_name, so every caller draws from one budget."""
+    return registry.get(("scheduler", model_name), lambda: RateScheduler(
+        model_name, rpm, tpm,
+        max_concurrency=SCHEDULER_MAX_CONCURRENCY,
+        latency_target=SCHEDULER_LATENCY_TARGET,
+        interactive_reserve=SCHEDULER_INTERACTIVE_RESERVE,
+        max_retries=SCHEDULER_MAX_RETRIES
+    ))
+
+
+def get_query_cache(embeddings=None):
+    """Return the shared QueryVectorCache in front of embeddings (the shared embeddings by default)."""
+    from services.retrieval.query_cache import QueryVectorCache
+    embeddings = embeddings or get_embeddings()
+    return registry.get(("query_cache", id(embeddings)), lambda: QueryVectorCache(
+        embeddings,
+        max_entries=QUERY_CACHE_SIZE,
+        ttl_seconds=QUERY_CACHE_TTL_SECONDS,
+        redis_client=get_redis_client() if QUERY_CACHE_REDIS else None,
+        redis_ttl_seconds=QUERY_CACHE_REDIS_TTL_SECONDS
+    ))
+
+
+def get_result_cache():
+    """Return the shared SemanticResultCache of retrieval results."""
+    from services.retrieval.result_cache import SemanticResultCache
+    return registry.get("result_cache", lambda: SemanticResultCache(
+        threshold=RESULT_CACHE_THRESHOLD,
+        max_entries=RESULT_CACHE_SIZE,
+        ttl_seconds=RESULT_CACHE_TTL_SECONDS
+    ))
+
+
+def get_search_pool():
+    """Return the shared thread pool that runs independent searches of one request concurrently."""
+    from concurrent.futures import ThreadPoolExecutor
+    return registry.get("search_pool", lambda: ThreadPoolExecutor(
+        max_workers=SEARCH_WORKERS, thread_name_prefix="search"
+    ), close=lambda pool: pool.shutdown(wait=False))
@@ -0,0 +1,65 @@
+import os
+import gzip
+
+# Extracted plain text of every document, LOCAL_FOLDER/texts/<doc_id>.txt.gz locally and
+# USER_NAME/texts/<doc_id>.txt.gz in S3
+TEXT_FOLDER = "texts"
+TEXT_SUFFIX = ".txt.gz"
+
+
+def text_path(local_folder, doc_id):
+    """Local path of the plain-text artifact of doc_id."""
+    return os.path.join(local_folder, TEXT_FOLDER, f"{doc_id}{TEXT_SUFFIX}")
+
+
+def load_text(path):
+    """Return the text of a plain-text artifact, or None if it does not exist."""
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def remove_text(local_folder, doc_id):
+    """Delete the local plain-text artifact of doc_id; return True if there was one."""
+    try:
+        os.remove(text_path(local_folder, doc_id))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+class TextArtifactWriter:
+    """Stream a document's extracted text into its gzipped plain-text artifact.
+
+    The text is written to a temporary file next to the artifact and renamed
+    into place on success, so readers never see a partial artifact. Characters
+    and tokens (counted per segment with `count_tokens`) are tallied on the way.
+    """
+    def __init__(self, local_folder, doc_id, count_tokens):
+        self.file_path = text_path(local_folder, doc_id)
+        self._tmp_path = f"{self.file_path}.tmp"
+        self.count_tokens = count_tokens
+        self.chars = 0
+        self.tokens = 0
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        # Level 6 compresses prose about 3x at a fraction of level 9's cost
+        self._file = gzip.open(self._tmp_path, 'wt', encoding='utf-8', compresslevel=6)
+        return self
+
+    def write(self, text):
+        self._file.write(text)
+        self.chars += len(text)
+        self.tokens += self.count_tokens(text)
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        if exc_type is None:
+            os.replace(self._tmp_path, self.file_path)
+        else:
+            os.remove(self._tmp_path)
+        return False
@@ -0,0 +1,398 @@
+import os
+import json
+import uuid
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+from services.common.resources import get_s3_handler, release_vectorstores
+from services.common.config import SYNC_BLOCK_SIZE, SYNC_MAX_WORKERS
+from services.common.document_registry import DocumentRegistry
+from services.common.helper import FileLock
+from services.common.keyword_index import KeywordIndex
+
+# Top-level files that make up the vector DB; Chroma segment folders and the doc store are added to these
+SYNC_FILES = ("chroma.sqlite3", DocumentRegistry.FILE_NAME, KeywordIndex.FILE_NAME)
+MANIFEST_NAME = "manifest.json"
+STATE_FILE_NAME = ".sync_state.json"
+STAGING_FOLDER_NAME = ".sync_blocks"
+SHADOW_FOLDER_NAME = ".sync_shadow"
+LOCK_FILE_NAME = ".sync.lock"
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+
+def _is_uuid(name):
+    try:
+        uuid.UUID(name)
+        return True
+    except ValueError:
+        return False
+
+
+def _is_sqlite(path):
+    """Return True if path is a SQLite database file."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    except FileNotFoundError:
+        return False
+
+
+def _backup(source_path, target_path):
+    """Copy a SQLite database page by page under SQLite's locks, so neither side needs to be idle."""
+    source, target = sqlite3.connect(source_path, timeout=30), sqlite3.connect(target_path, timeout=30)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+class VectorDBSync:
+    """Incremental sync of the local vector DB folder with S3.
+
+    Every synced file is cut into fixed-size blocks stored once under
+    vectorized_db/blocks/<sha256>, and vectorized_db/manifest.json lists the blocks
+    of each file. A push only uploads blocks the manifest does not reference yet,
+    so the cost of a sync follows the size of the change: an insert into a
+    multi-GB chroma.sqlite3 touches a few blocks, not the whole file. A pull reuses
+    matching blocks already on disk and downloads the rest in parallel.
+
+    File sizes, mtimes and block hashes of the last sync are cached in
+    .sync_state.json, so unchanged files are not read again. Pushes and pulls of
+    one folder are serialized across processes by a lock on .sync.lock, since
+    every ingestion worker pushes after its jobs.
+
+    SQLite files are hashed from a snapshot made with the SQLite backup API, so a
+    write by another process (Chroma keeps a rollback journal and is not
+    checkpointed like the registries) cannot tear it. The snapshot of the last
+    sync is kept in .sync_shadow; blocks that match it byte for byte reuse its
+    hashes, so only the pages written since are hashed again. A pull restores
+    SQLite files through the backup API as well, which leaves the connections
+    other processes hold on them valid.
+    """
+    _locks = {}
+    _locks_lock = threading.Lock()
+
+    def __init__(self, local_folder, s3_handler=None, folder_prefix="vectorized_db",
+                 block_size=SYNC_BLOCK_SIZE, max_workers=SYNC_MAX_WORKERS):
+        self.local_folder = local_folder
+        self.s3_handler = s3_handler or get_s3_handler()
+        self.folder_prefix = folder_prefix
+        self.blocks_prefix = f"{folder_prefix}/blocks"
+        self.block_size = block_size
+        self.max_workers = max_workers
+        self.state_path = os.path.join(local_folder, STATE_FILE_NAME)
+        self.lock_path = os.path.join(local_folder, LOCK_FILE_NAME)
+        self.shadow_folder = os.path.join(local_folder, SHADOW_FOLDER_NAME)
+        with self._locks_lock:
+            self._lock = self._locks.setdefault(os.path.abspath(local_folder), threading.Lock())
+
+    def tracked_files(self):
+        """Return the vector DB files below local_folder as relative POSIX paths."""
+        tracked = [name for name in SYNC_FILES if os.path.isfile(os.path.join(self.local_folder, name))]
+        if not os.path.isdir(self.local_folder):
+            return tracked
+        for entry in sorted(os.scandir(self.local_folder), key=lambda entry: entry.name):
+            if not entry.is_dir() or not (entry.name in ("docstore", "flat_index") or _is_uuid(entry.name)):
+                continue
+            for root, _, files in os.walk(entry.path):
+                for file in sorted(files):
+                    if not file.endswith((".tmp", ".sync_tmp")):
+                        tracked.append(os.path.relpath(os.path.join(root, file), self.local_folder).replace(os.sep, "/"))
+        return tracked
+
+    def load_remote_manifest(self):
+        """Return the manifest stored in S3, or None if nothing was pushed yet."""
+        data = self.s3_handler.download_bytes(self.folder_prefix, MANIFEST_NAME)
+        return json.loads(data) if data else None
+
+    def push(self):
+        """Upload the blocks that changed since the last push, then the new manifest.
+
+        :return: Counters of files scanned and blocks/bytes uploaded or pruned.
+        """
+        os.makedirs(self.local_folder, exist_ok=True)
+        with self._lock, FileLock(self.lock_path):
+            DocumentRegistry.for_folder(self.local_folder).checkpoint()
+            if os.path.exists(os.path.join(self.local_folder, KeywordIndex.FILE_NAME)):
+                KeywordIndex.for_folder(self.local_folder).checkpoint()
+            remote = self.load_remote_manifest() or {"files": {}}
+            remote_blocks = {digest for entry in remote["files"].values() for digest in entry["blocks"]}
+            state = self._load_state()
+            stats = {"files": 0, "changed_files": 0, "blocks_uploaded": 0, "bytes_uploaded": 0, "blocks_pruned": 0}
+            files = {}
+            queued = set()
+            snapshots = {}  # rel_path -> snapshot that becomes the shadow once the manifest is uploaded
+
+            try:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    in_flight = deque()
+
+                    def upload(digest, data):
+                        if digest in remote_blocks or digest in queued:
+                            return
+                        queued.add(digest)
+                        # Keep at most 2 * max_workers blocks in memory
+                        if len(in_flight) >= 2 * self.max_workers:
+                            in_flight.popleft().result()
+                        in_flight.append(executor.submit(self._upload_block, digest, data))
+                        stats["blocks_uploaded"] += 1
+                        stats["bytes_uploaded"] += len(data)
+
+                    for rel_path in self.tracked_files():
+                        stats["files"] += 1
+                        path = os.path.join(self.local_folder, rel_path)
+                        cached = self._cached_entry(state, rel_path, path)
+                        if cached and remote_blocks.issuperset(cached["blocks"]):
+                            files[rel_path] = cached
+                            continue
+
+                        stat = os.stat(path)
+                        if _is_sqlite(path):
+                            snapshots[rel_path] = self._snapshot(path)
+                            shadow_path = self._valid_shadow(state, rel_path)
+                            previous = state[rel_path]["blocks"] if shadow_path else []
+                            blocks, size = self._scan_blocks(snapshots[rel_path], upload, shadow_path, previous)
+                        else:
+                            blocks, size = self._scan_blocks(path, upload)
+                        # A SQLite snapshot can differ in size from the file it was taken of, which the cache is checked against
+                        files[rel_path] = {"size": size, "source_size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                           "blocks": blocks}
+                        if remote["files"].get(rel_path, {}).get("blocks") != blocks:
+                            stats["changed_files"] += 1
+                    while in_flight:
+                        in_flight.popleft().result()
+
+                manifest = {
+                    "version": 1,
+                    "block_size": self.block_size,
+                    "files": {rel_path: {"size": entry["size"], "blocks": entry["blocks"]}
+                              for rel_path, entry in files.items()},
+                }
+                if manifest["files"] != remote["files"]:
+                    if not self.s3_handler.upload_bytes(json.dumps(manifest).encode('utf-8'), self.folder_prefix,
+                                                        MANIFEST_NAME):
+                        raise RuntimeError("Upload of the vector DB manifest failed.")
+                    # Blocks are only dropped once the manifest that no longer needs them is in place
+                    stale = remote_blocks - {digest for entry in files.values() for digest in entry["blocks"]}
+                    if stale and self.s3_handler.delete_objects(self.blocks_prefix, stale):
+                        stats["blocks_pruned"] = len(stale)
+                for rel_path, snapshot_path in list(snapshots.items()):
+                    files[rel_path]["shadow_mtime_ns"] = self._keep_shadow(rel_path, snapshot_path)
+                    del snapshots[rel_path]
+            finally:
+                for snapshot_path in snapshots.values():
+                    os.remove(snapshot_path)
+            self._drop_shadows(set(state) - set(files))
+            self._save_state(files)
+            return stats
+
+    def pull(self):
+        """Restore local_folder from the manifest, downloading missing blocks in parallel.
+
+        :return: Counters of files restored and blocks/bytes downloaded, or None if
+                 there is no manifest in S3.
+        """
+        os.makedirs(self.local_folder, exist_ok=True)
+        with self._lock, FileLock(self.lock_path):
+            manifest = self.load_remote_manifest()
+            if manifest is None:
+                return None
+            self.block_size = block_size = manifest["block_size"]
+            state = self._load_state()
+            stats = {"files": len(manifest["files"]), "changed_files": 0, "blocks_downloaded": 0,
+                     "bytes_downloaded": 0, "files_removed": 0}
+
+            # Index the blocks already on disk so they are copied locally instead of downloaded
+            local_blocks, sources = {}, {}
+            for rel_path in set(self.tracked_files()) | set(manifest["files"]):
+                path = os.path.join(self.local_folder, rel_path)
+                if not os.path.isfile(path):
+                    continue
+                cached = self._cached_entry(state, rel_path, path)
+                if _is_sqlite(path):
+                    # The bytes of a live database differ from its snapshot; only the shadow holds the snapshot's blocks
+                    path = self._valid_shadow(state, rel_path) if cached else None
+                    if path is None:
+                        continue
+                    local_blocks[rel_path] = cached["blocks"]
+                else:
+                    local_blocks[rel_path] = cached["blocks"] if cached else self._hash_blocks(path, block_size)
+                for i, digest in enumerate(local_blocks[rel_path]):
+                    sources.setdefault(digest, (path, i * block_size))
+
+            changed = [rel_path for rel_path, entry in manifest["files"].items()
+                       if local_blocks.get(rel_path) != entry["blocks"]]
+            needed = {digest for rel_path in changed for digest in manifest["files"][rel_path]["blocks"]} - set(sources)
+
+            staging_folder = os.path.join(self.local_folder, STAGING_FOLDER_NAME)
+            os.makedirs(staging_folder, exist_ok=True)
+            shadow_mtimes, assembled = {}, []
+            try:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    for size in executor.map(lambda digest: self._download_block(digest, staging_folder), needed):
+                        stats["blocks_downloaded"] += 1
+                        stats["bytes_downloaded"] += size
+
+                # Assemble every changed file before replacing any, since they may share source blocks
+                for rel_path in changed:
+                    path = os.path.join(self.local_folder, rel_path)
+                    tmp_path = f"{path}.sync_tmp"
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(tmp_path, 'wb') as out:
+                        for digest in manifest["files"][rel_path]["blocks"]:
+                            out.write(self._read_block(digest, sources, staging_folder, block_size))
+                    assembled.append((rel_path, tmp_path, path))
+                for rel_path, tmp_path, path in assembled:
+                    if not _is_sqlite(tmp_path):
+                        os.replace(tmp_path, path)
+                        continue
+                    # Written through SQLite instead of replaced, so open connections see the restored database
+                    if _is_sqlite(path):
+                        _backup(tmp_path, path)
+                    else:
+                        shutil.copyfile(tmp_path, path)
+                    shadow_mtimes[rel_path] = self._keep_shadow(rel_path, tmp_path)
+                stats["changed_files"] = len(assembled)
+            finally:
+                shutil.rmtree(staging_folder, ignore_errors=True)
+                for _, tmp_path, _ in assembled:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+
+            removed = set(self.tracked_files()) - set(manifest["files"])
+            for rel_path in removed:
+                os.remove(os.path.join(self.local_folder, rel_path))
+                stats["files_removed"] += 1
+            self._drop_shadows(removed)
+
+            files = {}
+            for rel_path, entry in manifest["files"].items():
+                stat = os.stat(os.path.join(self.local_folder, rel_path))
+                files[rel_path] = {"size": entry["size"], "source_size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                   "blocks": entry["blocks"]}
+                if rel_path in shadow_mtimes:
+                    files[rel_path]["shadow_mtime_ns"] = shadow_mtimes[rel_path]
+                elif rel_path not in changed and "shadow_mtime_ns" in state.get(rel_path, {}):
+                    files[rel_path]["shadow_mtime_ns"] = state[rel_path]["shadow_mtime_ns"]
+            self._save_state(files)
+            if DocumentRegistry.FILE_NAME in changed:
+                DocumentRegistry.for_folder(self.local_folder).reopen()
+            if KeywordIndex.FILE_NAME in changed:
+                KeywordIndex.for_folder(self.local_folder).reopen()
+            if any(rel_path not in (DocumentRegistry.FILE_NAME, KeywordIndex.FILE_NAME) for rel_path in changed) \
+                    or stats["files_removed"]:
+                release_vectorstores()
+            return stats
+
+    def _snapshot(self, path):
+        """Copy a SQLite database with the backup API into the shadow folder; return the copy's path."""
+        os.makedirs(self.shadow_folder, exist_ok=True)
+        fd, snapshot_path = tempfile.mkstemp(suffix=".sync_tmp", dir=self.shadow_folder)
+        os.close(fd)
+        try:
+            _backup(path, snapshot_path)
+        except BaseException:
+            os.remove(snapshot_path)
+            raise
+        return snapshot_path
+
+    def _shadow_path(self, rel_path):
+        return os.path.join(self.shadow_folder, *rel_path.split("/"))
+
+    def _valid_shadow(self, state, rel_path):
+        """Return the shadow of rel_path if it still is the snapshot the state's blocks were hashed from, else None."""
+        entry = state.get(rel_path) or {}
+        shadow_path = self._shadow_path(rel_path)
+        if "shadow_mtime_ns" not in entry or not os.path.isfile(shadow_path):
+            return None
+        stat = os.stat(shadow_path)
+        if stat.st_size != entry["size"] or stat.st_mtime_ns != entry["shadow_mtime_ns"]:
+            return None
+        return shadow_path
+
+    def _keep_shadow(self, rel_path, snapshot_path):
+        """Make snapshot_path the shadow of rel_path; return its mtime for the state."""
+        shadow_path = self._shadow_path(rel_path)
+        os.makedirs(os.path.dirname(shadow_path), exist_ok=True)
+        os.replace(snapshot_path, shadow_path)
+        return os.stat(shadow_path).st_mtime_ns
+
+    def _drop_shadows(self, rel_paths):
+        for rel_path in rel_paths:
+            shadow_path = self._shadow_path(rel_path)
+            if os.path.exists(shadow_path):
+                os.remove(shadow_path)
+
+    def _scan_blocks(self, path, upload, previous_path=None, previous_blocks=()):
+        """Hash the blocks of path, handing each to upload(digest, data).
+
+        A block equal to the same block of previous_path reuses its digest from
+        previous_blocks, so only blocks that changed are hashed.
+
+        :return: The block digests and the size of the file.
+        """
+        blocks, size = [], 0
+        with open(path, 'rb') as f, (open(previous_path, 'rb') if previous_path else nullcontext()) as previous:
+            for index, data in enumerate(iter(lambda: f.read(self.block_size), b'')):
+                unchanged = previous is not None and previous.read(self.block_size) == data
+                digest = previous_blocks[index] if unchanged else hashlib.sha256(data).hexdigest()
+                blocks.append(digest)
+                size += len(data)
+                upload(digest, data)
+        return blocks, size
+
+    def _upload_block(self, digest, data):
+        if not self.s3_handler.upload_bytes(data, self.blocks_prefix, digest):
+            raise RuntimeError(f"Upload of vector DB block {digest} failed.")
+
+    def _download_block(self, digest, staging_folder):
+        data = self.s3_handler.download_bytes(self.blocks_prefix, digest)
+        if data is None or hashlib.sha256(data).hexdigest() != digest:
+            raise RuntimeError(f"Vector DB block {digest} is missing or corrupt.")
+        with open(os.path.join(staging_folder, digest), 'wb') as f:
+            f.write(data)
+        return len(data)
+
+    def _read_block(self, digest, sources, staging_folder, block_size):
+        staged_path = os.path.join(staging_folder, digest)
+        if digest not in sources:
+            with open(staged_path, 'rb') as f:
+                return f.read()
+        path, offset = sources[digest]
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            return f.read(block_size)
+
+    def _hash_blocks(self, path, block_size):
+        with open(path, 'rb') as f:
+            return [hashlib.sha256(data).hexdigest() for data in iter(lambda: f.read(block_size), b'')]
+
+    def _cached_entry(self, state, rel_path, path):
+        """Return the cached entry for rel_path if the file is unchanged since it was recorded."""
+        cached = state.get(rel_path)
+        if not cached:
+            return None
+        stat = os.stat(path)
+        if cached.get("source_size", cached["size"]) != stat.st_size or cached["mtime_ns"] != stat.st_mtime_ns:
+            return None
+        return cached
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        return state["files"] if state.get("block_size") == self.block_size else {}
+
+    def _save_state(self, files):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"block_size": self.block_size, "files": files}, f)
+        os.replace(tmp_path, self.state_path)
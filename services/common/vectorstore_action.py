@@ -1,18 +1,42 @@
+import os
+
+from langchain_core.documents import Document
+
 from services.common.config import LOCAL_FOLDER
+from services.common.document_registry import DocumentRegistry
+from services.common.keyword_index import KeywordIndex
+from services.common.partitions import partition_name
+from services.common.text_artifacts import remove_text
 
-import os
-import json
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
+from services.common.resources import get_vectorstore, get_result_cache
+
+def count_vectors(vectorstore):
+    """Number of vectors in a collection of either backend."""
+    if hasattr(vectorstore, "count"):
+        return vectorstore.count()
+    return vectorstore._collection.count()
+
+def get_documents_by_ids(vectorstore, ids):
+    """Documents stored under ids in a collection of either backend; ids that are not stored are skipped."""
+    if hasattr(vectorstore, "_collection"):
+        # langchain-chroma 0.1 does not implement get_by_ids
+        found = vectorstore.get(ids=list(ids), include=["documents", "metadatas"])
+        return [Document(id=doc_id, page_content=text, metadata=metadata or {})
+                for doc_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])]
+    return vectorstore.get_by_ids(list(ids))
+
+def delete_by_doc_id(vectorstore, doc_id):
+    """Delete every vector tagged with doc_id (e.g. all chunks of a document) from a collection of either backend."""
+    if hasattr(vectorstore, "_collection"):
+        # langchain-chroma 0.1 drops the where argument of delete
+        vectorstore._collection.delete(where={"doc_id": doc_id})
+    else:
+        vectorstore.delete(where={"doc_id": doc_id})
 
 def check_stored_docs():
-    vectorstore = Chroma(
-        collection_name="summaries", 
-        embedding_function=OpenAIEmbeddings(),
-        persist_directory=LOCAL_FOLDER
-    )
+    vectorstore = get_vectorstore("summaries", LOCAL_FOLDER)
 
-    count = vectorstore._collection.count()
+    count = count_vectors(vectorstore)
     try:
         all_docs = vectorstore.similarity_search("", k=count) 
         if not all_docs:
@@ -26,34 +50,33 @@ def check_stored_docs():
         print(f"Error occurred while retrieving documents: {str(e)}")
 
 def delete_document_by_id(doc_id_to_delete):
-    # Loading local Chroma vector database
-    vectorstore = Chroma(
-        collection_name="summaries", 
-        embedding_function=OpenAIEmbeddings(),
-        persist_directory=LOCAL_FOLDER
-    )
+    registry = DocumentRegistry.for_folder(LOCAL_FOLDER)
+    # Shared handles of the workspace partition holding the document (Chroma or the NumPy flat index)
+    workspace = registry.workspaces([doc_id_to_delete]).get(doc_id_to_delete)
+    vectorstore = get_vectorstore(partition_name("summaries", workspace), LOCAL_FOLDER)
+    # Documents indexed with INDEX_MODE=chunks have a parent in the doc store but no summary vector
+    parent_path = os.path.join(LOCAL_FOLDER, "docstore", doc_id_to_delete)
     try:
-        count = vectorstore._collection.count()
-        all_docs = vectorstore.similarity_search("", k=count) 
-        doc_exists = any(doc.metadata.get('doc_id') == doc_id_to_delete for doc in all_docs)
-        if not doc_exists:
+        # Summary vectors are stored under their doc_id, so a lookup by id replaces scanning every document
+        has_summary = bool(get_documents_by_ids(vectorstore, [doc_id_to_delete]))
+        has_chunks = os.path.exists(parent_path)
+        if not (has_summary or has_chunks or doc_id_to_delete in registry):
             print(f"Document with doc_id {doc_id_to_delete} does not exist. Skipping deletion.")
             return
         
-        vectorstore._collection.delete(ids=doc_id_to_delete)
-        doc_id_file_path = os.path.join(LOCAL_FOLDER, "doc_id.json")
-        if os.path.exists(doc_id_file_path):
-            with open(doc_id_file_path, 'r', encoding='utf-8') as f:
-                doc_ids = json.load(f)
-
-            # Remove deleted doc_id from doc_id.json
-            if doc_id_to_delete in doc_ids:
-                doc_ids.remove(doc_id_to_delete)
-                print(f"Removed doc_id {doc_id_to_delete} from doc_id.json")
-
-            # Update doc_id list
-            with open(doc_id_file_path, 'w', encoding='utf-8') as f:
-                json.dump(doc_ids, f, indent=4)
+        if has_summary:
+            vectorstore.delete(ids=[doc_id_to_delete])
+        if has_chunks:
+            # Chunk vectors are stored as <doc_id>-<i>, all tagged with the parent's doc_id
+            delete_by_doc_id(get_vectorstore(partition_name("chunks", workspace), LOCAL_FOLDER), doc_id_to_delete)
+            os.remove(parent_path)
+        # Cached retrieval results must not point at the deleted document any more
+        get_result_cache().invalidate_document(doc_id_to_delete)
+        KeywordIndex.for_folder(LOCAL_FOLDER).remove(doc_id_to_delete)
+        remove_text(LOCAL_FOLDER, doc_id_to_delete)
+        # Dropping the registry row also forgets the content hash, so re-uploading the same content indexes it again
+        if registry.remove(doc_id_to_delete):
+            print(f"Removed doc_id {doc_id_to_delete} from the document registry")
         return True
     
     except Exception as e:
@@ -1,42 +1,306 @@
-from services.common.config import LOCAL_FOLDER
-from services.indexing.file_processing_states import detect_file_type
-from services.common.helper import FileUUIDGenerator
+from services.common.config import LOCAL_FOLDER, INDEX_MODE, DETERMINISTIC_DOC_IDS, KEYWORD_INDEX_ENABLED
+from services.indexing.file_types import detect_file_type
+from services.indexing.storage import open_vectorstore, upload_vectorized_db
+from services.indexing.batch_writer import VectorStoreBatchWriter
+from services.common.helper import FileUUIDGenerator, hash_file
+from services.common.content_registry import ContentHashRegistry
+from services.common.partitions import resolve_workspace
+
+import os
+import json
+import time
+import argparse
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Optional
+
+
+@dataclass
+class IngestResult:
+    """Outcome of ingesting one file through `Preprocessor.process_many`.
+
+    Timings are wall-clock seconds per pipeline stage (preprocess, which includes
+    streaming the file in, store_local, store_cloud) plus the total for the file.
+    Status is "ok", "error", or "duplicate" when the same content was already
+    indexed under doc_id. Metrics are reported by the file state, e.g. pages and
+    pages_per_sec for PDFs.
+    """
+    file_path: str
+    doc_id: Optional[str] = None
+    content_hash: Optional[str] = None
+    status: str = "pending"
+    error: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    metrics: Dict[str, float] = field(default_factory=dict)
+
+    @contextmanager
+    def timed(self, stage):
+        """Record the duration of a pipeline stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = round(time.perf_counter() - start, 4)
+
+    def to_dict(self):
+        return asdict(self)
+
+
+INDEX_MODES = ("summary", "chunks", "both")
+PIPELINE_STAGES = ("preprocess", "vectorize", "store_local", "store_cloud")
+
 
 class Preprocessor:
-    def __init__(self, file_path, local_folder = LOCAL_FOLDER):
+    def __init__(self, file_path, local_folder = LOCAL_FOLDER, index_mode = INDEX_MODE,
+                 content_hash = None, deterministic_id = DETERMINISTIC_DOC_IDS, mime_type = None, workspace = None):
+        if index_mode not in INDEX_MODES:
+            raise ValueError(f"Unknown index mode '{index_mode}', expected one of {INDEX_MODES}.")
         self.file_path = file_path
         self.local_folder = local_folder
+        self.index_mode = index_mode
+        self.mime_type = mime_type  # sniffed from the content on upload; guessed from the name if None
+        self.workspace = resolve_workspace(workspace)  # vector partition; None when the index is not partitioned
         self.state = self.set_state()
-        self.doc_id = FileUUIDGenerator().generate_unique_uuid()
-        
+        # content_hash may be passed in when the caller already hashed the file while receiving it
+        self.content_hash = content_hash or hash_file(file_path)
+        self.duplicate_of = None
+        self.metrics = {}  # reported by the file state once processed, e.g. pages and pages_per_sec for PDFs
+        uuid_generator = FileUUIDGenerator()
+        if deterministic_id:
+            # The same content gets its own doc_id in every workspace
+            content_key = self.content_hash if self.workspace is None else f"{self.workspace}:{self.content_hash}"
+            self.doc_id = uuid_generator.generate_content_uuid(content_key)
+        else:
+            self.doc_id = uuid_generator.generate_unique_uuid()
+        if self.state is not None:
+            self.state.content_hash = self.content_hash
+            self.state.workspace = self.workspace
+
 
     def set_state(self):
         """Set the current processing state (file type)."""
-        return detect_file_type(self.file_path)
-    
-    def process(self):
-        """Process the file by reading, preprocessing, and vectorizing."""
+        return detect_file_type(self.file_path, self.mime_type)
+
+    def process(self, on_stage=None):
+        """Process the file by reading, preprocessing, and vectorizing.
+
+        Content that was indexed before is not processed again; the existing
+        doc_id is returned instead (see `duplicate_of`). Metrics of the file
+        state are left in `metrics`.
+
+        :param on_stage: Optional callback receiving the name of each stage
+                         (see PIPELINE_STAGES) as it starts, for progress reporting.
+        """
         if self.state is None:
             raise ValueError("Processing state (file type) not set.")
 
-        # Step 1: Read the file
-        content = self.state.read(self.file_path)
+        registry = ContentHashRegistry.for_folder(self.local_folder)
+        if self.claim_content(registry):
+            return self.doc_id
+        try:
+            self._run_steps(on_stage or (lambda stage: None))
+        except Exception:
+            registry.release(self.content_hash, self.workspace)
+            raise
+        finally:
+            self.state.release()
+        self.metrics = self.state.ingest_metrics()
+        return self.doc_id
 
-        # Step 2: Preprocess the content
-        preprocessed_content = self.state.preprocess(content)
+    def claim_content(self, registry):
+        """Claim this file's content hash; return True if it is a duplicate of an indexed document."""
+        existing_doc_id = registry.claim(self.content_hash, self.doc_id, self.state.document_record(self.file_path),
+                                         workspace=self.workspace)
+        if existing_doc_id:
+            self.doc_id = self.duplicate_of = existing_doc_id
+            return True
+        return False
+
+    def _run_steps(self, on_stage):
+        # Step 1 + 2: Stream the file in bounded segments and summarize it
+        on_stage("preprocess")
+        if self.index_summaries:
+            preprocessed_content = self.state.preprocess_segments(self.state.iter_segments(self.file_path))
 
         # Step 3: Vectorize the preprocessed content
+        on_stage("vectorize")
         self.state.vectorize(self.local_folder)
 
         # Step 4: Store the vectorized content locally
-        self.state.store_local(self.doc_id, preprocessed_content)
+        on_stage("store_local")
+        if self.index_summaries:
+            self.state.store_local(self.doc_id, preprocessed_content)
+        if self.index_chunks:
+            self.state.store_chunks(self.doc_id, self.state.iter_segments(self.file_path))
+        if self.index_keywords:
+            self.state.store_keywords(self.doc_id, self.state.iter_segments(self.file_path))
+        self.state.store_text(self.doc_id, self.state.iter_segments(self.file_path))
 
-        # Step 5: Upload original file with unique ID to cloud storage
+        # Step 5: Upload original file with unique ID to cloud storage; the hash is only committed once it is there
+        on_stage("store_cloud")
         self.state.store_cloud()
-        
-# if __name__ == "__main__":
-#     # need to be absolute path
-#     file_path = r"your\file\path"
-#     # Initialize Preprocessor
-#     preprocessor = Preprocessor(file_path, LOCAL_FOLDER)
-#     preprocessor.process()
\ No newline at end of file
+        ContentHashRegistry.for_folder(self.local_folder).commit(self.content_hash, self.workspace)
+        # Pushed after the commit, so the synced document registry knows the document's hash and workspace
+        upload_vectorized_db(self.local_folder)
+
+    @property
+    def index_summaries(self):
+        return self.index_mode in ("summary", "both")
+
+    @property
+    def index_chunks(self):
+        return self.index_mode in ("chunks", "both")
+
+    @property
+    def index_keywords(self):
+        return KEYWORD_INDEX_ENABLED
+
+    def process_batched(self, writers, result):
+        """Run the per-file steps of a batch ingest, handing vectors to shared writers.
+
+        Vector store writes are deferred to `writers` ("summaries" and/or "chunks");
+        the cloud uploads (`upload_batched`) and the vectorized db upload are left to
+        the caller, so they only happen for files whose vectors were written.
+        """
+        if self.state is None:
+            raise ValueError("Processing state (file type) not set.")
+        self.state.local_folder = self.local_folder
+
+        result.content_hash = self.content_hash
+        if self.claim_content(ContentHashRegistry.for_folder(self.local_folder)):
+            result.doc_id = self.doc_id
+            result.status = "duplicate"
+            return
+
+        try:
+            if self.index_summaries:
+                with result.timed("preprocess"):
+                    preprocessed_content = self.state.preprocess_segments(self.state.iter_segments(self.file_path))
+            with result.timed("store_local"):
+                if self.index_summaries:
+                    writers["summaries"].add(self.state.summary_documents(self.doc_id, preprocessed_content),
+                                             [self.doc_id])
+                if self.index_chunks:
+                    self.state.store_chunks(self.doc_id, self.state.iter_segments(self.file_path),
+                                            writer=writers["chunks"])
+                if self.index_keywords:
+                    self.state.store_keywords(self.doc_id, self.state.iter_segments(self.file_path))
+                self.state.store_text(self.doc_id, self.state.iter_segments(self.file_path))
+        finally:
+            self.state.release()
+        result.metrics.update(self.state.ingest_metrics())
+
+    def upload_batched(self, result):
+        """Upload the original file and its plain-text artifact once the batch's vectors are written."""
+        with result.timed("store_cloud"):
+            if not self.state.upload_original():
+                raise RuntimeError("Upload of the original file failed.")
+            if not self.state.upload_text():
+                raise RuntimeError("Upload of the plain-text artifact failed.")
+
+    @classmethod
+    def process_many(cls, paths, max_workers=4, local_folder=LOCAL_FOLDER, batch_size=64, index_mode=INDEX_MODE,
+                     workspace=None):
+        """Ingest many files concurrently.
+
+        Reading and summarization run in a bounded thread pool; embeddings are
+        written to Chroma in batches through a single shared writer. Only files
+        whose vectors were written have their original uploaded (in the same pool),
+        so a failed batch leaves no orphans in S3, and the vectorized db is
+        uploaded once at the end.
+
+        :param paths: Iterable of file paths to ingest.
+        :param max_workers: Maximum number of files processed at the same time.
+        :param local_folder: Folder holding the local vector store.
+        :param batch_size: Number of documents per vector store write.
+        :param index_mode: "summary", "chunks" or "both", see INDEX_MODES.
+        :param workspace: Workspace of every file when the index is partitioned (DEFAULT_WORKSPACE if None).
+        :return: List of IngestResult, in the same order as paths.
+        """
+        workspace = resolve_workspace(workspace)
+        writers = {}
+        if index_mode in ("summary", "both"):
+            writers["summaries"] = VectorStoreBatchWriter(open_vectorstore(local_folder, workspace=workspace), local_folder,
+                                                          batch_size=batch_size)
+        if index_mode in ("chunks", "both"):
+            writers["chunks"] = VectorStoreBatchWriter(
+                open_vectorstore(local_folder, collection_name="chunks", workspace=workspace), local_folder,
+                batch_size=batch_size, record_ids=False
+            )
+        vector_writers = list(writers.values())
+        registry = ContentHashRegistry.for_folder(local_folder)
+        results = [IngestResult(file_path=path) for path in paths]
+        preprocessors = {}
+
+        def ingest(result):
+            start = time.perf_counter()
+            try:
+                preprocessor = cls(result.file_path, local_folder, index_mode, workspace=workspace)
+                result.doc_id = preprocessor.doc_id
+                preprocessor.process_batched(writers, result)
+                if result.status != "duplicate":
+                    result.status = "ok"
+                    preprocessors[id(result)] = preprocessor
+            except Exception as e:
+                result.status = "error"
+                result.error = str(e)
+            result.timings["total"] = round(time.perf_counter() - start, 4)
+            return result
+
+        def upload(result):
+            try:
+                preprocessors[id(result)].upload_batched(result)
+            except Exception as e:
+                result.status = "error"
+                result.error = str(e)
+            result.timings["total"] = round(result.timings["total"] + result.timings["store_cloud"], 4)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(ingest, results))
+            for writer in vector_writers:
+                writer.flush()
+            for result in results:
+                write_error = next(filter(None, (writer.failed(result.doc_id) for writer in vector_writers)), None)
+                if result.status == "ok" and write_error:
+                    result.status = "error"
+                    result.error = write_error
+            list(executor.map(upload, [result for result in results if result.status == "ok"]))
+
+        for result in results:
+            if result.status == "ok":
+                registry.commit(result.content_hash, workspace)
+            elif result.status == "error" and result.content_hash:
+                registry.release(result.content_hash, workspace)
+
+        if any(result.status == "ok" for result in results):
+            upload_vectorized_db(local_folder)
+        return results
+
+
+def _expand_paths(paths):
+    """Expand directories into the files they contain."""
+    expanded = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                expanded.extend(os.path.join(root, file) for file in sorted(files))
+        else:
+            expanded.append(path)
+    return expanded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest documents into the vector store.")
+    parser.add_argument("paths", nargs="+", help="Files or directories to ingest (absolute paths)")
+    parser.add_argument("--workers", type=int, default=4, help="Number of files processed concurrently")
+    parser.add_argument("--batch-size", type=int, default=64, help="Documents per vector store write")
+    parser.add_argument("--index-mode", choices=INDEX_MODES, default=INDEX_MODE, help="What to embed for each document")
+    parser.add_argument("--workspace", help="Workspace partition of the documents (with PARTITION_BY=workspace)")
+    args = parser.parse_args()
+
+    report = Preprocessor.process_many(
+        _expand_paths(args.paths), max_workers=args.workers, batch_size=args.batch_size, index_mode=args.index_mode,
+        workspace=args.workspace
+    )
+    print(json.dumps([result.to_dict() for result in report], indent=4))
@@ -0,0 +1,68 @@
+import threading
+
+from services.indexing.storage import record_doc_ids
+
+
+class VectorStoreBatchWriter:
+    """Single writer shared by ingestion workers.
+
+    Workers hand over their summary documents with `add`; the writer buffers them
+    and writes to the vector store in batches of `batch_size`, so the embedding
+    request and the Chroma insert are amortized over many files instead of one.
+    Writes are serialized because the local Chroma store has a single writer.
+    """
+    def __init__(self, vectorstore, local_folder, batch_size=64, record_ids=True):
+        self.vectorstore = vectorstore
+        self.local_folder = local_folder
+        self.batch_size = batch_size
+        self.record_ids = record_ids  # register written ids in the document registry (summary vectors only)
+        self.errors = {}  # doc_id -> error message for batches that failed to write
+        self._pending_docs = []
+        self._pending_ids = []
+        self._owners = {}
+        self._buffer_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def add(self, documents, ids, owner_id=None):
+        """Queue documents for writing, flushing a full batch if one is ready.
+
+        owner_id reports write failures against the parent document when the
+        vector ids are not doc_ids themselves (e.g. chunk ids).
+        """
+        batch = None
+        with self._buffer_lock:
+            if owner_id is not None:
+                self._owners.update(dict.fromkeys(ids, owner_id))
+            self._pending_docs.extend(documents)
+            self._pending_ids.extend(ids)
+            if len(self._pending_docs) >= self.batch_size:
+                batch = self._take_pending()
+        if batch:
+            self._write(*batch)
+
+    def flush(self):
+        """Write whatever is still buffered."""
+        with self._buffer_lock:
+            batch = self._take_pending()
+        if batch[0]:
+            self._write(*batch)
+
+    def failed(self, doc_id):
+        """Return the write error for doc_id, or None if it was written."""
+        return self.errors.get(doc_id)
+
+    def _take_pending(self):
+        batch = (self._pending_docs, self._pending_ids)
+        self._pending_docs, self._pending_ids = [], []
+        return batch
+
+    def _write(self, documents, ids):
+        with self._write_lock:
+            try:
+                self.vectorstore.add_documents(documents, ids=ids)
+                if self.record_ids:
+                    record_doc_ids(self.local_folder, list(dict.fromkeys(ids)))
+            except Exception as e:
+                print(f"Error occurred in VectorStoreBatchWriter._write: {str(e)}")
+                for doc_id in ids:
+                    self.errors[self._owners.get(doc_id, doc_id)] = str(e)
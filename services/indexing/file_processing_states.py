@@ -1,28 +1,85 @@
-from services.common.AWS_handler import S3Handler
+from services.common.config import CHUNK_SIZE, CHUNK_OVERLAP
+from services.common.embeddings import get_embeddings
+from services.common.content_registry import ContentHashRegistry
+from services.common.document_registry import DocumentRegistry
+from services.common.keyword_index import KeywordIndex
+from services.common.resources import get_s3_handler
+from services.common.text_artifacts import TEXT_FOLDER, TEXT_SUFFIX, TextArtifactWriter, text_path
+from services.indexing.storage import open_vectorstore, record_doc_ids
+from services.indexing.summarizer import Summarizer, count_tokens
+from services.indexing.readers import iter_text_segments, iter_docx_segments, iter_pdf_pages, split_segments
 
 import os
 import json
-import uuid
-from uuid import uuid4
+import time
+import tempfile
 from abc import ABC, abstractmethod
-from docx import Document as DocxReader
 from pathlib import Path
-import mimetypes
-import zipfile
-from langchain import hub
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
 from langchain_core.documents import Document
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain.storage import InMemoryByteStore
-from langchain.retrievers.multi_vector import MultiVectorRetriever
+from langchain_core.load import dumps
+
+
+# Link chunk vectors to their full parent document kept in a persistent doc store
+def open_multi_vector_retriever(local_folder, embeddings=None, workspace=None):
+    """Open the chunk vector store (of workspace's partition) together with the doc store of parent documents."""
+    from langchain.storage import LocalFileStore
+    from langchain.retrievers.multi_vector import MultiVectorRetriever
+    return MultiVectorRetriever(
+        vectorstore=open_vectorstore(local_folder, embeddings, collection_name="chunks", workspace=workspace),
+        byte_store=LocalFileStore(os.path.join(local_folder, "docstore")),
+        id_key="doc_id",
+    )
+
+# Stream a parent document into the doc store without holding its full text in memory
+class ParentDocumentWriter:
+    """Write a Document to the LocalFileStore-backed doc store segment by segment.
+
+    The file has the same serialized form the doc store writes itself: the
+    Document is serialized once around a placeholder, and the escaped segments
+    are written in its place.
+    """
+    _PLACEHOLDER = "\x00page_content\x00"
+
+    def __init__(self, docstore_folder, doc_id, metadata):
+        serialized = dumps(Document(page_content=self._PLACEHOLDER, metadata=metadata))
+        self._prefix, self._suffix = serialized.split(json.dumps(self._PLACEHOLDER)[1:-1])
+        self.file_path = os.path.join(docstore_folder, doc_id)
+        self._tmp_path = f"{self.file_path}.tmp"
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        self._file = open(self._tmp_path, 'w', encoding='utf-8')
+        self._file.write(self._prefix)
+        return self
+
+    def write(self, text):
+        self._file.write(json.dumps(text)[1:-1])
+
+    def tee(self, segments):
+        """Pass segments through, writing each one to the parent document."""
+        for segment in segments:
+            self.write(segment)
+            yield segment
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._file.write(self._suffix)
+        self._file.close()
+        if exc_type is None:
+            os.replace(self._tmp_path, self.file_path)
+        else:
+            os.remove(self._tmp_path)
+        return False
 
 
 # Abstract base class defining methods for file processing states
 class FileProcessingState(ABC):
+    content_hash = None  # SHA-256 of the file, set by the Preprocessor
+    workspace = None  # vector partition the document is indexed into, set by the Preprocessor
+    text_stats = None  # chars and tokens of the extracted text, set by store_text
+
     # Abstract method to read file content
     @abstractmethod
     def read(self, file_path):
@@ -53,10 +110,140 @@ class FileProcessingState(ABC):
         """Store data to the cloud"""
         pass
 
+    # Stream the file as bounded text segments; states without a streaming reader fall back to read()
+    def iter_segments(self, file_path):
+        """Return an iterator over the file content as bounded text segments."""
+        return iter([self.read(file_path)])
+
+    # Summarize the file from its segments without materializing the whole text
+    def preprocess_segments(self, segments):
+        """Summarize a stream of text segments."""
+        return Summarizer().summarize_segments(segments)
+
+    # Describe the file for the document registry
+    def document_record(self, file_path):
+        """Return the name, doc_type and size of file_path."""
+        return {"name": Path(file_path).name, "doc_type": self.doc_type, "size": os.path.getsize(file_path)}
+
+    # Free what the state holds between passes over a file; states that keep something override this
+    def release(self):
+        """Release per-file resources once the file has been processed."""
+        pass
+
+    # Per-document ingest metrics; states that measure something override this
+    def ingest_metrics(self):
+        """Return metrics about the last processed file."""
+        return {}
+
+    # Build the summary documents that represent this file in the vector store
+    def summary_documents(self, doc_id, content):
+        """Wrap the summary in a Document tagged with doc_id and doc_type."""
+        self.doc_id = doc_id
+        return [
+            Document(page_content=content, metadata={"doc_id": doc_id, "doc_type": self.doc_type})
+        ]
+
+    # Split streamed content into passages tagged with their parent doc_id
+    def iter_chunk_documents(self, doc_id, segments):
+        """Yield (chunk Document, vector id) pairs for a stream of text segments."""
+        splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        for i, text in enumerate(split_segments(segments, splitter.split_text)):
+            chunk = Document(page_content=text, metadata={"doc_id": doc_id, "doc_type": self.doc_type, "chunk_index": i})
+            yield chunk, f"{doc_id}-{i}"
+
+    # Store chunk-level vectors linked to the parent document
+    def store_chunks(self, doc_id, segments, writer=None, batch_size=64):
+        """Index chunk vectors for multi-vector retrieval.
+
+        segments is the content as a string or a stream of text segments; the
+        parent document is streamed into the doc store at the same time. Chunks
+        go to writer (a shared VectorStoreBatchWriter) when given, otherwise
+        they are added to the chunks collection in batches of batch_size.
+        """
+        self.doc_id = doc_id
+        if isinstance(segments, str):
+            segments = [segments]
+        chunk_store = None if writer else open_vectorstore(self.local_folder, self.embeddings, collection_name="chunks",
+                                                           workspace=self.workspace)
+        metadata = {"doc_id": doc_id, "doc_type": self.doc_type}
+        chunks, chunk_ids = [], []
+        try:
+            with ParentDocumentWriter(os.path.join(self.local_folder, "docstore"), doc_id, metadata) as parent:
+                for chunk, chunk_id in self.iter_chunk_documents(doc_id, parent.tee(segments)):
+                    if writer:
+                        writer.add([chunk], [chunk_id], owner_id=doc_id)
+                        continue
+                    chunks.append(chunk)
+                    chunk_ids.append(chunk_id)
+                    if len(chunks) >= batch_size:
+                        chunk_store.add_documents(chunks, ids=chunk_ids)
+                        chunks, chunk_ids = [], []
+            if chunks:
+                chunk_store.add_documents(chunks, ids=chunk_ids)
+        except Exception as e:
+            print(f"Error occurred in {type(self).__name__}.store_chunks: {str(e)}")
+            raise
+
+    # Index the document text for BM25 keyword search
+    def store_keywords(self, doc_id, segments):
+        """Add the text (a string or a stream of segments) to the keyword index of local_folder."""
+        return KeywordIndex.for_folder(self.local_folder).add_document(doc_id, segments)
+
+    # Keep the extracted text so queries never parse the original file again
+    def store_text(self, doc_id, segments):
+        """Write the text (a string or a stream of segments) to the gzipped plain-text artifact of doc_id.
+
+        The character and token counts are registered with the document.
+        :return: Number of tokens in the text.
+        """
+        if isinstance(segments, str):
+            segments = [segments]
+        with TextArtifactWriter(self.local_folder, doc_id, count_tokens) as writer:
+            for segment in segments:
+                writer.write(segment)
+        self.text_stats = {"chars": writer.chars, "tokens": writer.tokens}
+        # Documents being indexed are registered on commit; re-extracted ones are updated in place
+        if not ContentHashRegistry.for_folder(self.local_folder).update(self.content_hash, self.workspace,
+                                                                        **self.text_stats):
+            DocumentRegistry.for_folder(self.local_folder).add(doc_id, **self.text_stats)
+        return writer.tokens
+
+    # Upload the plain-text artifact next to the original file
+    def upload_text(self, s3_handler=None):
+        """Upload the plain-text artifact of doc_id to the texts folder, if one was stored."""
+        file_path = text_path(self.local_folder, self.doc_id)
+        if not os.path.exists(file_path):
+            return True
+        s3_handler = s3_handler or get_s3_handler()
+        return s3_handler.upload_file(file_path, folder_prefix=TEXT_FOLDER, object_name=f"{self.doc_id}{TEXT_SUFFIX}",
+                                      metadata=self.text_stats)
+
+    # Upload the original file and its text; a failed upload must fail the file so its content hash is not committed
+    def upload_files(self, s3_handler=None):
+        """Upload the original file and its plain-text artifact; raise if either upload fails."""
+        s3_handler = s3_handler or get_s3_handler()
+        if not self.upload_original(s3_handler):
+            raise RuntimeError("Upload of the original file failed.")
+        if not self.upload_text(s3_handler):
+            raise RuntimeError("Upload of the plain-text artifact failed.")
+
+    # Upload the original file with its unique ID to cloud storage
+    def upload_original(self, s3_handler=None):
+        """Upload the original file to the files folder."""
+        s3_handler = s3_handler or get_s3_handler()
+        ext = Path(self.file_path).suffix.lower()
+        object_name = f"{self.doc_id}{ext}"
+        metadata = {"name": Path(self.file_path).name}
+        if self.content_hash:
+            metadata["sha256"] = self.content_hash
+        return s3_handler.upload_file(self.file_path, folder_prefix="files", object_name=object_name, metadata=metadata)
+
 # State for processing text (.txt) files
 class TextFileState(FileProcessingState):
+    doc_type = "txt"
+
     def __init__(self):
-        self.embeddings = OpenAIEmbeddings()  # Initialize OpenAI embeddings
+        self.embeddings = get_embeddings()  # Shared, cache-backed OpenAI embeddings
         self.file_path = None
         self.vectorstore = None
         self.local_folder = None
@@ -69,183 +256,201 @@ class TextFileState(FileProcessingState):
         with open(file_path, 'r', encoding='utf-8') as file:
             return file.read()
 
+    # Stream the text file in bounded, incrementally decoded segments
+    def iter_segments(self, file_path):
+        """Return an iterator over the text file as bounded segments."""
+        self.file_path = file_path
+        return iter_text_segments(file_path)
+
     # Preprocess content by summarizing it
     def preprocess(self, content):
-        doc = Document(page_content=content)
-        chain = (
-            {"doc": lambda x: x.page_content}
-            | ChatPromptTemplate.from_template("Summarize the following document:\n\n{doc}")
-            | ChatOpenAI(model="gpt-3.5-turbo", max_retries=0)
-            | StrOutputParser()
-        )
-        summary = chain.invoke(doc)  # Generate summary using LLM
-        return summary
+        return Summarizer().summarize(content)  # Generate summary using LLM, map-reduce for long files
 
     # Vectorize the text content and set up local folder for persistence
     def vectorize(self, local_folder):
         """Vectorize the text chunks."""
         self.local_folder = local_folder
-        self.vectorstore = Chroma(
-            collection_name="summaries", 
-            embedding_function=self.embeddings,
-            persist_directory=self.local_folder
-        )
+        self.vectorstore = open_vectorstore(self.local_folder, self.embeddings, workspace=self.workspace)
         return self.vectorstore
     
     # Store vectorized document locally with metadata
     def store_local(self, doc_id, content):
-        self.doc_id = doc_id
-        summary_docs = [
-            Document(page_content=content, metadata={"doc_id": doc_id, "doc_type": "txt"})
-        ]
+        summary_docs = self.summary_documents(doc_id, content)
         
         try:
             self.vectorstore.add_documents(summary_docs, ids=[doc_id])  # Add documents to vector store
             # Save document IDs locally to a JSON file for tracking
-            doc_id_file_path = os.path.join(self.local_folder, "doc_id.json")
-            if not os.path.exists(doc_id_file_path):
-                with open(doc_id_file_path, 'w', encoding='utf-8') as f:
-                    json.dump([], f)
-            with open(doc_id_file_path, 'r', encoding='utf-8') as f:
-                doc_ids = json.load(f)
-            if doc_id not in doc_ids:
-                doc_ids.append(doc_id)
-            with open(doc_id_file_path, 'w', encoding='utf-8') as f:
-                json.dump(doc_ids, f, indent=4)
+            record_doc_ids(self.local_folder, [doc_id])
         except Exception as e:
             print(f"Error occurred in file_processing_stats.store_local: {str(e)}")
+            raise  # the content hash must not be committed for a document without vectors
 
     # Upload the original file to cloud storage
     def store_cloud(self):
-        """Upload the original Word file to cloud storage."""
-        s3_handler = S3Handler()
-        ext = Path(self.file_path).suffix.lower()
-        object_name = f"{self.doc_id}{ext}"
-        file_name = Path(self.file_path).name
-        s3_handler.upload_file(self.file_path, folder_prefix="files", object_name=object_name, metadata={"name": file_name})
-
-        useful_files = ["chroma.sqlite3", "doc_id.json"]
-        for root, _, files in os.walk(self.local_folder):
-            for file in files:
-                if file in useful_files:
-                    file_path = os.path.join(root, file)
-                    s3_handler.upload_file(file_path, folder_prefix="vectorized_db", object_name=file)
+        """Upload the original text file to cloud storage."""
+        self.upload_files(get_s3_handler())
 
 
 
-# Placeholder class for PDF file processing
+# State for processing PDF (.pdf) files, page by page
 class PDFFileState(FileProcessingState):
+    doc_type = "pdf"
+
+    def __init__(self):
+        self.embeddings = get_embeddings()  # Shared, cache-backed embeddings
+        self.file_path = None
+        self.vectorstore = None
+        self.local_folder = None
+        self.doc_id = None
+        self.page_count = 0
+        self.extract_seconds = 0.0
+        self._page_spool = None  # extracted page text, so a second pass does not parse the PDF again
+
+    # Read the text of every page, pages separated by a blank line
     def read(self, file_path):
-        """Read the file."""
-        pass
-    
+        """Read the PDF file."""
+        return "".join(self.iter_segments(file_path))
+
+    # Stream the PDF one page per segment; the first pass extracts pages, later passes replay them
+    def iter_segments(self, file_path):
+        """Return an iterator over the PDF text, one segment per page."""
+        if file_path != self.file_path:
+            self.release()
+        self.file_path = file_path
+        if self._page_spool is not None:
+            return self._replay_pages()
+        return self._extract_pages()
+
+    def _extract_pages(self):
+        spool = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+        elapsed, page_count = 0.0, 0
+        start = time.perf_counter()
+        try:
+            for page_number, text in iter_pdf_pages(self.file_path):
+                elapsed += time.perf_counter() - start
+                page_count = page_number
+                segment = text if page_number == 1 else "\n\n" + text
+                spool.write(json.dumps(segment) + "\n")
+                yield segment
+                start = time.perf_counter()
+        except BaseException:
+            # A pass that failed or was abandoned leaves an incomplete spool, which must not be replayed
+            spool.close()
+            raise
+        elapsed += time.perf_counter() - start
+        self.page_count, self.extract_seconds = page_count, elapsed
+        self.release()
+        self._page_spool = spool
+
+    # Close the page spool; the next pass over the file extracts the pages again
+    def release(self):
+        """Close the spooled page text."""
+        if self._page_spool is not None:
+            self._page_spool.close()
+            self._page_spool = None
+
+    def _replay_pages(self):
+        self._page_spool.seek(0)
+        for line in self._page_spool:
+            yield json.loads(line)
+
+    # Pages per second spent extracting text, reported per document
+    def ingest_metrics(self):
+        """Return page count and extraction throughput of the last extracted file."""
+        pages_per_sec = self.page_count / self.extract_seconds if self.extract_seconds else 0.0
+        return {"pages": self.page_count, "pages_per_sec": round(pages_per_sec, 2)}
+
+    # Chunk each page on its own so every chunk keeps the page it came from
+    def iter_chunk_documents(self, doc_id, segments):
+        """Yield (chunk Document, vector id) pairs with the page number in the metadata."""
+        splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        index = 0
+        for page_number, page_text in enumerate(segments, start=1):
+            for text in splitter.split_text(page_text):
+                metadata = {"doc_id": doc_id, "doc_type": self.doc_type, "chunk_index": index, "page": page_number}
+                yield Document(page_content=text, metadata=metadata), f"{doc_id}-{index}"
+                index += 1
+
+    # Build the summary document, recording how many pages the PDF has
+    def summary_documents(self, doc_id, content):
+        """Wrap the summary in a Document tagged with doc_id, doc_type and page_count."""
+        summary_docs = super().summary_documents(doc_id, content)
+        summary_docs[0].metadata["page_count"] = self.page_count
+        return summary_docs
+
+    # Preprocess content by summarizing it
     def preprocess(self, content):
-        """Preprocess the content."""
-        pass
+        return Summarizer().summarize(content)
 
-    def vectorize(self, content, local_folder):
-        """Vectorize the preprocessed content."""
-        pass
-    
-    def store_local(self, vectorstore, local_folder):
-        """Store the vectorized data locally."""
-        pass
-    
-    def retrieve(self, query, local_folder):
-        """Retrieve using similarity search."""
-        pass
+    # Vectorize content and set up local folder for persistence
+    def vectorize(self, local_folder):
+        """Set up the vector store for embeddings."""
+        self.local_folder = local_folder
+        self.vectorstore = open_vectorstore(self.local_folder, self.embeddings, workspace=self.workspace)
+        return self.vectorstore
+
+    # Store vectorized document locally with metadata
+    def store_local(self, doc_id, content):
+        """Store the document vectors locally with metadata."""
+        summary_docs = self.summary_documents(doc_id, content)
+        try:
+            self.vectorstore.add_documents(summary_docs, ids=[doc_id])
+            record_doc_ids(self.local_folder, [doc_id])
+        except Exception as e:
+            print(f"Error occurred in PDFFileState.store_local: {str(e)}")
+            raise
+
+    # Upload the original PDF file to cloud storage
+    def store_cloud(self):
+        """Upload the original PDF file to cloud storage."""
+        self.upload_files(get_s3_handler())
 
 
 # State for processing Word (.docx) files
 class WordFileState(FileProcessingState):
+    doc_type = "docx"
+
     def __init__(self):
-        self.embeddings = OpenAIEmbeddings()  # Initialize embeddings
+        self.embeddings = get_embeddings()  # Shared, cache-backed embeddings
         self.file_path = None
         self.vectorstore = None
         self.local_folder = None
         self.doc_id = None
 
-    # Read content from a Word document using python-docx
+    # Read content from a Word document, paragraphs and tables included
     def read(self, file_path):
         """Read the Word file."""
+        return "".join(self.iter_segments(file_path))
+
+    # Stream paragraphs and table rows from word/document.xml in bounded segments
+    def iter_segments(self, file_path):
+        """Return an iterator over the Word file text as bounded segments."""
         self.file_path = file_path
-        doc = DocxReader(file_path)
-        full_text = [para.text for para in doc.paragraphs]
-        return '\n'.join(full_text)
+        return iter_docx_segments(file_path)
 
     # Preprocess content by summarizing it using LLM
     def preprocess(self, content):
-        doc = Document(page_content=content)
-        chain = (
-            {"doc": lambda x: x.page_content}
-            | ChatPromptTemplate.from_template("Summarize the following document:\n\n{doc}")
-            | ChatOpenAI(model="gpt-3.5-turbo", max_retries=0)
-            | StrOutputParser()
-        )
-        summary = chain.invoke(doc)
-        return summary
+        return Summarizer().summarize(content)
 
     # Vectorize content and set up local folder for persistence
     def vectorize(self, local_folder):
         """Set up the vector store for embeddings."""
         self.local_folder = local_folder
-        self.vectorstore = Chroma(
-            collection_name="summaries",
-            embedding_function=self.embeddings,
-            persist_directory=self.local_folder
-        )
+        self.vectorstore = open_vectorstore(self.local_folder, self.embeddings, workspace=self.workspace)
         return self.vectorstore
 
     # Store vectorized document locally with metadata
     def store_local(self, doc_id, content):
         """Store the document vectors locally with metadata."""
-        self.doc_id = doc_id
-        summary_docs = [
-            Document(page_content=content, metadata={"doc_id": doc_id, "doc_type": "docx"})
-        ]
+        summary_docs = self.summary_documents(doc_id, content)
         try:
             self.vectorstore.add_documents(summary_docs, ids=[doc_id])  # Add to vector store
-            doc_id_file_path = os.path.join(self.local_folder, "doc_id.json")
-            if not os.path.exists(doc_id_file_path):
-                with open(doc_id_file_path, 'w', encoding='utf-8') as f:
-                    json.dump([], f)
-            with open(doc_id_file_path, 'r', encoding='utf-8') as f:
-                doc_ids = json.load(f)
-            if doc_id not in doc_ids:
-                doc_ids.append(doc_id)
-            with open(doc_id_file_path, 'w', encoding='utf-8') as f:
-                json.dump(doc_ids, f, indent=4)
+            record_doc_ids(self.local_folder, [doc_id])
         except Exception as e:
             print(f"Error occurred in WordFileState.store_local: {str(e)}")
+            raise
 
     # Upload the original Word file to cloud storage
     def store_cloud(self):
         """Upload the original Word file to cloud storage."""
-        s3_handler = S3Handler()
-        ext = Path(self.file_path).suffix.lower()
-        object_name = f"{self.doc_id}{ext}"
-        file_name = Path(self.file_path).name
-        s3_handler.upload_file(self.file_path, folder_prefix="files", object_name=object_name, metadata={"name": file_name})
-
-        useful_files = ["chroma.sqlite3", "doc_id.json"]
-        for root, _, files in os.walk(self.local_folder):
-            for file in files:
-                if file in useful_files:
-                    file_path = os.path.join(root, file)
-                    s3_handler.upload_file(file_path, folder_prefix="vectorized_db", object_name=file)
-
-
-# Utility function to detect file type and return the appropriate state class
-def detect_file_type(file_path):
-    """Detects file type based on extension."""
-    ext = Path(file_path).suffix.lower()
-    mime_type, _ = mimetypes.guess_type(file_path)
-
-    if ext == '.txt' or mime_type == 'text/plain':
-        return TextFileState()
-    elif ext == '.pdf' or mime_type == 'application/pdf':
-        return PDFFileState()
-    elif ext == '.docx' or mime_type == 'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
-        return WordFileState()
-    else:
-        return None
+        self.upload_files(get_s3_handler())
@@ -0,0 +1,80 @@
+import mimetypes
+import threading
+from pathlib import Path
+from importlib import import_module
+
+
+class FileTypeRegistry:
+    """Registry of file processing states keyed by file extension and MIME type.
+
+    States are registered as "module:Class" paths and imported the first time a
+    matching file is seen, so detecting a file type does not load the readers,
+    LangChain or the embeddings behind every handler up front. Extensions are
+    checked before MIME types.
+    """
+    def __init__(self):
+        self._by_extension = {}
+        self._by_mime_type = {}
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def register(self, target, extensions=(), mime_types=()):
+        """Route the given extensions and MIME types to target.
+
+        :param target: A state class, or its "module:Class" path to import on first use.
+        :param extensions: File extensions including the dot, e.g. ".txt".
+        :param mime_types: MIME types as guessed from the file name, e.g. "text/plain".
+        """
+        for ext in extensions:
+            self._by_extension[ext.lower()] = target
+        for mime_type in mime_types:
+            self._by_mime_type[mime_type] = target
+
+    def resolve(self, file_path, mime_type=None):
+        """Return the state class for file_path, or None if its type is not registered.
+
+        :param mime_type: MIME type reported by the client; guessed from the file name if omitted.
+        """
+        target = self._by_extension.get(Path(file_path).suffix.lower())
+        if target is None:
+            target = self._by_mime_type.get(mime_type or mimetypes.guess_type(file_path)[0])
+        return self.load(target) if target is not None else None
+
+    def load(self, target):
+        """Return the class behind target, importing its module once."""
+        if not isinstance(target, str):
+            return target
+        state_class = self._loaded.get(target)
+        if state_class is None:
+            with self._lock:
+                if target not in self._loaded:
+                    module_name, _, class_name = target.partition(":")
+                    self._loaded[target] = getattr(import_module(module_name), class_name)
+                state_class = self._loaded[target]
+        return state_class
+
+    def extensions(self):
+        """Return the registered file extensions."""
+        return sorted(self._by_extension)
+
+
+file_types = FileTypeRegistry()
+file_types.register(
+    "services.indexing.file_processing_states:TextFileState",
+    extensions=(".txt",), mime_types=("text/plain",)
+)
+file_types.register(
+    "services.indexing.file_processing_states:PDFFileState",
+    extensions=(".pdf",), mime_types=("application/pdf",)
+)
+file_types.register(
+    "services.indexing.file_processing_states:WordFileState",
+    extensions=(".docx",), mime_types=("application/vnd.openxmlformats-officedocument.wordprocessingml.document",)
+)
+
+
+# Utility function to detect file type and return the appropriate state
+def detect_file_type(file_path, mime_type=None):
+    """Return a new processing state for file_path, or None if the type is not supported."""
+    state_class = file_types.resolve(file_path, mime_type)
+    return state_class() if state_class is not None else None
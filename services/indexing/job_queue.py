@@ -0,0 +1,346 @@
+from services.common.config import (
+    LOCAL_FOLDER, UPLOAD_FOLDER, INDEX_MODE, INGEST_MAX_ATTEMPTS, INGEST_RETRY_BASE_SECONDS, INGEST_RETRY_MAX_SECONDS,
+    INGEST_STALE_SECONDS, INGEST_JOB_TTL_SECONDS
+)
+from services.common.partitions import resolve_workspace
+from services.common.resources import get_redis_client
+from services.indexing.app import Preprocessor, PIPELINE_STAGES
+from services.indexing.uploads import remove_upload
+
+import os
+import json
+import time
+import uuid
+import random
+import shutil
+import signal
+import argparse
+import threading
+import multiprocessing
+
+# Job states; "done", "duplicate" and "failed" are final
+QUEUED, RUNNING, RETRYING, DONE, DUPLICATE, FAILED = "queued", "running", "retrying", "done", "duplicate", "failed"
+
+
+class IngestionQueue:
+    """Durable ingestion job queue in Redis.
+
+    Keys (all below `namespace`):
+    - `queue`: list of job ids ready to run
+    - `processing`: list of job ids claimed by a worker
+    - `delayed`: sorted set of job ids waiting for a retry, scored by due time
+    - `job:<id>`: hash with the job's file, status, stage, progress, attempts, timings and metrics
+    - `metrics`: hash of job counters and per-stage timing totals
+    - `index_version`: counter increased whenever a job indexed a document, so
+      API processes know their vector store handles no longer see every vector
+    - `index_versions`: hash of the same counter per workspace partition ("" when
+      the index is not partitioned), so API processes only drop the results they
+      cached for workspaces that received documents
+
+    Workers move a job from `queue` to `processing` atomically, so a job is never
+    lost between being popped and finished; jobs whose worker stopped sending
+    heartbeats are put back by `recover_stale`.
+    """
+    def __init__(self, client=None, namespace="ingest", max_attempts=INGEST_MAX_ATTEMPTS,
+                 retry_base_seconds=INGEST_RETRY_BASE_SECONDS, retry_max_seconds=INGEST_RETRY_MAX_SECONDS):
+        self.client = client or get_redis_client()
+        self.namespace = namespace
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.queue_key = f"{namespace}:queue"
+        self.processing_key = f"{namespace}:processing"
+        self.delayed_key = f"{namespace}:delayed"
+        self.metrics_key = f"{namespace}:metrics"
+        self.index_version_key = f"{namespace}:index_version"
+        self.index_versions_key = f"{namespace}:index_versions"
+
+    def job_key(self, job_id):
+        return f"{self.namespace}:job:{job_id}"
+
+    @staticmethod
+    def new_job_id():
+        return uuid.uuid4().hex
+
+    def enqueue(self, file_path, job_id=None, index_mode=INDEX_MODE, content_hash=None, mime_type=None,
+                cleanup=True, workspace=None):
+        """Queue file_path for ingestion and return the job id.
+
+        :param content_hash: SHA-256 of the file if already computed on upload, so it is not read again.
+        :param mime_type: MIME type sniffed on upload, used to pick the file state.
+        :param cleanup: Delete the file (and its upload folder) once the job is finished.
+        :param workspace: Workspace partition to index into (DEFAULT_WORKSPACE if None).
+        """
+        job_id = job_id or self.new_job_id()
+        job = {
+            "id": job_id,
+            "file_path": file_path,
+            "index_mode": index_mode,
+            "content_hash": content_hash or "",
+            "mime_type": mime_type or "",
+            "workspace": workspace or "",
+            "cleanup": int(cleanup),
+            "status": QUEUED,
+            "stage": "",
+            "progress": 0,
+            "attempts": 0,
+            "created_at": time.time(),
+        }
+        pipeline = self.client.pipeline()
+        pipeline.hset(self.job_key(job_id), mapping=job)
+        pipeline.lpush(self.queue_key, job_id)
+        pipeline.hincrby(self.metrics_key, "enqueued", 1)
+        pipeline.execute()
+        return job_id
+
+    def get(self, job_id):
+        """Return the job as a dict, or None if it does not exist (or expired)."""
+        job = self.client.hgetall(self.job_key(job_id))
+        if not job:
+            return None
+        for field in ("progress", "created_at", "started_at", "finished_at", "heartbeat", "retry_at"):
+            if field in job:
+                job[field] = float(job[field])
+        job["attempts"] = int(job["attempts"])
+        job["cleanup"] = bool(int(job.get("cleanup", 0)))
+        job["timings"] = json.loads(job.get("timings", "{}"))
+        job["metrics"] = json.loads(job.get("metrics", "{}"))
+        return job
+
+    def update(self, job_id, **fields):
+        if "timings" in fields:
+            fields["timings"] = json.dumps(fields["timings"])
+        self.client.hset(self.job_key(job_id), mapping=fields)
+
+    def claim(self, timeout=1.0):
+        """Move the next ready job to `processing` and return its id, or None after timeout seconds."""
+        self.promote_due()
+        job_id = self.client.blmove(self.queue_key, self.processing_key, timeout, "RIGHT", "LEFT")
+        if job_id is not None:
+            self.heartbeat(job_id)
+        return job_id
+
+    def promote_due(self, now=None):
+        """Move delayed jobs whose retry time has come back to the ready queue."""
+        now = time.time() if now is None else now
+        for job_id in self.client.zrangebyscore(self.delayed_key, "-inf", now):
+            # Only the caller whose ZREM succeeds requeues the job, so concurrent workers do not duplicate it
+            if self.client.zrem(self.delayed_key, job_id):
+                self.update(job_id, status=QUEUED)
+                self.client.lpush(self.queue_key, job_id)
+
+    def recover_stale(self, stale_seconds=INGEST_STALE_SECONDS, now=None):
+        """Requeue claimed jobs whose worker has not sent a heartbeat for stale_seconds.
+
+        A job without a heartbeat has just been claimed and is left alone.
+        """
+        now = time.time() if now is None else now
+        recovered = []
+        for job_id in self.client.lrange(self.processing_key, 0, -1):
+            heartbeat = self.client.hget(self.job_key(job_id), "heartbeat")
+            if heartbeat is None or now - float(heartbeat) < stale_seconds:
+                continue
+            if self.client.lrem(self.processing_key, 1, job_id):
+                self.client.hdel(self.job_key(job_id), "heartbeat")
+                self.update(job_id, status=QUEUED, stage="")
+                self.client.lpush(self.queue_key, job_id)
+                recovered.append(job_id)
+        return recovered
+
+    def heartbeat(self, job_id):
+        self.client.hset(self.job_key(job_id), "heartbeat", time.time())
+
+    def start(self, job_id):
+        """Mark a claimed job as running and return it with its attempt count increased."""
+        now = time.time()
+        self.client.hincrby(self.job_key(job_id), "attempts", 1)
+        self.update(job_id, status=RUNNING, started_at=now, heartbeat=now, error="")
+        return self.get(job_id)
+
+    def complete(self, job_id, status=DONE, doc_id=None, timings=None, metrics=None, workspace=None):
+        """Finish a job successfully and record its stage timings and the metrics of the file (e.g. pages_per_sec).
+
+        :param workspace: Workspace the job indexed into, whose index version is increased.
+        """
+        timings = timings or {}
+        pipeline = self.client.pipeline()
+        pipeline.hset(self.job_key(job_id), mapping={
+            "status": status, "stage": "", "progress": 1, "doc_id": doc_id or "",
+            "finished_at": time.time(), "timings": json.dumps(timings), "metrics": json.dumps(metrics or {}),
+        })
+        pipeline.expire(self.job_key(job_id), INGEST_JOB_TTL_SECONDS)
+        pipeline.lrem(self.processing_key, 1, job_id)
+        pipeline.hincrby(self.metrics_key, "completed", 1)
+        if status == DONE:
+            pipeline.incr(self.index_version_key)
+            pipeline.hincrby(self.index_versions_key, resolve_workspace(workspace) or "", 1)
+        for stage, seconds in timings.items():
+            pipeline.hincrbyfloat(self.metrics_key, f"stage:{stage}:seconds", seconds)
+            pipeline.hincrby(self.metrics_key, f"stage:{stage}:count", 1)
+        pipeline.execute()
+
+    def index_version(self):
+        """Return the number of jobs that indexed a document; it changes whenever the vector DB did."""
+        return int(self.client.get(self.index_version_key) or 0)
+
+    def index_versions(self):
+        """Return {workspace: index version} for the workspaces documents were indexed into (None: unpartitioned)."""
+        versions = self.client.hgetall(self.index_versions_key)
+        return {workspace or None: int(version) for workspace, version in versions.items()}
+
+    def fail(self, job_id, error):
+        """Schedule a retry with exponential backoff, or fail the job after max_attempts.
+
+        :return: True if the job will be retried.
+        """
+        attempts = int(self.client.hget(self.job_key(job_id), "attempts") or 0)
+        pipeline = self.client.pipeline()
+        pipeline.lrem(self.processing_key, 1, job_id)
+        pipeline.hdel(self.job_key(job_id), "heartbeat")
+        if attempts < self.max_attempts:
+            delay = min(self.retry_base_seconds * 2 ** (attempts - 1), self.retry_max_seconds)
+            retry_at = time.time() + delay * random.uniform(0.8, 1.2)
+            pipeline.hset(self.job_key(job_id), mapping={"status": RETRYING, "error": error, "retry_at": retry_at})
+            pipeline.zadd(self.delayed_key, {job_id: retry_at})
+            pipeline.hincrby(self.metrics_key, "retried", 1)
+        else:
+            pipeline.hset(self.job_key(job_id), mapping={"status": FAILED, "error": error, "finished_at": time.time()})
+            pipeline.expire(self.job_key(job_id), INGEST_JOB_TTL_SECONDS)
+            pipeline.hincrby(self.metrics_key, "failed", 1)
+        pipeline.execute()
+        return attempts < self.max_attempts
+
+    def metrics(self):
+        """Return queue depth, job counters and the average duration of each stage."""
+        pipeline = self.client.pipeline()
+        pipeline.llen(self.queue_key)
+        pipeline.llen(self.processing_key)
+        pipeline.zcard(self.delayed_key)
+        pipeline.hgetall(self.metrics_key)
+        queued, running, delayed, counters = pipeline.execute()
+        stages = {}
+        for key, value in counters.items():
+            if key.startswith("stage:") and key.endswith(":seconds"):
+                stage = key[len("stage:"):-len(":seconds")]
+                count = int(counters.get(f"stage:{stage}:count", 0))
+                stages[stage] = {"count": count, "avg_seconds": round(float(value) / count, 4) if count else 0.0}
+        return {
+            "queue_depth": queued + delayed,
+            "queued": queued,
+            "running": running,
+            "delayed": delayed,
+            "enqueued": int(counters.get("enqueued", 0)),
+            "completed": int(counters.get("completed", 0)),
+            "retried": int(counters.get("retried", 0)),
+            "failed": int(counters.get("failed", 0)),
+            "stages": stages,
+        }
+
+
+class IngestionWorker:
+    """Worker that runs queued ingestion jobs through the Preprocessor."""
+    def __init__(self, queue=None, local_folder=LOCAL_FOLDER, heartbeat_seconds=30):
+        self.queue = queue or IngestionQueue()
+        self.local_folder = local_folder
+        self.heartbeat_seconds = heartbeat_seconds
+        self._stopping = threading.Event()
+
+    def stop(self, *_):
+        self._stopping.set()
+
+    def run(self, poll_timeout=1.0):
+        """Process jobs until stop() is called."""
+        while not self._stopping.is_set():
+            self.queue.recover_stale()
+            self.run_once(poll_timeout)
+
+    def run_once(self, poll_timeout=1.0):
+        """Claim and process at most one job; return its id, or None if the queue was empty."""
+        job_id = self.queue.claim(poll_timeout)
+        if job_id is None:
+            return None
+        if not self.queue.client.exists(self.queue.job_key(job_id)):
+            self.queue.client.lrem(self.queue.processing_key, 1, job_id)  # expired job
+            return job_id
+        job = self.queue.start(job_id)
+        heartbeat_stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, heartbeat_stop), daemon=True)
+        heartbeat.start()
+        try:
+            doc_id, status, timings, metrics = self.process(job)
+        except Exception as e:
+            print(f"Error occurred in IngestionWorker.run_once for job {job_id}: {str(e)}")
+            if not self.queue.fail(job_id, str(e)):
+                self._cleanup(job)
+        else:
+            self.queue.complete(job_id, status=status, doc_id=doc_id, timings=timings, metrics=metrics,
+                                workspace=job.get("workspace") or None)
+            self._cleanup(job)
+        finally:
+            heartbeat_stop.set()
+            heartbeat.join()
+        return job_id
+
+    def process(self, job):
+        """Run the Preprocessor for a job, reporting each stage; return (doc_id, status, timings, metrics)."""
+        timings = {}
+        current = {"stage": None, "start": time.perf_counter()}
+
+        def end_stage():
+            if current["stage"]:
+                timings[current["stage"]] = round(time.perf_counter() - current["start"], 4)
+
+        def on_stage(stage):
+            end_stage()
+            current["stage"], current["start"] = stage, time.perf_counter()
+            progress = PIPELINE_STAGES.index(stage) / len(PIPELINE_STAGES)
+            self.queue.update(job["id"], stage=stage, progress=round(progress, 2))
+
+        preprocessor = Preprocessor(
+            job["file_path"], local_folder=self.local_folder, index_mode=job["index_mode"],
+            content_hash=job["content_hash"] or None, mime_type=job.get("mime_type") or None,
+            workspace=job.get("workspace") or None
+        )
+        doc_id = preprocessor.process(on_stage=on_stage)
+        end_stage()
+        status = DUPLICATE if preprocessor.duplicate_of else DONE
+        return doc_id, status, timings, preprocessor.metrics
+
+    def _heartbeat(self, job_id, stop):
+        while not stop.wait(self.heartbeat_seconds):
+            self.queue.heartbeat(job_id)
+
+    def _cleanup(self, job):
+        """Delete the uploaded file, and its per-job upload folder, once the job is final."""
+        if not job.get("cleanup"):
+            return
+        file_path = job["file_path"]
+        upload_folder = os.path.dirname(file_path)
+        if os.path.basename(upload_folder) == job["id"]:
+            shutil.rmtree(upload_folder, ignore_errors=True)
+        else:
+            # Files of a multi-file upload share the request folder; it goes with the last one
+            remove_upload(file_path, UPLOAD_FOLDER)
+
+
+def _run_worker(local_folder):
+    worker = IngestionWorker(local_folder=local_folder)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run ingestion workers consuming the Redis job queue.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--local-folder", default=LOCAL_FOLDER, help="Folder holding the local vector store")
+    args = parser.parse_args()
+
+    processes = [
+        multiprocessing.Process(target=_run_worker, args=(args.local_folder,), daemon=False)
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
@@ -0,0 +1,183 @@
+import atexit
+import zipfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
+
+from services.common.config import READ_SEGMENT_CHARS, PDF_WORKERS, PDF_PAGES_PER_TASK, PDF_PARALLEL_MIN_PAGES
+
+# WordprocessingML namespace used by word/document.xml
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def iter_text_segments(file_path, segment_chars=READ_SEGMENT_CHARS, encoding='utf-8'):
+    """Yield a text file as segments of about segment_chars characters.
+
+    The file is decoded incrementally and segments are cut after a newline when
+    one is available, so "".join(segments) equals the full text.
+    """
+    with open(file_path, 'r', encoding=encoding) as file:
+        pending = ""
+        for block in iter(lambda: file.read(segment_chars), ""):
+            pending += block
+            while len(pending) >= segment_chars:
+                cut = pending.rfind("\n", 0, segment_chars) + 1 or segment_chars
+                yield pending[:cut]
+                pending = pending[cut:]
+        if pending:
+            yield pending
+
+
+def iter_docx_lines(file_path):
+    """Yield the paragraphs of a .docx file, streaming word/document.xml.
+
+    Table rows are yielded as one line with cells separated by tabs. Elements are
+    cleared as soon as they have been read, so memory stays bounded by the size
+    of a single paragraph or table row.
+    """
+    with zipfile.ZipFile(file_path) as archive, archive.open("word/document.xml") as xml:
+        paragraph = []  # text pieces of the current paragraph
+        cells = []      # stack of open table cells, each a list of paragraph texts
+        rows = []       # stack of open table rows, each a list of cell texts
+        run_depth = 0
+        depth = 0
+        body = None
+        for event, elem in ElementTree.iterparse(xml, events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                depth += 1
+                if tag == W + "body":
+                    body = elem
+                elif tag == W + "r":
+                    run_depth += 1
+                elif tag == W + "tr":
+                    rows.append([])
+                elif tag == W + "tc":
+                    cells.append([])
+                continue
+
+            depth -= 1
+            if tag == W + "r":
+                run_depth -= 1
+            elif run_depth and tag == W + "t":
+                paragraph.append(elem.text or "")
+            elif run_depth and tag == W + "tab":
+                paragraph.append("\t")
+            elif run_depth and tag in (W + "br", W + "cr"):
+                paragraph.append("\n")
+            elif tag == W + "p":
+                text = "".join(paragraph)
+                paragraph = []
+                if cells:
+                    cells[-1].append(text)
+                else:
+                    yield text
+            elif tag == W + "tc":
+                rows[-1].append(" ".join(text for text in cells.pop() if text))
+            elif tag == W + "tr":
+                row_text = "\t".join(rows.pop())
+                if cells:
+                    cells[-1].append(row_text)  # nested table
+                else:
+                    yield row_text
+
+            # Drop finished top-level blocks so the parsed tree does not grow with the document
+            if body is not None and depth == 2:
+                body.clear()
+
+
+def extract_pdf_pages(file_path, start, stop):
+    """Return (page_number, text) for pages [start, stop) of a PDF, page numbers starting at 1.
+
+    Module-level so it can run in worker processes; each call opens its own reader.
+    """
+    from pypdf import PdfReader
+    reader = PdfReader(file_path)
+    return [(i + 1, reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+
+_pdf_executor = None
+_pdf_executor_lock = threading.Lock()
+
+
+def get_pdf_executor():
+    """Return the process pool shared by all PDF extractions, created on first use."""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is None:
+            _pdf_executor = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+            atexit.register(_pdf_executor.shutdown, cancel_futures=True)
+        return _pdf_executor
+
+
+def iter_pdf_pages(file_path, executor=None, pages_per_task=PDF_PAGES_PER_TASK,
+                   parallel_min_pages=PDF_PARALLEL_MIN_PAGES, max_in_flight=2 * PDF_WORKERS):
+    """Yield (page_number, text) for every page of a PDF, in page order.
+
+    Small files are extracted in this process. Files with at least
+    parallel_min_pages pages are split into ranges of pages_per_task pages that
+    run on executor (the shared PDF process pool by default), with at most
+    max_in_flight ranges submitted ahead of the consumer.
+    """
+    from pypdf import PdfReader
+    reader = PdfReader(file_path)
+    page_count = len(reader.pages)
+    if page_count < max(parallel_min_pages, 2) or max_in_flight < 1:
+        for i, page in enumerate(reader.pages):
+            yield i + 1, page.extract_text() or ""
+        return
+
+    executor = executor or get_pdf_executor()
+    in_flight = deque()
+    try:
+        for start in range(0, page_count, pages_per_task):
+            if len(in_flight) >= max_in_flight:
+                yield from in_flight.popleft().result()
+            in_flight.append(executor.submit(extract_pdf_pages, file_path, start, min(start + pages_per_task, page_count)))
+        while in_flight:
+            yield from in_flight.popleft().result()
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+def join_lines(lines, segment_chars=READ_SEGMENT_CHARS):
+    """Group lines into newline-joined segments of about segment_chars characters.
+
+    "".join(segments) equals "\\n".join(lines).
+    """
+    buffer, size, first = [], 0, True
+    for line in lines:
+        piece = line if first else "\n" + line
+        first = False
+        buffer.append(piece)
+        size += len(piece)
+        if size >= segment_chars:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def iter_docx_segments(file_path, segment_chars=READ_SEGMENT_CHARS):
+    """Yield the text of a .docx file, including tables, as bounded segments."""
+    return join_lines(iter_docx_lines(file_path), segment_chars)
+
+
+def split_segments(segments, split_text):
+    """Re-chunk a stream of segments with split_text.
+
+    The last chunk of each segment is carried over and split again together with
+    the next segment, so chunk boundaries do not depend on segment boundaries.
+    """
+    carry = ""
+    for segment in segments:
+        pieces = split_text(carry + segment)
+        if not pieces:
+            carry = ""
+            continue
+        yield from pieces[:-1]
+        carry = pieces[-1]
+    if carry:
+        yield carry
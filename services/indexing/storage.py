@@ -0,0 +1,21 @@
+from services.common.embeddings import get_embeddings
+from services.common.resources import get_vectorstore
+from services.common.partitions import partition_name
+from services.common.document_registry import DocumentRegistry
+from services.common.vectordb_sync import VectorDBSync
+
+
+# Open a persistent vector store collection (Chroma or the NumPy flat index); "summaries" holds one vector per document, "chunks" one per passage
+def open_vectorstore(local_folder, embeddings=None, collection_name="summaries", workspace=None):
+    """Return the shared handle of a local vector store collection, or of its partition for workspace."""
+    return get_vectorstore(partition_name(collection_name, workspace), local_folder, embeddings or get_embeddings())
+
+# Track indexed document IDs in the document registry
+def record_doc_ids(local_folder, doc_ids):
+    """Register doc_ids in the local DocumentRegistry; ids already tracked are left as they are."""
+    DocumentRegistry.for_folder(local_folder).add_many((doc_id, {}) for doc_id in doc_ids)
+
+# Sync the local vector database files to cloud storage
+def upload_vectorized_db(local_folder, s3_handler=None):
+    """Push the blocks of the vector DB (Chroma, document registry, parent doc store) that changed since the last sync."""
+    return VectorDBSync(local_folder, s3_handler).push()
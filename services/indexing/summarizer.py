@@ -0,0 +1,184 @@
+from collections import deque
+from functools import lru_cache
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+from langchain_openai import ChatOpenAI
+
+from services.indexing.readers import split_segments
+from services.common.rate_limiter import BULK
+from services.common.config import (
+    SUMMARY_MODEL, SUMMARY_MAX_TOKENS, SUMMARY_CHUNK_TOKENS, SUMMARY_FAN_OUT,
+    SUMMARY_RPM, SUMMARY_TPM, SUMMARY_OUTPUT_TOKENS
+)
+
+SUMMARY_PROMPT = "Summarize the following document:\n\n{doc}"
+MAP_PROMPT = "Summarize the following part of a longer document:\n\n{doc}"
+REDUCE_PROMPT = (
+    "The following are summaries of consecutive parts of one document. "
+    "Combine them into a single summary of the whole document:\n\n{doc}"
+)
+
+
+@lru_cache(maxsize=8)
+def _encoding(model_name):
+    """Load the tiktoken encoding for model_name, or None if tiktoken is unavailable."""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text, model_name=SUMMARY_MODEL):
+    """Count tokens with tiktoken, falling back to a 4-characters-per-token estimate."""
+    encoding = _encoding(model_name)
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _used_tokens(message):
+    """Total tokens reported in a chat response, or None if the model did not report usage."""
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+class Summarizer:
+    """Summarize documents of any length.
+
+    Documents that fit in `max_tokens` are summarized with one LLM call. Longer
+    documents are split into `chunk_tokens`-sized chunks that are summarized
+    concurrently (at most `fan_out` calls in flight), then the partial summaries
+    are reduced, recursively if they do not fit in one prompt either.
+
+    LLM calls go through `scheduler` (the shared RateScheduler of the model when
+    no llm is given) as bulk work, so 429s are retried instead of failing the
+    ingest and summarization never crowds out live queries.
+    """
+    def __init__(self, llm=None, model_name=SUMMARY_MODEL, max_tokens=SUMMARY_MAX_TOKENS,
+                 chunk_tokens=SUMMARY_CHUNK_TOKENS, fan_out=SUMMARY_FAN_OUT, scheduler=None):
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        self.chunk_tokens = chunk_tokens
+        self.fan_out = max(1, fan_out)
+        if llm is None:
+            from services.common.resources import get_scheduler
+            llm = ChatOpenAI(model=model_name, max_retries=0)
+            scheduler = scheduler or get_scheduler(model_name, SUMMARY_RPM, SUMMARY_TPM)
+        self.llm = llm
+        self.scheduler = scheduler
+        self.summary_chain = self._chain(SUMMARY_PROMPT)
+        self.map_chain = self._chain(MAP_PROMPT)
+        self.reduce_chain = self._chain(REDUCE_PROMPT)
+
+    def _chain(self, template):
+        return (
+            {"doc": lambda x: x}
+            | ChatPromptTemplate.from_template(template)
+            | self._scheduled_llm()
+            | StrOutputParser()
+        )
+
+    def _scheduled_llm(self):
+        """Wrap the LLM so each call reserves its prompt and expected output tokens first."""
+        if self.scheduler is None:
+            return self.llm
+
+        def invoke(prompt_value):
+            tokens = count_tokens(prompt_value.to_string(), self.model_name) + SUMMARY_OUTPUT_TOKENS
+            return self.scheduler.call(lambda: self.llm.invoke(prompt_value), tokens=tokens,
+                                       priority=BULK, usage=_used_tokens)
+        return RunnableLambda(invoke)
+
+    def summarize(self, content):
+        """Return a summary of content, using map-reduce when it is too long for one call."""
+        if count_tokens(content, self.model_name) <= self.max_tokens:
+            return self.summary_chain.invoke(content)
+        return self.summarize_chunks(self.split(content))
+
+    def summarize_segments(self, segments):
+        """Summarize a stream of text segments without holding the whole document.
+
+        Segments are buffered only until they exceed max_tokens; short documents
+        then take the single-call path, longer ones are re-chunked on the fly and
+        map-reduced.
+        """
+        segments = iter(segments)
+        buffered, tokens = [], 0
+        for segment in segments:
+            buffered.append(segment)
+            tokens += count_tokens(segment, self.model_name)
+            if tokens > self.max_tokens:
+                head = "".join(buffered)
+                buffered = None
+                return self.summarize_chunks(split_segments(chain([head], segments), self.split))
+        return self.summary_chain.invoke("".join(buffered))
+
+    def split(self, content):
+        """Split content into token-bounded chunks."""
+        if _encoding(self.model_name) is None:
+            splitter = RecursiveCharacterTextSplitter(chunk_size=self.chunk_tokens * 4, chunk_overlap=0)
+        else:
+            splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+                model_name=self.model_name, chunk_size=self.chunk_tokens, chunk_overlap=0
+            )
+        return splitter.split_text(content)
+
+    def summarize_chunks(self, chunks):
+        """Map-reduce summary over an iterable of token-bounded chunks.
+
+        Chunks are consumed lazily, so a generator keeps at most ~2 * fan_out
+        chunks in memory at a time.
+        """
+        partials = self._map(self.map_chain, chunks)
+        if not partials:
+            return ""
+        if len(partials) == 1:
+            return partials[0]
+        return self._reduce(partials)
+
+    def _map(self, chain, texts):
+        """Invoke chain on every text with at most fan_out calls in flight, preserving order."""
+        results = []
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=self.fan_out) as executor:
+            for text in texts:
+                if len(in_flight) >= 2 * self.fan_out:
+                    results.append(in_flight.popleft().result())
+                in_flight.append(executor.submit(chain.invoke, text))
+            while in_flight:
+                results.append(in_flight.popleft().result())
+        return results
+
+    def _reduce(self, partials):
+        """Collapse partial summaries until they fit in a single reduce call."""
+        while True:
+            groups = self._group(partials)
+            if len(groups) == 1:
+                return self.reduce_chain.invoke(groups[0])
+            partials = self._map(self.reduce_chain, groups)
+
+    def _group(self, partials):
+        """Pack consecutive partial summaries into prompts of at most max_tokens."""
+        groups, current, current_tokens = [], [], 0
+        for partial in partials:
+            tokens = count_tokens(partial, self.model_name)
+            if current and current_tokens + tokens > self.max_tokens:
+                groups.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(partial)
+            current_tokens += tokens
+        if current:
+            groups.append("\n\n".join(current))
+        # Make progress even if a single partial summary is larger than max_tokens
+        if len(groups) == len(partials) and len(groups) > 1:
+            groups = ["\n\n".join(groups[i:i + 2]) for i in range(0, len(groups), 2)]
+        return groups
@@ -0,0 +1,129 @@
+import os
+import uuid
+import shutil
+import hashlib
+import mimetypes
+
+from services.common.config import UPLOAD_FOLDER, UPLOAD_CHUNK_SIZE
+
+SNIFF_BYTES = 8192
+DOCX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def sniff_mime_type(head, filename=None):
+    """Guess the MIME type from the first bytes of a file, falling back to its name.
+
+    :param head: Leading bytes of the file (SNIFF_BYTES are enough).
+    """
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    if head.startswith(b"PK\x03\x04"):
+        # OOXML packages list word/ parts near the start; otherwise trust a .docx name
+        if b"word/" in head or (filename or "").lower().endswith(".docx"):
+            return DOCX_MIME_TYPE
+        return "application/zip"
+    guessed = mimetypes.guess_type(filename or "")[0]
+    if head and b"\x00" not in head and _is_utf8(head):
+        return guessed if guessed and guessed.startswith("text/") else "text/plain"
+    return guessed or "application/octet-stream"
+
+
+def _is_utf8(head):
+    try:
+        head.decode("utf-8")
+        return True
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the sniffed bytes is still text
+        return e.start >= len(head) - 3 and e.reason == "unexpected end of data"
+
+
+def safe_file_name(filename):
+    """Strip directories and characters that are unsafe in a file name, keeping unicode letters."""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip().lstrip(".")
+    name = "".join(char for char in name if char.isalnum() or char in " ._-()")
+    return name or "upload"
+
+
+class SpooledUpload:
+    """Writable file that spools an upload to disk while hashing and sniffing it.
+
+    Data is written through a buffer of `chunk_size` bytes, so memory stays
+    constant however large the file is, and the SHA-256 content hash and MIME
+    type are known as soon as the last chunk arrives; ingestion does not read
+    the file a second time to get them.
+    """
+    def __init__(self, file_path, filename=None, chunk_size=UPLOAD_CHUNK_SIZE):
+        self.file_path = file_path
+        self.filename = filename or os.path.basename(file_path)
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._head = b""
+        self._file = open(file_path, 'w+b', buffering=chunk_size)
+
+    def write(self, data):
+        self._hash.update(data)
+        if len(self._head) < SNIFF_BYTES:
+            self._head += bytes(data[:SNIFF_BYTES - len(self._head)])
+        self.size += len(data)
+        return self._file.write(data)
+
+    @property
+    def content_hash(self):
+        return self._hash.hexdigest()
+
+    @property
+    def mime_type(self):
+        return sniff_mime_type(self._head, self.filename)
+
+    def close(self):
+        self._file.close()
+
+    def __getattr__(self, name):
+        # read, seek, flush, ... go to the underlying file
+        return getattr(self._file, name)
+
+
+class UploadBatch:
+    """Per-request folder under UPLOAD_FOLDER that receives the files of one upload.
+
+    UPLOAD_FOLDER is kept apart from LOCAL_FOLDER so large uploads do not compete
+    with the vector DB for the same disk. Each file gets its own sub-folder, so
+    files with the same name do not collide and the original name is kept.
+    """
+    def __init__(self, upload_folder=UPLOAD_FOLDER, batch_id=None, chunk_size=UPLOAD_CHUNK_SIZE):
+        self.batch_id = batch_id or uuid.uuid4().hex
+        self.folder = os.path.join(upload_folder, self.batch_id)
+        self.chunk_size = chunk_size
+        self.files = []
+
+    def open(self, filename):
+        """Return a SpooledUpload for the next file of the request."""
+        file_folder = os.path.join(self.folder, str(len(self.files)))
+        os.makedirs(file_folder, exist_ok=True)
+        upload = SpooledUpload(os.path.join(file_folder, safe_file_name(filename)), filename, self.chunk_size)
+        self.files.append(upload)
+        return upload
+
+    def stream_factory(self, total_content_length=None, content_type=None, filename=None, content_length=None):
+        """Werkzeug stream factory: spool each file part of a multipart body into this batch."""
+        return self.open(filename)
+
+    def discard(self):
+        """Close and delete every spooled file, e.g. when the request fails."""
+        for upload in self.files:
+            upload.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+def remove_upload(file_path, upload_folder=UPLOAD_FOLDER):
+    """Delete an uploaded file and the folders above it that become empty, up to upload_folder."""
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    root = os.path.abspath(upload_folder)
+    folder = os.path.dirname(os.path.abspath(file_path))
+    while folder != root and os.path.commonpath([folder, root]) == root:
+        try:
+            os.rmdir(folder)
+        except OSError:
+            break
+        folder = os.path.dirname(folder)
@@ -1,14 +1,45 @@
-from services.common.AWS_handler import S3Handler
+import os
+import gzip
+from services.common.config import (
+    RETRIEVAL_MODE, HYBRID_CANDIDATES, RRF_K, PREFILTER_CANDIDATES, DOCUMENT_CACHE_MAX_BYTES
+)
+from services.common.keyword_index import KeywordIndex, tokenize
+from services.common.resources import get_s3_handler, get_result_cache, get_search_pool, get_document_cache
+from services.common.text_artifacts import TEXT_FOLDER, TEXT_SUFFIX, load_text, text_path
 from services.retrieval.redis_client import RedisClient
 from services.retrieval.vector_store import VectorStore
 
+RETRIEVAL_MODES = ("vector", "hybrid", "prefilter")
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=RRF_K):
+    """Fuse ranked lists of ids: each id scores sum(1 / (rrf_k + rank)) over the lists it appears in.
+
+    :return: Ids ordered by fused score, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=lambda item: -scores[item])
+
+
 class Retriever:
     """Class to handle document retrieval from local vector store and downloading full documents from S3."""
-    def __init__(self):
-        """Initialize the Retrieve class with a local folder for persistence of vector store data."""
+    def __init__(self, workspace=None):
+        """Initialize the Retrieve class on the shared vector store, Redis and S3 handles.
+
+        :param workspace: Workspace partition searched when no content_keys are given (DEFAULT_WORKSPACE if None).
+        """
         self.redis_handler = RedisClient()
-        self.vector_store = VectorStore()
-        self.s3_handler = S3Handler()
+        self.vector_store = VectorStore(workspace=workspace)
+        self.s3_handler = get_s3_handler()
+        self.result_cache = get_result_cache()
+
+    @property
+    def keyword_index(self):
+        """BM25 index built at ingest time next to the vector store."""
+        return KeywordIndex.for_folder(self.vector_store.local_folder)
 
     def store_query_in_redis(self, query, conversation_block_id,**kwargs):
         """
@@ -20,21 +51,156 @@ class Retriever:
         """
         return self.redis_handler.store_query(query, conversation_block_id,**kwargs)
 
-    def retrieve(self, query, content_keys = None):
+    def retrieve(self, query, content_keys = None, mode = None):
         """
         Perform a similarity search in the vector store using the provided query.
         
         :param query: The query string to search for similar documents in the vector store.
         :param content_keys: The content keys to search for similar documents in the vector store.
+        :param mode: "vector", "hybrid" (BM25 and vector rankings fused) or "prefilter" (vector search over
+                     the best BM25 documents); RETRIEVAL_MODE if None.
         :return: The top similar document(s) based on the query.
         """
-        return self.vector_store.similarity_search(query, content_keys, k=1)
+        mode = mode or RETRIEVAL_MODE
+        if mode == "vector":
+            return self._cached_search("summaries", query, content_keys, 1, self.vector_store.similarity_search_by_vector)
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {RETRIEVAL_MODES}.")
+        search = self.hybrid_search if mode == "hybrid" else self.prefilter_search
+        # Keyword results depend on the exact terms, so only queries with the same terms share cached results
+        kind = ("summaries", mode, tuple(sorted(set(tokenize(query)))))
+        return self._cached_search(kind, query, content_keys, 1,
+                                   lambda embedding, content_keys, k: search(query, embedding, content_keys, k))
+
+    def retrieve_many(self, queries, content_keys = None, k = 1):
+        """
+        Retrieve documents for several queries with one batched embedding call and one batched search.
+        
+        :param queries: The query strings, e.g. the sub-queries of one agent turn.
+        :param content_keys: Optional doc_ids to restrict every search to.
+        :param k: Number of documents per query.
+        :return: One list of documents per query, in input order; a doc_id already returned for an
+                 earlier query is not returned again.
+        """
+        if not queries:
+            return []
+        embeddings = self.vector_store.embed_queries(queries)
+        # Fetch enough candidates that each query still has k documents once duplicates are dropped
+        fetch = k * len(queries)
+        key = self.result_cache.search_key("summaries", fetch, content_keys, self.vector_store.workspace)
+        candidates = [self.result_cache.get(embedding, key) for embedding in embeddings]
+        missing = [i for i, docs in enumerate(candidates) if docs is None]
+        if missing:
+            searched = self.vector_store.similarity_search_by_vectors([embeddings[i] for i in missing], content_keys, k=fetch)
+            for i, docs in zip(missing, searched):
+                self.result_cache.put(embeddings[i], key, docs)
+                candidates[i] = docs
+
+        seen, results = set(), []
+        for docs in candidates:
+            unique = []
+            for doc in docs:
+                doc_id = doc.metadata.get("doc_id")
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                unique.append(doc)
+                if len(unique) == k:
+                    break
+            results.append(unique)
+        return results
+
+    def hybrid_search(self, query, embedding, content_keys=None, k=1):
+        """Run BM25 and vector search concurrently and fuse their rankings with reciprocal rank fusion."""
+        candidates = max(k, HYBRID_CANDIDATES)
+        keyword_hits = get_search_pool().submit(self.keyword_index.search, query, candidates, content_keys)
+        vector_docs = self.vector_store.similarity_search_by_vector(embedding, content_keys, k=candidates)
+        keyword_ids = [doc_id for doc_id, _ in keyword_hits.result()]
+        docs = {doc.metadata.get("doc_id"): doc for doc in vector_docs}
+        fused = reciprocal_rank_fusion([list(docs), keyword_ids])[:k]
+        missing = [doc_id for doc_id in fused if doc_id not in docs]
+        if missing:
+            docs.update((doc.metadata.get("doc_id"), doc) for doc in self.vector_store.get_documents(missing))
+        return [docs[doc_id] for doc_id in fused if doc_id in docs]
+
+    def prefilter_search(self, query, embedding, content_keys=None, k=1):
+        """Score only the vectors of the best BM25 documents; search every vector if no keyword matches."""
+        keyword_hits = self.keyword_index.search(query, max(k, PREFILTER_CANDIDATES), content_keys)
+        if keyword_hits:
+            content_keys = [doc_id for doc_id, _ in keyword_hits]
+        return self.vector_store.similarity_search_by_vector(embedding, content_keys, k=k)
+
+    def retrieve_passages(self, query, content_keys = None, k = 4):
+        """
+        Perform a similarity search over chunk vectors and return only the matching passages.
+        
+        :param query: The query string to search for.
+        :param content_keys: Optional doc_ids to restrict the search to.
+        :param k: Number of passages to return.
+        :return: Passage documents ordered by relevance; empty if no chunk index exists.
+        """
+        return self._cached_search("passages", query, content_keys, k, self.vector_store.passage_search_by_vector)
+
+    def _cached_search(self, kind, query, content_keys, k, search_by_vector):
+        """Run search_by_vector unless a near-duplicate query under the same filter was answered already."""
+        embedding = self.vector_store.embed_query(query)
+        key = self.result_cache.search_key(kind, k, content_keys, self.vector_store.workspace)
+        results = self.result_cache.get(embedding, key)
+        if results is None:
+            results = search_by_vector(embedding, content_keys, k=k)
+            self.result_cache.put(embedding, key, results)
+        return results
+
+    def save_passages(self, passages, dst_folder):
+        """
+        Write retrieved passages to a text file in dst_folder so they can be used as prompt context
+        in place of the full document.
+        
+        :param passages: Passage documents returned by retrieve_passages.
+        :param dst_folder: The destination folder for the context file.
+        :return: Path of the written file.
+        """
+        file_path = os.path.join(dst_folder, "passages.txt")
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write("\n\n".join(passage.page_content for passage in passages))
+        return file_path
     
+    def document_text(self, doc_id, dst_folder):
+        """
+        Return the plain text extracted from doc_id at ingest, from the local vector DB folder
+        or else from S3 (through the document cache); None for documents indexed without it.
+        
+        :param doc_id: The unique document identifier.
+        :param dst_folder: Scratch folder for an artifact fetched from S3.
+        """
+        text = load_text(text_path(self.vector_store.local_folder, doc_id))
+        if text is not None:
+            return text
+        if not DOCUMENT_CACHE_MAX_BYTES:
+            data = self.s3_handler.download_bytes(TEXT_FOLDER, f"{doc_id}{TEXT_SUFFIX}")
+            return gzip.decompress(data).decode('utf-8') if data is not None else None
+        path = get_document_cache(TEXT_FOLDER).fetch(doc_id, dst_folder)
+        if path is None:
+            return None
+        try:
+            return load_text(path)
+        finally:
+            os.unlink(path)
+
     def full_document(self, doc_id, dst_folder):
         """
-        Download the full document from S3 using the doc_id and save it to the specified destination folder.
+        Place the full document of doc_id in the specified destination folder: its plain text
+        extracted at ingest as <doc_id>.txt when there is one, else the original file from the
+        local document cache or S3.
         
         :param doc_id: The unique document identifier used to locate the file in S3.
-        :param dst_folder: The destination folder where the document will be downloaded.
+        :param dst_folder: The destination folder where the document will be placed.
         """
-        self.s3_handler.download_file(folder_prefix = "files", object_name_prefix = doc_id, dst_folder=dst_folder)
+        text = self.document_text(doc_id, dst_folder)
+        if text is not None:
+            with open(os.path.join(dst_folder, f"{doc_id}.txt"), 'w', encoding='utf-8') as f:
+                f.write(text)
+            return True
+        if not DOCUMENT_CACHE_MAX_BYTES:
+            return self.s3_handler.download_file(folder_prefix = "files", object_name_prefix = doc_id, dst_folder=dst_folder)
+        return get_document_cache().fetch(doc_id, dst_folder) is not None
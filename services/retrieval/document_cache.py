@@ -0,0 +1,208 @@
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+
+
+class DocumentCache:
+    """Read-through disk cache of the objects of one S3 folder ("files" by default), keyed by doc_id.
+
+    Each cached document is one immutable blob directory named after its doc_id
+    and S3 ETag, written to a temporary directory and renamed into place, so a
+    reader never sees a partial file. The index (cache.sqlite3, WAL mode like the
+    document registry) records the object key, ETag, size and last use of every
+    entry and is shared by all processes using the folder.
+
+    An entry checked less than `revalidate_seconds` ago is served without any S3
+    call; an older one is revalidated with a HEAD request and only downloaded
+    again when the ETag changed. Documents are handed out as hard links (copies
+    across file systems) into the caller's folder, so deleting them there leaves
+    the cache intact. Once the blobs exceed `max_bytes`, the least recently used
+    entries are removed.
+    """
+    FILE_NAME = "cache.sqlite3"
+
+    def __init__(self, folder, s3_handler, max_bytes=2 * 1024 * 1024 * 1024, revalidate_seconds=60, clock=time.time,
+                 folder_prefix="files"):
+        self.folder = folder
+        self.s3_handler = s3_handler
+        self.folder_prefix = folder_prefix
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self.clock = clock
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.bytes_downloaded = 0
+        self.evictions = 0
+        self.blob_folder = os.path.join(folder, "blobs")
+        os.makedirs(self.blob_folder, exist_ok=True)
+        self._lock = threading.Lock()
+        # Concurrent fetches of one doc_id wait for a single download instead of each starting their own
+        self._fetch_locks = [threading.Lock() for _ in range(64)]
+        self.connection = sqlite3.connect(os.path.join(folder, self.FILE_NAME), timeout=30, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries (doc_id TEXT PRIMARY KEY, object_key TEXT NOT NULL, etag TEXT NOT NULL, "
+            "blob TEXT NOT NULL, size INTEGER NOT NULL, checked_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_entries_used_at ON entries(used_at)")
+        self.connection.commit()
+
+    def fetch(self, doc_id, dst_folder):
+        """Place the object of doc_id in dst_folder.
+
+        :return: Path of the document in dst_folder, or None if S3 holds no file for doc_id.
+        """
+        with self._fetch_locks[hash(doc_id) % len(self._fetch_locks)]:
+            entry = self._entry(doc_id)
+            if entry is not None:
+                fresh = self.clock() - entry["checked_at"] < self.revalidate_seconds
+                if fresh or self.s3_handler.object_etag(entry["object_key"]) == entry["etag"]:
+                    # The blob can be evicted by another process in between; then it is downloaded again
+                    path = self._place(self._blob_path(entry["blob"], entry["object_key"]), dst_folder)
+                    if path is not None:
+                        self._touch(doc_id, checked=not fresh)
+                        with self._lock:
+                            if fresh:
+                                self.hits += 1
+                            else:
+                                self.revalidated += 1
+                        return path
+            with self._lock:
+                self.misses += 1
+            return self._download(doc_id, dst_folder)
+
+    def _download(self, doc_id, dst_folder):
+        objects = self.s3_handler.list_objects(self.folder_prefix, doc_id)
+        if not objects:
+            print(f"No files found for doc_id {doc_id} in {self.folder_prefix}")
+            self._remove(doc_id)
+            return None
+        obj = objects[0]
+        blob = f"{_digest(doc_id, 32)}-{_digest(obj['ETag'], 16)}"
+        path = self._blob_path(blob, obj["Key"])
+        if not os.path.exists(path):
+            tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self.blob_folder)
+            try:
+                self.s3_handler.download_object(obj["Key"], os.path.join(tmp_dir, os.path.basename(obj["Key"])))
+                try:
+                    os.rename(tmp_dir, os.path.dirname(path))
+                except OSError:
+                    pass  # Another process stored the same version first
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            with self._lock:
+                self.bytes_downloaded += os.path.getsize(path)
+        previous = self._put(doc_id, obj["Key"], obj["ETag"], blob, os.path.getsize(path))
+        if previous is not None and previous != blob:
+            shutil.rmtree(os.path.join(self.blob_folder, previous), ignore_errors=True)
+        self._evict(keep=doc_id)
+        return self._place(path, dst_folder)
+
+    def _blob_path(self, blob, object_key):
+        return os.path.join(self.blob_folder, blob, os.path.basename(object_key))
+
+    @staticmethod
+    def _place(path, dst_folder):
+        target = os.path.join(dst_folder, os.path.basename(path))
+        try:
+            if os.path.lexists(target):
+                os.unlink(target)
+            try:
+                os.link(path, target)
+            except OSError as e:
+                if not os.path.exists(path):
+                    raise FileNotFoundError(path) from e
+                shutil.copyfile(path, target)
+        except FileNotFoundError:
+            return None
+        return target
+
+    def _entry(self, doc_id):
+        with self._lock:
+            return self.connection.execute("SELECT * FROM entries WHERE doc_id = ?", (doc_id,)).fetchone()
+
+    def _touch(self, doc_id, checked=False):
+        now = self.clock()
+        with self._lock:
+            if checked:
+                self.connection.execute("UPDATE entries SET used_at = ?, checked_at = ? WHERE doc_id = ?", (now, now, doc_id))
+            else:
+                self.connection.execute("UPDATE entries SET used_at = ? WHERE doc_id = ?", (now, doc_id))
+            self.connection.commit()
+
+    def _put(self, doc_id, object_key, etag, blob, size):
+        """Insert or replace the entry of doc_id; return the blob it replaces, if any."""
+        now = self.clock()
+        with self._lock:
+            row = self.connection.execute("SELECT blob FROM entries WHERE doc_id = ?", (doc_id,)).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries (doc_id, object_key, etag, blob, size, checked_at, used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", (doc_id, object_key, etag, blob, size, now, now)
+            )
+            self.connection.commit()
+        return row["blob"] if row else None
+
+    def remove(self, doc_id):
+        """Drop the cached document of doc_id, e.g. after it was deleted; return True if it was cached."""
+        with self._fetch_locks[hash(doc_id) % len(self._fetch_locks)]:
+            return self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        with self._lock:
+            row = self.connection.execute("SELECT blob FROM entries WHERE doc_id = ?", (doc_id,)).fetchone()
+            self.connection.execute("DELETE FROM entries WHERE doc_id = ?", (doc_id,))
+            self.connection.commit()
+        if row:
+            shutil.rmtree(os.path.join(self.blob_folder, row["blob"]), ignore_errors=True)
+        return row is not None
+
+    def _evict(self, keep):
+        """Remove least recently used entries (never `keep`) until the blobs fit in max_bytes."""
+        with self._lock:
+            total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            evicted = []
+            for row in self.connection.execute(
+                    "SELECT doc_id, blob, size FROM entries WHERE doc_id != ? ORDER BY used_at", (keep,)):
+                if total <= self.max_bytes:
+                    break
+                evicted.append(row)
+                total -= row["size"]
+            self.connection.executemany("DELETE FROM entries WHERE doc_id = ?", ((row["doc_id"],) for row in evicted))
+            self.connection.commit()
+            self.evictions += len(evicted)
+        for row in evicted:
+            shutil.rmtree(os.path.join(self.blob_folder, row["blob"]), ignore_errors=True)
+
+    def stats(self):
+        """Return hit/revalidation/miss counters and the size of the cache."""
+        with self._lock:
+            entries, size = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            total = self.hits + self.revalidated + self.misses
+            return {
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.revalidated) / total, 4) if total else 0.0,
+                "bytes_downloaded": self.bytes_downloaded,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+            }
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+
+def _digest(value, length):
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:length]
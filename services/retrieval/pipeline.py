@@ -0,0 +1,68 @@
+import asyncio
+from services.retrieval.stage_runner import StageRunner
+
+
+class RetrievalPipeline:
+    """Async /retrieve: store the query, find and fetch the context, generate the answer.
+
+    With content_keys the stages and their dependencies are
+
+        store_query ──────────────────────────┐
+        embed ──> search ──> fetch ───────────┴──> generate
+
+    so the Redis write (redis.asyncio) overlaps with embedding, search and the
+    document fetch, and the fetch starts as soon as the top doc_id is known.
+    Without content_keys only store_query and generate run. Blocking work
+    (embedding, vector search, the cache-backed document fetch and the LLM call)
+    runs in worker threads. Per-stage durations are left in `timings`.
+    """
+    def __init__(self, retriever, redis_client, generate):
+        """
+        :param retriever: Retriever used for search and document fetch.
+        :param redis_client: AsyncRedisClient the query is stored with.
+        :param generate: generate(redis_key, directory_path=None) returning the answer; directory_path
+                         holds the retrieved context, None to answer without retrieval.
+        """
+        self.retriever = retriever
+        self.redis_client = redis_client
+        self.generate = generate
+        self.timings = {}
+
+    async def run(self, query, dst_folder, conversation_block_id=None, content_keys=None, mode=None, sender_id=None):
+        """Answer query; the context for the answer is placed in dst_folder.
+
+        :raises LookupError: If no document matches the query.
+        """
+        runner = StageRunner()
+        self.timings = runner.timings
+        runner.add("store_query", lambda: self.redis_client.store_query(query, conversation_block_id, sender_id=sender_id))
+        if not content_keys:
+            runner.add("generate", lambda store_query: asyncio.to_thread(self.generate, store_query),
+                       after=("store_query",))
+            return (await runner.run())["generate"]
+
+        # Embedding on its own warms the query vector cache the searches read from
+        runner.add("embed", lambda: asyncio.to_thread(self.retriever.vector_store.embed_query, query))
+        runner.add("search", lambda embed: asyncio.to_thread(self.search, query, content_keys, mode), after=("embed",))
+        runner.add("fetch", lambda search: asyncio.to_thread(self.fetch, search, dst_folder), after=("search",))
+        runner.add("generate", lambda store_query, fetch: asyncio.to_thread(self.generate, store_query, dst_folder),
+                   after=("store_query", "fetch"))
+        return (await runner.run())["generate"]
+
+    def search(self, query, content_keys, mode=None):
+        """Return ("passages", passage documents) or ("document", doc_id) for the context of query."""
+        passages = self.retriever.retrieve_passages(query, content_keys=content_keys)
+        if passages:
+            # Only the matching passages go into the prompt
+            return "passages", passages
+        doc = next(iter(self.retriever.retrieve(query, content_keys=content_keys, mode=mode)), None)
+        if not doc:
+            raise LookupError("No documents found for the query.")
+        return "document", doc.metadata.get('doc_id')
+
+    def fetch(self, search, dst_folder):
+        """Write the context found by `search` to dst_folder."""
+        kind, found = search
+        if kind == "passages":
+            return self.retriever.save_passages(found, dst_folder)
+        return self.retriever.full_document(found, dst_folder)
@@ -0,0 +1,175 @@
+import time
+import base64
+import hashlib
+import logging
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+from services.common.embeddings import embed_queries
+
+
+def normalize_query(query):
+    """Normalize a query for cache lookups: NFKC, case-folded, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+class QueryVectorCache:
+    """Two-tier cache of query vectors keyed by embedding model and normalized query.
+
+    The first tier is an in-process LRU of `max_entries` vectors, each valid for
+    `ttl_seconds`. The optional second tier is Redis, shared by every server
+    process, holding float32 vectors for `redis_ttl_seconds`. A hit in either
+    tier skips the embedding call; a Redis hit is copied into the local tier.
+    """
+    def __init__(self, embeddings, max_entries=1024, ttl_seconds=3600, redis_client=None,
+                 redis_ttl_seconds=86400, namespace="query_vector", clock=time.monotonic):
+        self.embeddings = embeddings
+        self.model_name = getattr(embeddings, "model_name", None) or getattr(embeddings, "model", type(embeddings).__name__)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.redis_client = redis_client
+        self.redis_ttl_seconds = redis_ttl_seconds
+        self.namespace = namespace
+        self.clock = clock
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, vector)
+        self._lock = threading.Lock()
+
+    def key(self, normalized):
+        return f"{self.model_name}:{normalized}"
+
+    def redis_key(self, normalized):
+        digest = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+        return f"{self.namespace}:{self.model_name}:{digest}"
+
+    def embed_query(self, query):
+        """Return the vector of query, embedding it only on a miss in both tiers."""
+        normalized = normalize_query(query)
+        key = self.key(normalized)
+        vector = self._get_local(key)
+        if vector is not None:
+            return vector
+
+        vector = self._get_redis(normalized)
+        if vector is not None:
+            with self._lock:
+                self.redis_hits += 1
+        else:
+            with self._lock:
+                self.misses += 1
+            vector = self.embeddings.embed_query(normalized)
+            self._set_redis(normalized, vector)
+        self._set_local(key, vector)
+        return vector
+
+    def embed_queries(self, queries):
+        """Return the vectors of queries in order; all misses are embedded in one batched call."""
+        normalized = [normalize_query(query) for query in queries]
+        vectors = {}
+        for text in dict.fromkeys(normalized):
+            vector = self._get_local(self.key(text))
+            if vector is not None:
+                vectors[text] = vector
+        remote = [text for text in dict.fromkeys(normalized) if text not in vectors]
+        for text, vector in zip(remote, self._mget_redis(remote)):
+            if vector is not None:
+                vectors[text] = vector
+                self._set_local(self.key(text), vector)
+        missing = [text for text in remote if text not in vectors]
+        with self._lock:
+            self.redis_hits += len(remote) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            computed = dict(zip(missing, embed_queries(self.embeddings, missing)))
+            self._mset_redis(computed)
+            for text, vector in computed.items():
+                self._set_local(self.key(text), vector)
+            vectors.update(computed)
+        return [vectors[text] for text in normalized]
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, vector = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def _set_local(self, key, vector):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl_seconds, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_redis(self, normalized):
+        if self.redis_client is None:
+            return None
+        try:
+            data = self.redis_client.get(self.redis_key(normalized))
+        except Exception as e:
+            logging.warning(f"Query vector cache: Redis lookup failed: {e}")
+            return None
+        return array('f', base64.b64decode(data)).tolist() if data else None
+
+    def _set_redis(self, normalized, vector):
+        if self.redis_client is None:
+            return
+        try:
+            data = base64.b64encode(array('f', vector).tobytes()).decode('ascii')
+            self.redis_client.set(self.redis_key(normalized), data, ex=self.redis_ttl_seconds)
+        except Exception as e:
+            logging.warning(f"Query vector cache: Redis store failed: {e}")
+
+    def _mget_redis(self, texts):
+        if self.redis_client is None or not texts:
+            return [None] * len(texts)
+        try:
+            values = self.redis_client.mget([self.redis_key(text) for text in texts])
+        except Exception as e:
+            logging.warning(f"Query vector cache: Redis lookup failed: {e}")
+            return [None] * len(texts)
+        return [array('f', base64.b64decode(data)).tolist() if data else None for data in values]
+
+    def _mset_redis(self, vectors):
+        if self.redis_client is None or not vectors:
+            return
+        try:
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for text, vector in vectors.items():
+                data = base64.b64encode(array('f', vector).tobytes()).decode('ascii')
+                pipeline.set(self.redis_key(text), data, ex=self.redis_ttl_seconds)
+            pipeline.execute()
+        except Exception as e:
+            logging.warning(f"Query vector cache: Redis store failed: {e}")
+
+    def clear(self):
+        """Drop the local tier, e.g. after the embedding model changed."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss counters per tier and the number of local entries."""
+        with self._lock:
+            hits, redis_hits, misses = self.hits, self.redis_hits, self.misses
+            entries = len(self._entries)
+        total = hits + redis_hits + misses
+        return {
+            "model": self.model_name,
+            "hits": hits,
+            "redis_hits": redis_hits,
+            "misses": misses,
+            "hit_rate": round((hits + redis_hits) / total, 4) if total else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "redis": self.redis_client is not None,
+        }
@@ -1,8 +1,10 @@
-from services.common.Redis_handler import RedisHandler
+import json
+from services.common.Redis_handler import RedisHandler, MessageBuilder
+from services.common.resources import get_redis_client
 
 class RedisClient(RedisHandler):
     def __init__(self):
-        super().__init__()
+        super().__init__(client=get_redis_client())
 
     def store_query(self, query, conversation_block_id, **kwargs):
         conv_id = self.conv_id_generator(conversation_block_id)
@@ -10,3 +12,29 @@ class RedisClient(RedisHandler):
     
     def conv_id_generator(self, conversation_block_id: str) -> str:
         return super().conv_id_generator(conversation_block_id)
+
+
+class AsyncRedisClient:
+    """redis.asyncio counterpart of RedisClient.store_query, used by the async retrieval pipeline."""
+    def __init__(self, client):
+        self.client = client
+        self.message_builder = MessageBuilder()
+
+    async def store_query(self, query, conversation_block_id, **kwargs):
+        """Store the query under the next conversation id of the block; return its 'block_id:conv_id' key."""
+        conv_id = await self.conv_id_generator(conversation_block_id)
+        expiration = kwargs.pop('expiration', None)
+        message = self.message_builder.build_message(query, **kwargs)
+        await self.client.hset(conversation_block_id, conv_id, json.dumps(message.to_dict()))
+        if expiration:
+            await self.client.expire(conversation_block_id, time=expiration)
+        return f"{str(conversation_block_id)}:{conv_id}"
+
+    async def conv_id_generator(self, conversation_block_id: str) -> str:
+        # Only the field names are needed, so HKEYS replaces fetching and decoding every message
+        try:
+            existing_ids = [int(conv_id) for conv_id in await self.client.hkeys(conversation_block_id) if conv_id.isdigit()]
+            return str(max(existing_ids) + 1) if existing_ids else "0"
+        except Exception as e:
+            print(f"Error in conv_id_generator: {str(e)}")
+            return "-1"
@@ -0,0 +1,161 @@
+import time
+import threading
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+
+class SemanticResultCache:
+    """Cache of retrieval results reused by near-duplicate queries.
+
+    Each entry holds a query vector, the key of the search it answered (kind,
+    k and content_keys filter) and the resulting documents. A new query under
+    the same key whose cosine similarity to a cached query reaches `threshold`
+    gets the cached documents back without a vector search.
+
+    Vectors live in one preallocated (max_entries, dim) float32 matrix, so a
+    lookup is a single matrix-vector product over the slots of that key. At
+    most `max_entries` results are kept, evicted least recently used first;
+    entries expire after `ttl_seconds` so newly indexed documents are picked
+    up, `invalidate_document` drops every entry that returned a deleted
+    doc_id and `invalidate_workspace` every entry of a workspace partition that
+    received new documents.
+    """
+    def __init__(self, threshold=0.95, max_entries=1024, ttl_seconds=600, clock=time.monotonic):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._slot_keys = np.full(max_entries, -1, dtype=np.int64)  # key id per slot, -1 when free
+        self._key_ids = {}
+        self._entries = OrderedDict()  # slot -> (expires_at, results, doc_ids), least recently used first
+        self._slots_by_doc = defaultdict(set)
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def search_key(kind, k, content_keys=None, workspace=None):
+        """Key of a search: results are only shared between searches with the same key."""
+        key = kind, k, tuple(sorted(set(content_keys))) if content_keys else None
+        # Unfiltered searches of different workspace partitions see different documents
+        return key if workspace is None else key + (workspace,)
+
+    def get(self, vector, key):
+        """Return the cached results of the most similar query under key, or None."""
+        if not self.max_entries:
+            return None
+        query = self._normalize(vector)
+        with self._lock:
+            key_id = self._key_ids.get(key)
+            if self._vectors is None or key_id is None or len(query) != self._vectors.shape[1]:
+                self.misses += 1
+                return None
+            now = self.clock()
+            slots = np.flatnonzero(self._slot_keys == key_id)
+            for slot in [int(slot) for slot in slots if self._entries[int(slot)][0] <= now]:
+                self._remove(slot)
+            slots = np.flatnonzero(self._slot_keys == key_id)
+            if len(slots):
+                similarities = self._vectors[slots] @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    slot = int(slots[best])
+                    self._entries.move_to_end(slot)
+                    self.hits += 1
+                    return list(self._entries[slot][1])
+            self.misses += 1
+            return None
+
+    def put(self, vector, key, results):
+        """Cache results (documents with a doc_id in their metadata) for the query vector under key."""
+        if not self.max_entries:
+            return
+        query = self._normalize(vector)
+        doc_ids = {doc.metadata.get("doc_id") for doc in results} - {None}
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(query):
+                # First entry, or the embedding model changed: start over at the new dimension
+                self._clear()
+                self._vectors = np.zeros((self.max_entries, len(query)), dtype=np.float32)
+            if not self._free:
+                self._remove(next(iter(self._entries)))
+            if key not in self._key_ids and len(self._key_ids) >= 2 * self.max_entries:
+                self._compact_keys()
+            slot = self._free.pop()
+            self._vectors[slot] = query
+            self._slot_keys[slot] = self._key_ids.setdefault(key, len(self._key_ids))
+            self._entries[slot] = (self.clock() + self.ttl_seconds, list(results), doc_ids)
+            for doc_id in doc_ids:
+                self._slots_by_doc[doc_id].add(slot)
+
+    def invalidate_document(self, doc_id):
+        """Drop every cached result that contains doc_id; return how many were dropped."""
+        with self._lock:
+            slots = list(self._slots_by_doc.pop(doc_id, ()))
+            for slot in slots:
+                self._remove(slot)
+            return len(slots)
+
+    def invalidate_workspace(self, workspace):
+        """Drop every cached result of searches in workspace's partition; return how many were dropped."""
+        with self._lock:
+            key_ids = [key_id for key, key_id in self._key_ids.items() if len(key) > 3 and key[3] == workspace]
+            slots = np.flatnonzero(np.isin(self._slot_keys, key_ids)) if key_ids else []
+            for slot in slots:
+                self._remove(int(slot))
+            return len(slots)
+
+    def clear(self):
+        """Drop every cached result, e.g. after the vector DB was replaced."""
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        """Return hit/miss counters and the number of cached results."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+            }
+
+    def _normalize(self, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _remove(self, slot):
+        _, _, doc_ids = self._entries.pop(slot)
+        for doc_id in doc_ids:
+            slots = self._slots_by_doc.get(doc_id)
+            if slots is not None:
+                slots.discard(slot)
+                if not slots:
+                    del self._slots_by_doc[doc_id]
+        self._slot_keys[slot] = -1
+        self._free.append(slot)
+
+    def _compact_keys(self):
+        """Forget keys no entry uses any more, so many distinct filters do not grow the key map forever."""
+        used = set(self._slot_keys[self._slot_keys >= 0].tolist())
+        remap = {}
+        for key, key_id in list(self._key_ids.items()):
+            if key_id in used:
+                remap[key_id] = len(remap)
+        self._key_ids = {key: remap[key_id] for key, key_id in self._key_ids.items() if key_id in remap}
+        for slot in self._entries:
+            self._slot_keys[slot] = remap[int(self._slot_keys[slot])]
+
+    def _clear(self):
+        self._entries.clear()
+        self._slots_by_doc.clear()
+        self._key_ids.clear()
+        self._slot_keys[:] = -1
+        self._free = list(range(self.max_entries - 1, -1, -1))
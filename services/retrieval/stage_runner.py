@@ -0,0 +1,60 @@
+import time
+import asyncio
+
+
+class StageRunner:
+    """Run async stages as soon as the stages they depend on have finished.
+
+    A stage is a coroutine function called with the results of its dependencies
+    as keyword arguments (named after those stages), so stages that do not
+    depend on each other run concurrently. Dependencies must be added before
+    the stages using them, which keeps the graph acyclic. The duration of every
+    stage is recorded in `timings` (milliseconds, from its start once its
+    dependencies are done to its end).
+    """
+    def __init__(self):
+        self._stages = {}
+        self.timings = {}
+
+    def add(self, name, func, after=()):
+        """Register stage `name`: `await func(**{dependency: result})` once every stage in `after` is done."""
+        unknown = [dependency for dependency in after if dependency not in self._stages]
+        if unknown:
+            raise ValueError(f"Stage '{name}' depends on unknown stages {unknown}")
+        if name in self._stages:
+            raise ValueError(f"Stage '{name}' is already registered")
+        self._stages[name] = (func, tuple(after))
+        return self
+
+    async def run(self):
+        """Run every stage and return {name: result}.
+
+        The first failing stage cancels the stages still running and its exception is raised.
+        """
+        tasks = {}
+        for name, (func, after) in self._stages.items():
+            tasks[name] = asyncio.ensure_future(self._run_stage(name, func, [(dependency, tasks[dependency])
+                                                                              for dependency in after]))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return {name: task.result() for name, task in tasks.items()}
+
+    async def _run_stage(self, name, func, dependencies):
+        kwargs = {}
+        for dependency, task in dependencies:
+            kwargs[dependency] = await task
+        start = time.perf_counter()
+        try:
+            return await func(**kwargs)
+        finally:
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 2)
+
+
+def server_timing(timings):
+    """Format {stage: milliseconds} as a Server-Timing header value, e.g. "embed;dur=12.5, search;dur=3.1"."""
+    return ", ".join(f"{name};dur={duration}" for name, duration in timings.items())
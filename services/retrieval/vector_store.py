@@ -1,24 +1,140 @@
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-from services.common.config import LOCAL_FOLDER
+import os
+from langchain_core.documents import Document
+from services.common.config import LOCAL_FOLDER, PARTITION_BY
+from services.common.document_registry import DocumentRegistry
+from services.common.embeddings import get_embeddings
+from services.common.partitions import partition_name, resolve_workspace
+from services.common.resources import get_vectorstore, get_query_cache
+from services.common.vectorstore_action import get_documents_by_ids
 
 class VectorStore:
-    def __init__(self, local_folder=LOCAL_FOLDER):
+    """Search front end over the summary and chunk collections.
+
+    With PARTITION_BY=workspace every workspace has its own collections. Searches
+    without content_keys go to this store's workspace; searches with content_keys
+    are routed to the partitions of those documents (looked up in the document
+    registry), and a partition whose documents are all selected is searched
+    without a filter.
+    """
+    def __init__(self, local_folder=LOCAL_FOLDER, workspace=None):
         self.local_folder = local_folder
-        self.vectorstore = Chroma(
-            collection_name="summaries",
-            embedding_function=OpenAIEmbeddings(),
-            persist_directory=self.local_folder
-        )
+        self.workspace = resolve_workspace(workspace)
+        self.embeddings = get_embeddings()
+        self.vectorstore = get_vectorstore(partition_name("summaries", self.workspace), self.local_folder, self.embeddings)
+        self.query_cache = get_query_cache(self.embeddings)
+        self._chunk_retriever = None
+
+    @property
+    def chunk_retriever(self):
+        """Multi-vector retriever over chunk vectors, resolving hits to parents in the doc store."""
+        if self._chunk_retriever is None:
+            from langchain.storage import LocalFileStore
+            from langchain.retrievers.multi_vector import MultiVectorRetriever
+            self._chunk_retriever = MultiVectorRetriever(
+                vectorstore=self.partition("chunks", self.workspace),
+                byte_store=LocalFileStore(os.path.join(self.local_folder, "docstore")),
+                id_key="doc_id",
+            )
+        return self._chunk_retriever
+
+    def partition(self, collection_name, workspace):
+        """Shared handle of collection_name's partition for workspace."""
+        if workspace == self.workspace:
+            if collection_name == "summaries":
+                return self.vectorstore
+            if collection_name == "chunks" and self._chunk_retriever is not None:
+                return self._chunk_retriever.vectorstore
+        return get_vectorstore(partition_name(collection_name, workspace), self.local_folder, self.embeddings)
+
+    def routes(self, content_keys=None):
+        """Return {workspace: doc_ids to filter on, or None to search the whole partition} for a search."""
+        if PARTITION_BY != "workspace":
+            return {None: content_keys or None}
+        if not content_keys:
+            return {self.workspace: None}
+        registry = DocumentRegistry.for_folder(self.local_folder)
+        workspaces = registry.workspaces(content_keys)
+        routes = {}
+        for doc_id in dict.fromkeys(content_keys):
+            # Ids the registry does not know can only be in the unpartitioned collections
+            routes.setdefault(workspaces.get(doc_id), []).append(doc_id)
+        return {workspace: None if workspace is not None and len(doc_ids) >= registry.count(workspace) else doc_ids
+                for workspace, doc_ids in routes.items()}
+
+    def embed_query(self, query):
+        """Return the query vector; repeated questions are served from the query vector cache."""
+        return self.query_cache.embed_query(query)
 
     def similarity_search(self, query, content_keys=None, k=1):
-        if content_keys:
-            filter_dict = {"doc_id": {"$in": content_keys}}
-            return self.vectorstore.similarity_search(
-                query,
-                k=k,
-                filter=filter_dict
+        return self.similarity_search_by_vector(self.embed_query(query), content_keys, k=k)
+
+    def similarity_search_by_vector(self, embedding, content_keys=None, k=1):
+        return self._routed_search("summaries", embedding, content_keys, k)
+
+    def _routed_search(self, collection_name, embedding, content_keys, k):
+        routes = self.routes(content_keys)
+        if len(routes) == 1:
+            workspace, doc_ids = next(iter(routes.items()))
+            return _search(self.partition(collection_name, workspace), embedding, doc_ids, k)
+        # Documents of several workspaces: merge the best k of every partition by score
+        scored = [pair for workspace, doc_ids in routes.items()
+                  for pair in _scored_search(self.partition(collection_name, workspace), embedding, doc_ids, k)]
+        return [doc for doc, _ in sorted(scored, key=lambda pair: -pair[1])[:k]]
+
+    def get_documents(self, doc_ids):
+        """Return the summary documents stored under doc_ids (summary vectors use the doc_id as their id)."""
+        return [doc for workspace, ids in self.routes(list(doc_ids)).items()
+                for doc in get_documents_by_ids(self.partition("summaries", workspace), ids or doc_ids)]
+
+    def embed_queries(self, queries):
+        """Return the vectors of several queries, embedding the uncached ones in one batched call."""
+        return self.query_cache.embed_queries(queries)
+
+    def similarity_search_by_vectors(self, embeddings, content_keys=None, k=1):
+        """Search several query vectors under the same filter; one result list per vector, in order."""
+        routes = self.routes(content_keys)
+        if len(routes) > 1:
+            return [self.similarity_search_by_vector(embedding, content_keys, k=k) for embedding in embeddings]
+        workspace, doc_ids = next(iter(routes.items()))
+        store = self.partition("summaries", workspace)
+        filter_dict = {"doc_id": {"$in": doc_ids}} if doc_ids else None
+        if hasattr(store, "similarity_search_by_vectors_with_scores"):
+            results = store.similarity_search_by_vectors_with_scores(embeddings, k=k, filter=filter_dict)
+            return [[doc for doc, _ in docs] for docs in results]
+        if hasattr(store, "_collection"):
+            # Chroma answers a list of query vectors in one query
+            results = store._collection.query(
+                query_embeddings=[list(embedding) for embedding in embeddings], n_results=k, where=filter_dict,
+                include=["metadatas", "documents"]
             )
-        else:
-            # 如果没有指定content_keys，则搜索所有文档
-            return self.vectorstore.similarity_search(query, k=k)
+            return [[Document(page_content=text, metadata=metadata or {}) for text, metadata in zip(texts, metadatas)]
+                    for texts, metadatas in zip(results["documents"], results["metadatas"])]
+        return [_search(store, embedding, doc_ids, k) for embedding in embeddings]
+
+    def passage_search(self, query, content_keys=None, k=4):
+        """Search chunk vectors and return the matching passages with their doc_id and chunk_index."""
+        return self.passage_search_by_vector(self.embed_query(query), content_keys, k=k)
+
+    def passage_search_by_vector(self, embedding, content_keys=None, k=4):
+        return self._routed_search("chunks", embedding, content_keys, k)
+
+    def parent_documents(self, doc_ids):
+        """Load full parent documents from the doc store, skipping ids that are not stored."""
+        return [doc for doc in self.chunk_retriever.docstore.mget(list(doc_ids)) if doc is not None]
+
+
+def _search(store, embedding, doc_ids, k):
+    if doc_ids:
+        return store.similarity_search_by_vector(embedding, k=k, filter={"doc_id": {"$in": doc_ids}})
+    # 如果没有指定content_keys，则搜索所有文档
+    return store.similarity_search_by_vector(embedding, k=k)
+
+
+def _scored_search(store, embedding, doc_ids, k):
+    """(Document, similarity) pairs, higher is better, comparable across partitions of the same backend."""
+    filter_dict = {"doc_id": {"$in": doc_ids}} if doc_ids else None
+    if hasattr(store, "similarity_search_by_vector_with_scores"):
+        return store.similarity_search_by_vector_with_scores(embedding, k=k, filter=filter_dict)
+    # Chroma returns distances
+    return [(doc, -distance) for doc, distance in
+            store.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=filter_dict)]
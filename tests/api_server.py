@@ -1,26 +1,116 @@
 # api_server.py
 
 import os
+import time
 import shutil
-from flask import Flask, request, jsonify
+import threading
+from flask import Flask, Request, request, jsonify
 from flask_cors import CORS
 from services.file_management.serviceManager import RedisManager
 from services.indexing.app import Preprocessor
+from services.indexing.storage import upload_vectorized_db
+from services.indexing.job_queue import IngestionQueue
+from services.indexing.uploads import UploadBatch, remove_upload
+from services.indexing.file_types import file_types
 from services.retrieval.app import Retriever
+from services.retrieval.pipeline import RetrievalPipeline
+from services.retrieval.redis_client import AsyncRedisClient
+from services.retrieval.stage_runner import server_timing
 from services.Text_Generation.app import Generation
-from services.common.AWS_handler import S3Handler
+from services.common.resources import (
+    get_s3_handler, get_query_cache, get_result_cache, get_document_cache, release_vectorstores,
+    open_async_redis_client
+)
 
-from services.common.config import LOCAL_FOLDER, USER_NAME
+from services.common.config import LOCAL_FOLDER, USER_NAME, DOCUMENT_CACHE_MAX_BYTES, INDEX_RELOAD_MIN_SECONDS
+from services.common.text_artifacts import TEXT_FOLDER, TEXT_SUFFIX
 from services.common.vectorstore_action import delete_document_by_id
+from services.common.vectordb_sync import VectorDBSync
+from services.common.embeddings import get_embeddings
+
+class UploadRequest(Request):
+    """Request whose file parts are spooled straight into a per-request UploadBatch as they stream in."""
+    upload_batch = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.upload_batch is None:
+            self.upload_batch = UploadBatch()
+        return self.upload_batch.stream_factory(total_content_length, content_type, filename, content_length)
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 CORS(app)
 redis_manager = RedisManager()
 redis_manager.init()
 
+def generate_answer(redis_key, directory_path=None):
+    """Answer the query stored under redis_key, from the context in directory_path if given."""
+    if directory_path is None:
+        return Generation('GPT').generate_answer(redis_key)
+    return Generation('RAG').generate_answer(redis_key, directory_path=directory_path)
+
 class DocumentService:
     def __init__(self):
         self.dst_folder = r"E:\HiData\Microservice_RAG\test_output" 
+        self._retriever = None
+        self._retriever_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._index_versions = None
+        self._reloaded_at = float("-inf")
+
+    @property
+    def retriever(self):
+        """Retriever shared by all requests; its vector store, Redis and S3 handles come from the resource registry."""
+        if self._retriever is None:
+            with self._retriever_lock:
+                if self._retriever is None:
+                    self._retriever = Retriever()
+        return self._retriever
+
+    def reload_vector_db(self, workspaces=None):
+        """Swap in a retriever over the vector DB files as they are now, dropping results cached from the old ones.
+
+        Requests already running keep the retriever (and vector store handles) they
+        started with and finish on them.
+
+        :param workspaces: Workspaces that received documents; results cached for
+                           other workspaces are kept. None drops every cached result.
+        """
+        with self._retriever_lock:
+            release_vectorstores()
+            self._retriever = Retriever()
+            self._reloaded_at = time.monotonic()
+        result_cache = get_result_cache()
+        if workspaces is None or None in workspaces:
+            result_cache.clear()
+        else:
+            for workspace in workspaces:
+                result_cache.invalidate_workspace(workspace)
+
+    def sync_index_versions(self, versions):
+        """Reload the vector DB if ingestion workers indexed documents since the last reload.
+
+        A long-lived Chroma client never sees vectors written by another process,
+        so without this uploads would only become searchable after a restart. The
+        vector DB is reloaded at most once per INDEX_RELOAD_MIN_SECONDS, by one
+        request while the others search the current one.
+
+        :param versions: {workspace: index version}, see IngestionQueue.index_versions.
+        """
+        if versions == self._index_versions or time.monotonic() - self._reloaded_at < INDEX_RELOAD_MIN_SECONDS:
+            return
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            if self._index_versions is None:
+                self._index_versions = versions  # the first request opens the vector DB as it is
+            elif versions != self._index_versions and time.monotonic() - self._reloaded_at >= INDEX_RELOAD_MIN_SECONDS:
+                changed = {workspace for workspace in set(versions) | set(self._index_versions)
+                           if versions.get(workspace) != self._index_versions.get(workspace)}
+                self.reload_vector_db(changed)
+                self._index_versions = versions
+        finally:
+            self._reload_lock.release()
 
     def upload_document(self, file_path):
         """Handles document uploading"""
@@ -28,38 +118,33 @@ class DocumentService:
             return f"Error: File '{file_path}' does not exist.", 400
 
         try:
-            Preprocessor(file_path).process()
+            preprocessor = Preprocessor(file_path)
+            preprocessor.process()
+            if preprocessor.duplicate_of:
+                return f"Document already indexed as {preprocessor.doc_id}: {file_path}", 200
             return f"Document uploaded successfully: {file_path}", 200
         except Exception as e:
             return f"Error uploading document: {e}", 500
 
-    def retrieve_document(self, query, **kwargs):
-        """Handles document retrieval based on a query."""
-        retriever = Retriever()
+    async def retrieve_document(self, query, **kwargs):
+        """Handles document retrieval based on a query; returns (answer, status code, per-stage timings in ms)."""
+        redis_client = open_async_redis_client()
+        pipeline = RetrievalPipeline(self.retriever, AsyncRedisClient(redis_client), generate_answer)
         try:
-            conversation_block_id = kwargs.get('node_id', None)
-            content_keys = kwargs.get('content_keys', None)
-            sender_id = USER_NAME
-            redis_key = retriever.store_query_in_redis(query, conversation_block_id, sender_id=sender_id)
-            if content_keys:
-                docs = retriever.retrieve(query, content_keys=content_keys)
-                doc = next(iter(docs), None)
-                if not doc:
-                    print("No documents found for the query.")
-                    return
-                generator = Generation('RAG')
-                doc_id = doc.metadata.get('doc_id')
-                retriever.full_document(doc_id, self.dst_folder)
-                answer = generator.generate_answer(redis_key, directory_path=self.dst_folder)
-                return answer, 200
-            else:
-                generator = Generation('GPT')
-                answer = generator.generate_answer(redis_key)
-                return answer, 200
+            answer = await pipeline.run(query, self.dst_folder,
+                                        conversation_block_id=kwargs.get('node_id', None),
+                                        content_keys=kwargs.get('content_keys', None),
+                                        mode=kwargs.get('mode', None),
+                                        sender_id=USER_NAME)
+            return answer, 200, pipeline.timings
+        except LookupError as e:
+            print(f"{e}")
+            return str(e), 404, pipeline.timings
         except Exception as e:
             print(f"{e}")
-            return f"Error retrieving document: {e}", 500
+            return f"Error retrieving document: {e}", 500, pipeline.timings
         finally:
+            await redis_client.aclose()
             self.cleanup()
 
     def cleanup(self):
@@ -76,43 +161,115 @@ class DocumentService:
 
 # Initialize DocumentService
 doc_service = DocumentService()
+# Uploads are indexed by workers: python -m services.indexing.job_queue --workers N
+ingestion_queue = IngestionQueue()
 
 @app.route('/upload', methods=['POST'])
 def upload_document():
-    s3_handler = S3Handler()
-    if 'file' not in request.files:
+    # Any number of files, under "file" or any other field name; each was spooled, hashed
+    # and sniffed while the body streamed in, so nothing is read again here
+    files = [file for key in request.files for file in request.files.getlist(key)]
+    if not files:
         return jsonify({'error': 'No file part in the request'}), 400
 
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'No file selected for uploading'}), 400
-
+    # Optional workspace partition the documents are indexed into (PARTITION_BY=workspace)
+    workspace = request.form.get('workspace') or None
+    jobs, rejected = [], []
     try:
-        file_path = os.path.join(LOCAL_FOLDER, file.filename)
-        file.save(file_path)
-        message, status_code = doc_service.upload_document(file_path)
-        files = s3_handler.read_list(folder_prefix="files")
-        
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
-        return jsonify({'message': message, 'files': files}), status_code
+        for file in files:
+            upload = file.stream
+            upload.close()
+            if not file.filename or file_types.resolve(upload.file_path, upload.mime_type) is None:
+                remove_upload(upload.file_path)
+                rejected.append({'filename': file.filename, 'mime_type': upload.mime_type})
+                continue
+            job_id = ingestion_queue.enqueue(upload.file_path, content_hash=upload.content_hash,
+                                             mime_type=upload.mime_type, workspace=workspace)
+            jobs.append({'filename': file.filename, 'job_id': job_id, 'status_url': f"/jobs/{job_id}",
+                         'content_hash': upload.content_hash, 'mime_type': upload.mime_type, 'size': upload.size})
+        if not jobs:
+            return jsonify({'error': 'No supported file selected for uploading', 'rejected': rejected}), 400
+
+        response = {'message': f"{len(jobs)} document(s) queued for indexing", 'jobs': jobs, 'rejected': rejected}
+        if len(jobs) == 1:
+            response.update(job_id=jobs[0]['job_id'], status_url=jobs[0]['status_url'])
+        return jsonify(response), 202
     except Exception as e:
         print(f"Error during file upload: {e}")
+        if request.upload_batch is not None and not jobs:
+            request.upload_batch.discard()
         return jsonify({'error': f"Internal server error: {str(e)}"}), 500
 
+@app.route('/jobs/metrics', methods=['GET'])
+def ingestion_metrics():
+    """Report ingestion queue depth, job counters and average stage timings."""
+    return jsonify(ingestion_queue.metrics()), 200
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def ingestion_job(job_id):
+    """Report the status, current stage and progress of an ingestion job."""
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': f"Job {job_id} not found."}), 404
+    return jsonify(job), 200
+
 @app.route('/retrieve', methods=['POST'])
-def retrieve_document():
+async def retrieve_document():
     node_id = request.json.get('node_id')
     query = request.json.get('query')
     content_keys = request.json.get('content_keys')
+    mode = request.json.get('mode')  # "vector", "hybrid" or "prefilter"; RETRIEVAL_MODE if omitted
     if not query:
         return jsonify({'error': 'Query is required'}), 400
-    answer, status_code = doc_service.retrieve_document(query, content_keys=content_keys, node_id=node_id)
-    if status_code == 200:
-        return jsonify({'answer': answer}), 200
-    else:
-        return jsonify({'error': answer}), status_code
+    doc_service.sync_index_versions(ingestion_queue.index_versions())
+    answer, status_code, timings = await doc_service.retrieve_document(query, content_keys=content_keys,
+                                                                       node_id=node_id, mode=mode)
+    response = jsonify({'answer': answer} if status_code == 200 else {'error': answer})
+    # Per-stage durations (store_query, embed, search, fetch, generate) for browser dev tools and load tests
+    response.headers['Server-Timing'] = server_timing(timings)
+    return response, status_code
+
+@app.route('/retrieve_batch', methods=['POST'])
+def retrieve_batch():
+    """Retrieve documents for several queries in one round trip; no answer is generated."""
+    queries = request.json.get('queries')
+    content_keys = request.json.get('content_keys')
+    k = int(request.json.get('k', 1))
+    if not queries or not isinstance(queries, list):
+        return jsonify({'error': 'A list of queries is required'}), 400
+    try:
+        doc_service.sync_index_versions(ingestion_queue.index_versions())
+        results = doc_service.retriever.retrieve_many(queries, content_keys=content_keys, k=k)
+    except Exception as e:
+        return jsonify({'error': f"Error retrieving documents: {e}"}), 500
+    return jsonify({'results': [
+        {'query': query, 'documents': [{'doc_id': doc.metadata.get('doc_id'), 'doc_type': doc.metadata.get('doc_type'),
+                                        'content': doc.page_content} for doc in docs]}
+        for query, docs in zip(queries, results)
+    ]}), 200
+
+@app.route('/embedding_cache_stats', methods=['GET'])
+def embedding_cache_stats():
+    """Report hit/miss counters of the shared embedding cache."""
+    embeddings = get_embeddings()
+    if not hasattr(embeddings, 'stats'):
+        return jsonify({'error': 'Embedding cache is disabled.'}), 404
+    return jsonify(embeddings.stats()), 200
+
+@app.route('/query_cache_stats', methods=['GET'])
+def query_cache_stats():
+    """Report hit/miss counters of the query vector cache used by /retrieve."""
+    return jsonify(get_query_cache().stats()), 200
+
+@app.route('/result_cache_stats', methods=['GET'])
+def result_cache_stats():
+    """Report hit/miss counters of the semantic cache of retrieval results."""
+    return jsonify(get_result_cache().stats()), 200
+
+@app.route('/document_cache_stats', methods=['GET'])
+def document_cache_stats():
+    """Report hit/miss counters and size of the local cache of documents fetched from S3."""
+    return jsonify(get_document_cache().stats()), 200
 
 @app.route('/cleanup', methods=['POST'])
 def cleanup():
@@ -128,11 +285,14 @@ def shutdown():
 @app.route('/download_vectorized_db', methods=['POST'])
 def download_vectorized_db():
     """Download all documents from the S3 'files' folder to the local web server."""
-    s3_handler = S3Handler()
+    s3_handler = get_s3_handler()
 
     try:
-        success = s3_handler.download_file(folder_prefix="vectorized_db", dst_folder=LOCAL_FOLDER )
+        # Restore changed blocks from the sync manifest; buckets without one still hold the full files
+        success = VectorDBSync(LOCAL_FOLDER, s3_handler).pull() is not None \
+            or s3_handler.download_file(folder_prefix="vectorized_db", dst_folder=LOCAL_FOLDER)
         if success:
+            doc_service.reload_vector_db()
             return jsonify({'message': 'All files downloaded successfully.'}), 200
         else:
             return jsonify({'error': 'No files found or download failed.'}), 404
@@ -143,7 +303,7 @@ def download_vectorized_db():
 @app.route('/read_file_list', methods=['GET'])
 def read_file_list():
     """Read list of files from the S3 'files' folder."""
-    s3_handler = S3Handler()
+    s3_handler = get_s3_handler()
 
     try:
         files = s3_handler.read_list(folder_prefix="files")
@@ -158,7 +318,7 @@ def read_file_list():
 @app.route('/delete_file', methods=['POST'])
 def delete_file():
     """Delete a file from the S3 'files' folder."""
-    s3_handler = S3Handler()
+    s3_handler = get_s3_handler()
     file_key = request.json.get('key')
 
     if not file_key:
@@ -167,14 +327,14 @@ def delete_file():
     try:
         doc_id_to_delete = os.path.splitext(os.path.basename(file_key))[0]
         vectorestore_delete_success = delete_document_by_id(doc_id_to_delete)
-        cloud_delete_success = s3_handler.delete_file(file_key)
+        # The original and the plain-text artifact extracted from it at ingest
+        cloud_delete_success = s3_handler.delete_file(file_key) and \
+            s3_handler.delete_objects(TEXT_FOLDER, [f"{doc_id_to_delete}{TEXT_SUFFIX}"])
+        if DOCUMENT_CACHE_MAX_BYTES:
+            for folder_prefix in ("files", TEXT_FOLDER):
+                get_document_cache(folder_prefix).remove(doc_id_to_delete)
         if cloud_delete_success and vectorestore_delete_success:
-            useful_files = ["chroma.sqlite3", "doc_id.json"]
-            for root, _, files in os.walk(LOCAL_FOLDER):
-                for file in files:
-                    if file in useful_files:
-                        file_path = os.path.join(root, file)
-                        s3_handler.upload_file(file_path, folder_prefix="vectorized_db", object_name=file)
+            upload_vectorized_db(LOCAL_FOLDER, s3_handler)
             return jsonify({'message': 'File deleted successfully.'}), 200
         else:
             return jsonify({'error': 'Failed to delete file.'}), 500
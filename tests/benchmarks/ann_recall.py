@@ -0,0 +1,82 @@
+"""Recall and latency of the IVF index against exact search.
+
+Builds a NumpyFlatIndex and a NumpyIVFIndex over the same synthetic clustered
+unit vectors (no embedding calls), then reports recall@k of the IVF index
+against the exact results together with p50/p99 search latency for each nprobe:
+
+    python -m tests.benchmarks.ann_recall
+    python -m tests.benchmarks.ann_recall --rows 1000000 --dim 256 --nprobe 4 8 16 32 64
+"""
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from services.common.flat_index import NumpyFlatIndex, _normalize_rows
+from services.common.ivf_index import NumpyIVFIndex
+
+
+def clustered_vectors(rows, dim, clusters, seed=0, spread=0.35):
+    """Unit vectors scattered around `clusters` random centers, like embeddings of topical documents."""
+    rng = np.random.default_rng(seed)
+    centers = _normalize_rows(rng.standard_normal((clusters, dim)).astype(np.float32))
+    vectors = centers[rng.integers(clusters, size=rows)] + spread * rng.standard_normal((rows, dim)).astype(np.float32) / np.sqrt(dim)
+    return _normalize_rows(vectors.astype(np.float32))
+
+
+def build(index_class, folder, vectors, **kwargs):
+    index = index_class(None, folder, collection_name="benchmark", compact_rows=len(vectors) + 1, **kwargs)
+    start = time.perf_counter()
+    index.add_embeddings([(str(i), vector) for i, vector in enumerate(vectors)], ids=[str(i) for i in range(len(vectors))])
+    index.compact()
+    return index, time.perf_counter() - start
+
+
+def run_queries(index, queries, k, **kwargs):
+    """Return the ids found for each query and the latency of each search in ms."""
+    found, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results = index.similarity_search_by_vector_with_scores(query, k=k, **kwargs)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append({doc.id for doc, _ in results})
+    return found, np.array(latencies)
+
+
+def report(label, latencies, recall=None):
+    line = f"{label:<16} p50 {np.percentile(latencies, 50):>8.2f} ms   p99 {np.percentile(latencies, 99):>8.2f} ms"
+    if recall is not None:
+        line += f"   recall@k {recall:.3f}"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare IVF recall and latency with exact search.")
+    parser.add_argument("--rows", type=int, default=100000, help="Vectors in the index")
+    parser.add_argument("--dim", type=int, default=128, help="Vector dimension")
+    parser.add_argument("--clusters", type=int, default=512, help="Topics the synthetic vectors are drawn around")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per configuration")
+    parser.add_argument("--k", type=int, default=10, help="Results per query")
+    parser.add_argument("--lists", type=int, default=0, help="IVF lists, 0 for about sqrt(rows)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32], help="nprobe values to test")
+    args = parser.parse_args()
+
+    vectors = clustered_vectors(args.rows, args.dim, args.clusters)
+    queries = clustered_vectors(args.queries, args.dim, args.clusters, seed=1)
+    with tempfile.TemporaryDirectory() as flat_folder, tempfile.TemporaryDirectory() as ivf_folder:
+        flat, flat_build = build(NumpyFlatIndex, flat_folder, vectors)
+        ivf, ivf_build = build(NumpyIVFIndex, ivf_folder, vectors, n_lists=args.lists)
+        print(f"{args.rows} vectors x {args.dim} dims: exact build {flat_build:.1f} s, IVF build {ivf_build:.1f} s "
+              f"({ivf.stats().get('n_lists', 0)} lists)")
+
+        exact, latencies = run_queries(flat, queries, args.k)
+        report("exact", latencies)
+        for nprobe in args.nprobe:
+            found, latencies = run_queries(ivf, queries, args.k, nprobe=nprobe)
+            recall = np.mean([len(ann & truth) / len(truth) for ann, truth in zip(found, exact) if truth])
+            report(f"ivf nprobe={nprobe}", latencies, recall)
+
+
+if __name__ == "__main__":
+    main()
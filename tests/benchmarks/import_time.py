@@ -0,0 +1,123 @@
+"""Cold-start import time report.
+
+Imports each module in a fresh interpreter with ``python -X importtime`` and
+reports the total import time together with the slowest top-level packages it
+pulled in. Use it to track start-up regressions of the server and the Lambda
+packages:
+
+    python -m tests.benchmarks.import_time
+    python -m tests.benchmarks.import_time services.retrieval.app --top 15
+    python -m tests.benchmarks.import_time lambda_function --cwd services/Text_Generation
+    python -m tests.benchmarks.import_time --save import_baseline.json
+    python -m tests.benchmarks.import_time --baseline import_baseline.json --max-regression 0.25
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from collections import defaultdict
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_MODULES = [
+    "services.retrieval.app",
+    "services.indexing.app",
+    "services.indexing.job_queue",
+    "services.indexing.file_processing_states",
+]
+
+
+def measure(module, cwd=ROOT_DIR, repeat=3):
+    """Import module `repeat` times in fresh interpreters and keep the fastest run.
+
+    :return: (total_us, {top-level package: cumulative_us}) of the fastest run.
+    """
+    best = None
+    for _ in range(repeat):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [cwd, ROOT_DIR, os.environ.get("PYTHONPATH")])))
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=cwd, env=env, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+        total, packages = parse_importtime(completed.stderr, module)
+        if best is None or total < best[0]:
+            best = (total, packages)
+    return best
+
+
+def parse_importtime(stderr, module):
+    """Parse `-X importtime` output.
+
+    :return: (total_us, {package: cumulative_us}) where total is the time of the
+             top-level imports and each package is charged with the cumulative
+             time of the imports that entered it from another package.
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_part, name = line[len("import time:"):].split("|")
+        entries.append((len(name) - len(name.lstrip()), name.strip(), int(cumulative_part)))
+
+    packages = defaultdict(int)
+    total = 0
+    stack = []  # (depth, package) of the enclosing imports
+    # Children are printed before their parent, so walk the report backwards
+    for depth, name, cumulative in reversed(entries):
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        package = name.split(".")[0]
+        if not stack:
+            total += cumulative
+        if not stack or stack[-1][1] != package:
+            packages[package] += cumulative
+        stack.append((depth, package))
+    packages.pop(module.split(".")[0], None)
+    return total, dict(packages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report cold-start import time of service modules.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="Modules to import")
+    parser.add_argument("--cwd", default=ROOT_DIR, help="Directory to import from (e.g. a Lambda package folder)")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per module; the fastest run is kept")
+    parser.add_argument("--top", type=int, default=8, help="Slowest packages to list per module")
+    parser.add_argument("--save", help="Write the totals (ms) to this JSON file")
+    parser.add_argument("--baseline", help="Compare against totals saved with --save")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Exit non-zero if a module got slower than baseline by more than this fraction")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    totals = {}
+    regressions = []
+    for module in args.modules:
+        total_us, packages = measure(module, cwd=os.path.abspath(args.cwd), repeat=args.repeat)
+        totals[module] = round(total_us / 1000, 1)
+        line = f"{module:<45} {totals[module]:>9.1f} ms"
+        if module in baseline:
+            change = (totals[module] - baseline[module]) / baseline[module] if baseline[module] else 0.0
+            line += f"   ({change:+.0%} vs baseline {baseline[module]:.1f} ms)"
+            if change > args.max_regression:
+                regressions.append(module)
+        print(line)
+        for name, cumulative_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {name:<41} {cumulative_us / 1000:>9.1f} ms")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(totals, f, indent=4)
+    if regressions:
+        print(f"Import time regressed by more than {args.max_regression:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
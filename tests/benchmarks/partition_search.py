@@ -0,0 +1,66 @@
+"""Latency of a workspace search with a doc_id $in filter on one collection against per-workspace partitions.
+
+Builds, for each size, one NumpyFlatIndex holding every workspace's vectors and
+one NumpyFlatIndex per workspace over the same synthetic vectors (no embedding
+calls), then reports p50/p99 latency of searching one workspace's documents:
+the global index with {"doc_id": {"$in": <all doc_ids of the workspace>}} as
+the retriever did before PARTITION_BY=workspace, and the workspace partition
+without a filter:
+
+    python -m tests.benchmarks.partition_search
+    python -m tests.benchmarks.partition_search --rows 10000 100000 1000000 --workspaces 100
+"""
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from services.common.flat_index import NumpyFlatIndex
+from tests.benchmarks.ann_recall import clustered_vectors, report
+
+
+def build(folder, vectors, doc_ids):
+    index = NumpyFlatIndex(None, folder, collection_name="benchmark", compact_rows=len(vectors) + 1)
+    index.add_embeddings([(doc_id, vector) for doc_id, vector in zip(doc_ids, vectors)],
+                         metadatas=[{"doc_id": doc_id} for doc_id in doc_ids], ids=doc_ids)
+    index.compact()
+    return index
+
+
+def time_searches(index, queries, k, **kwargs):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.similarity_search_by_vector_with_scores(query, k=k, **kwargs)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare filtered global search with per-workspace partitions.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000], help="Total vectors, one run per value")
+    parser.add_argument("--dim", type=int, default=128, help="Vector dimension")
+    parser.add_argument("--workspaces", type=int, default=50, help="Workspaces the vectors are spread over")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per configuration")
+    parser.add_argument("--k", type=int, default=5, help="Results per query")
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        vectors = clustered_vectors(rows, args.dim, clusters=256)
+        queries = clustered_vectors(args.queries, args.dim, clusters=256, seed=1)
+        workspaces = np.arange(rows) % args.workspaces
+        doc_ids = [f"ws{workspace}-doc{i}" for i, workspace in enumerate(workspaces)]
+        target = np.flatnonzero(workspaces == 0)
+        target_ids = [doc_ids[i] for i in target]
+        with tempfile.TemporaryDirectory() as global_folder, tempfile.TemporaryDirectory() as partition_folder:
+            global_index = build(global_folder, vectors, doc_ids)
+            partition = build(partition_folder, vectors[target], target_ids)
+            print(f"{rows} vectors x {args.dim} dims in {args.workspaces} workspaces "
+                  f"({len(target_ids)} vectors per workspace)")
+            report("global + $in", time_searches(global_index, queries, args.k, filter={"doc_id": {"$in": target_ids}}))
+            report("partition", time_searches(partition, queries, args.k))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import json
+import threading
+from services.common.document_registry import DocumentRegistry
+
+
+def test_add_get_and_remove(tmpdir):
+    registry = DocumentRegistry(str(tmpdir))
+    registry.add("doc-1", name="a.txt", doc_type="txt", content_hash="h1", size=10)
+
+    record = registry.get("doc-1")
+    assert record["name"] == "a.txt" and record["size"] == 10 and record["indexed_at"] > 0
+    assert "doc-1" in registry and len(registry) == 1
+    assert registry.find_by_hash("h1") == "doc-1"
+
+    assert registry.remove("doc-1") is True
+    assert registry.remove("doc-1") is False
+    assert registry.find_by_hash("h1") is None
+
+
+def test_partial_update_keeps_existing_fields(tmpdir):
+    registry = DocumentRegistry(str(tmpdir))
+    registry.add("doc-1", name="a.txt", size=10)
+    registry.add("doc-1", content_hash="h1")
+
+    record = registry.get("doc-1")
+    assert (record["name"], record["size"], record["content_hash"]) == ("a.txt", 10, "h1")
+
+
+def test_concurrent_writers(tmpdir):
+    registry = DocumentRegistry(str(tmpdir))
+    threads = [
+        threading.Thread(target=lambda n=n: [registry.add(f"doc-{n}-{i}") for i in range(50)])
+        for n in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(registry) == 200
+    assert len(DocumentRegistry(str(tmpdir))) == 200
+
+
+def test_migrates_json_files_once(tmpdir):
+    tmpdir.join("doc_id.json").write(json.dumps(["doc-1", "doc-2"]))
+    tmpdir.join("content_hashes.json").write(json.dumps({"h1": "doc-1"}))
+
+    registry = DocumentRegistry(str(tmpdir))
+
+    assert sorted(registry.doc_ids()) == ["doc-1", "doc-2"]
+    assert registry.find_by_hash("h1") == "doc-1"
+    assert not tmpdir.join("doc_id.json").exists()
+    assert tmpdir.join("doc_id.json.migrated").exists()
+    assert registry.migrate_json() == 0
+
+
+def test_workspace_scopes_hash_lookup(tmpdir):
+    registry = DocumentRegistry(str(tmpdir))
+    registry.add("doc-1", content_hash="h1", workspace="acme")
+    registry.add("doc-2", content_hash="h1", workspace="globex")
+    registry.add("doc-3", content_hash="h2")
+
+    assert registry.find_by_hash("h1", workspace="acme") == "doc-1"
+    assert registry.find_by_hash("h1", workspace="globex") == "doc-2"
+    assert registry.find_by_hash("h2") == "doc-3" and registry.find_by_hash("h2", workspace="acme") is None
+    assert registry.workspaces(["doc-1", "doc-3", "missing"]) == {"doc-1": "acme", "doc-3": None}
+    assert registry.count("acme") == 1 and registry.count() == 1
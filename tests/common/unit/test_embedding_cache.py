@@ -0,0 +1,53 @@
+import pytest
+from unittest.mock import MagicMock
+from services.common.embeddings import CachedEmbeddings, SQLiteEmbeddingStore
+
+
+@pytest.fixture
+def underlying():
+    """Fake embedding model returning a vector derived from the text length"""
+    model = MagicMock()
+    model.model = "fake-model"
+    model.embed_documents.side_effect = lambda texts: [[float(len(t)), 1.0] for t in texts]
+    model.embed_query.side_effect = lambda text: [float(len(text)), 1.0]
+    return model
+
+
+def test_repeated_query_served_from_cache(underlying, tmpdir):
+    embeddings = CachedEmbeddings(underlying, SQLiteEmbeddingStore(str(tmpdir.join("cache.sqlite3"))))
+
+    assert embeddings.embed_query("hello") == [5.0, 1.0]
+    assert embeddings.embed_query("hello") == [5.0, 1.0]
+    assert underlying.embed_query.call_count == 1
+    assert embeddings.stats()["hits"] == 1
+    assert embeddings.stats()["misses"] == 1
+
+
+def test_only_misses_are_embedded_in_one_batch(underlying, tmpdir):
+    embeddings = CachedEmbeddings(underlying, SQLiteEmbeddingStore(str(tmpdir.join("cache.sqlite3"))))
+    embeddings.embed_documents(["a", "bb"])
+
+    vectors = embeddings.embed_documents(["a", "ccc", "bb", "ccc"])
+
+    assert vectors == [[1.0, 1.0], [3.0, 1.0], [2.0, 1.0], [3.0, 1.0]]
+    assert underlying.embed_documents.call_args_list[-1].args[0] == ["ccc"]
+
+
+def test_cache_persists_across_instances(underlying, tmpdir):
+    path = str(tmpdir.join("cache.sqlite3"))
+    CachedEmbeddings(underlying, SQLiteEmbeddingStore(path)).embed_documents(["persisted"])
+
+    reopened = CachedEmbeddings(underlying, SQLiteEmbeddingStore(path))
+    reopened.embed_query("persisted")
+    assert reopened.stats()["hits"] == 1
+
+
+def test_store_evicts_least_recently_used(tmpdir):
+    store = SQLiteEmbeddingStore(str(tmpdir.join("cache.sqlite3")), max_entries=2)
+    store.mset([("k1", [1.0])])
+    store.mset([("k2", [2.0])])
+    store.mget(["k1"])  # k1 becomes most recently used
+    store.mset([("k3", [3.0])])
+
+    assert len(store) == 2
+    assert store.mget(["k1", "k2", "k3"]) == [[1.0], None, [3.0]]
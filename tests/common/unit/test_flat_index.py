@@ -0,0 +1,96 @@
+import os
+import numpy as np
+from langchain_core.documents import Document
+from services.common.flat_index import NumpyFlatIndex
+from services.common.local_embeddings import HashingEmbeddings
+
+TEXTS = ["Our warranty covers parts for two years.", "Shipping takes five business days.",
+         "Refunds are issued to the original payment method."]
+METADATAS = [{"doc_id": "a"}, {"doc_id": "b"}, {"doc_id": "c"}]
+
+
+def make_index(folder, **kwargs):
+    index = NumpyFlatIndex(HashingEmbeddings(dim=64), str(folder), **kwargs)
+    index.add_texts(TEXTS, METADATAS, ids=["a", "b", "c"])
+    return index
+
+
+def test_top_k_matches_brute_force(tmpdir):
+    embeddings = HashingEmbeddings(dim=64)
+    texts = [f"document {i} about topic {i % 7}" for i in range(200)]
+    index = NumpyFlatIndex(embeddings, str(tmpdir))
+    index.add_texts(texts, ids=[str(i) for i in range(200)])
+
+    query = embeddings.embed_query("document about topic 3")
+    vectors = np.array(embeddings.embed_documents(texts))
+    expected = np.argsort(-(vectors @ np.array(query)), kind="stable")[:5]
+
+    results = index.similarity_search_by_vector_with_scores(query, k=5)
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+    assert np.allclose(scores, (vectors @ np.array(query))[expected], atol=1e-5)
+
+
+def test_doc_id_filter_restricts_results(tmpdir):
+    index = make_index(tmpdir)
+
+    results = index.similarity_search("how long does shipping take", k=3, filter={"doc_id": {"$in": ["a", "c"]}})
+
+    assert {doc.metadata["doc_id"] for doc in results} == {"a", "c"}
+    assert index.similarity_search("shipping", k=3, filter={"doc_id": {"$in": ["missing"]}}) == []
+    assert index.similarity_search("how long does shipping take", k=1)[0].page_content == TEXTS[1]
+
+
+def test_delete_and_upsert(tmpdir):
+    index = make_index(tmpdir)
+
+    assert index.delete(ids=["b"])
+    index.add_documents([Document(page_content="Returns are free.", metadata={"doc_id": "a"})], ids=["a"])
+
+    assert index.count() == 2
+    assert index.get_by_ids(["a", "b"])[0].page_content == "Returns are free."
+    assert "b" not in {doc.id for doc in index.similarity_search("shipping", k=3)}
+
+
+def test_delete_where_metadata_matches(tmpdir):
+    index = make_index(tmpdir)
+    index.add_texts(["Second passage of c."], [{"doc_id": "c"}], ids=["c-1"])
+
+    assert index.delete(where={"doc_id": "c"})
+    assert {doc.id for doc in index.similarity_search("passage", k=4)} == {"a", "b"}
+    assert not index.delete(where={"doc_id": "c"})
+
+
+def test_reopen_replays_log_and_compacts(tmpdir):
+    index = make_index(tmpdir, compact_rows=4)
+    index.delete(ids=["c"])  # fourth log entry: folded into generation 1
+
+    assert os.path.exists(os.path.join(str(tmpdir), "vectors-1.npy"))
+    assert isinstance(NumpyFlatIndex(HashingEmbeddings(dim=64), str(tmpdir))._vectors, np.memmap)
+    index.add_texts(["Gift cards never expire."], [{"doc_id": "d"}], ids=["d"])
+
+    reopened = NumpyFlatIndex(HashingEmbeddings(dim=64), str(tmpdir))
+    assert reopened.count() == 3
+    assert reopened.similarity_search("gift cards", k=1)[0].id == "d"
+
+
+def test_reader_sees_writes_of_another_handle(tmpdir):
+    reader = make_index(tmpdir)
+    writer = NumpyFlatIndex(HashingEmbeddings(dim=64), str(tmpdir))
+
+    writer.delete(ids=["a"])
+
+    assert reader.get_by_ids(["a"]) == []
+    assert reader.count() == 2
+
+
+def test_batched_search_matches_single_searches(tmpdir):
+    index = make_index(tmpdir)
+    embeddings = HashingEmbeddings(dim=64)
+    queries = [embeddings.embed_query(text) for text in ("shipping days", "warranty parts", "refund payment")]
+
+    batched = index.similarity_search_by_vectors_with_scores(queries, k=2, filter={"doc_id": {"$in": ["a", "b", "c"]}})
+
+    assert [[(doc.id, round(score, 5)) for doc, score in results] for results in batched] == \
+        [[(doc.id, round(score, 5)) for doc, score in index.similarity_search_by_vector_with_scores(query, k=2)]
+         for query in queries]
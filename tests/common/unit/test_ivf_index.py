@@ -0,0 +1,56 @@
+import numpy as np
+from services.common.ivf_index import NumpyIVFIndex
+from services.common.local_embeddings import HashingEmbeddings
+from tests.benchmarks.ann_recall import clustered_vectors
+
+
+def make_index(folder, rows=2000, **kwargs):
+    vectors = clustered_vectors(rows, 32, 20)
+    index = NumpyIVFIndex(None, str(folder), compact_rows=rows + 1, n_lists=16, min_train_rows=10, **kwargs)
+    index.add_embeddings([(str(i), vector) for i, vector in enumerate(vectors)],
+                         [{"doc_id": f"doc{i % 50}"} for i in range(rows)], ids=[str(i) for i in range(rows)])
+    return index, vectors
+
+
+def test_untrained_index_is_exact(tmpdir):
+    index, vectors = make_index(tmpdir)
+
+    results = index.similarity_search_by_vector_with_scores(vectors[7], k=1)
+
+    assert index.stats()["trained"] is False
+    assert results[0][0].id == "7"
+
+
+def test_compaction_trains_lists_and_nprobe_controls_recall(tmpdir):
+    index, vectors = make_index(tmpdir)
+    index.compact()
+    queries = clustered_vectors(20, 32, 20, seed=1)
+    exact = [set(np.argsort(-(vectors @ query))[:10].astype(str)) for query in queries]
+
+    def recall(nprobe):
+        found = [{doc.id for doc in index.similarity_search_by_vector(query, k=10, nprobe=nprobe)} for query in queries]
+        return np.mean([len(ann & truth) / 10 for ann, truth in zip(found, exact)])
+
+    assert index.stats()["n_lists"] == 16
+    assert recall(16) == 1.0
+    assert recall(1) <= recall(4) <= recall(16)
+
+
+def test_inserts_and_deletes_after_training_survive_reopen(tmpdir):
+    index, vectors = make_index(tmpdir)
+    index.compact()
+    index.add_embeddings([("new", vectors[3])], [{"doc_id": "new"}], ids=["new"])
+    index.delete(ids=["3"])
+
+    reopened = NumpyIVFIndex(None, str(tmpdir), n_lists=16, nprobe=2)
+    results = reopened.similarity_search_by_vector(vectors[3], k=1)
+
+    assert results[0].id == "new"
+    assert reopened.similarity_search_by_vector(vectors[3], k=5, filter={"doc_id": {"$in": ["doc3"]}})[0].id != "3"
+
+
+def test_texts_are_embedded_like_the_flat_index(tmpdir):
+    index = NumpyIVFIndex(HashingEmbeddings(dim=64), str(tmpdir))
+    index.add_texts(["Shipping takes five business days.", "Our warranty covers parts."], ids=["a", "b"])
+
+    assert index.similarity_search("warranty", k=1)[0].id == "b"
@@ -0,0 +1,40 @@
+from services.common.keyword_index import KeywordIndex, tokenize, iter_terms
+
+DOCS = {
+    "manual": "Replace filter part AB-1234 when error E42 appears on the display.",
+    "faq": "The display shows the battery level. Charge the battery overnight.",
+    "policy": "Returns are accepted within thirty days of purchase.",
+}
+
+
+def make_index(tmpdir):
+    index = KeywordIndex(str(tmpdir))
+    for doc_id, text in DOCS.items():
+        index.add_document(doc_id, text)
+    return index
+
+
+def test_tokenize_keeps_compound_tokens_and_parts():
+    assert tokenize("Part AB-1234, v2.1") == ["part", "ab-1234", "ab", "1234", "v2.1", "v2", "1"]
+
+
+def test_segments_do_not_split_tokens():
+    assert list(iter_terms(["error code 0x8007", "0005 occurred"])) == tokenize("error code 0x80070005 occurred")
+
+
+def test_exact_identifier_ranks_first(tmpdir):
+    index = make_index(tmpdir)
+
+    assert index.search("AB-1234")[0][0] == "manual"
+    assert [doc_id for doc_id, _ in index.search("battery display")][:2] == ["faq", "manual"]
+    assert index.search("battery", doc_ids=["manual", "policy"]) == []
+
+
+def test_reindex_and_remove_update_document_frequencies(tmpdir):
+    index = make_index(tmpdir)
+    index.add_document("faq", iter(["Charge the ", "battery."]))
+
+    assert len(index) == 3
+    assert index.remove("manual") and not index.remove("manual")
+    assert index.search("display") == []
+    assert index.connection.execute("SELECT df FROM terms WHERE term = 'battery'").fetchone() == (1,)
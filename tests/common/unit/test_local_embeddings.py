@@ -0,0 +1,37 @@
+import numpy as np
+from langchain_chroma import Chroma
+from services.common.embeddings import build_embeddings, CachedEmbeddings
+from services.common.local_embeddings import HashingEmbeddings
+
+
+def test_vectors_are_deterministic_and_normalized():
+    embeddings = HashingEmbeddings(dim=64)
+    vectors = np.array(embeddings.embed_documents(["The warranty covers parts", "", "the WARRANTY covers parts"]))
+
+    assert vectors.shape == (3, 64)
+    assert np.allclose(np.linalg.norm(vectors[[0, 2]], axis=1), 1.0)
+    assert not vectors[1].any()  # no tokens, zero vector
+    assert np.allclose(vectors[0], vectors[2])  # case-insensitive
+    assert np.allclose(HashingEmbeddings(dim=64).embed_query("The warranty covers parts"), vectors[0])
+
+
+def test_batches_match_single_queries():
+    embeddings = HashingEmbeddings(dim=128, batch_size=2)
+    texts = [f"document number {i} about shipping" for i in range(5)]
+
+    assert np.allclose(embeddings.embed_documents(texts), [embeddings.embed_query(text) for text in texts])
+
+
+def test_lexical_overlap_ranks_first(tmpdir):
+    texts = ["Our warranty covers parts for two years.", "Shipping takes five business days.",
+             "Refunds are issued to the original payment method."]
+    store = Chroma(collection_name="offline", embedding_function=HashingEmbeddings(),
+                   persist_directory=str(tmpdir))
+    store.add_texts(texts, ids=["a", "b", "c"])
+
+    assert store.similarity_search("how long does shipping take", k=1)[0].page_content == texts[1]
+
+
+def test_hashing_backend_skips_cache():
+    embeddings = build_embeddings("hashing")
+    assert isinstance(embeddings, HashingEmbeddings) and not isinstance(embeddings, CachedEmbeddings)
@@ -0,0 +1,159 @@
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock
+from services.common.rate_limiter import (
+    TokenBucket, AIMDLimiter, RateScheduler, ScheduledEmbeddings, RateLimited, INTERACTIVE, BULK
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimitError(Exception):
+    """Stand-in for openai.RateLimitError"""
+    status_code = 429
+
+    def __init__(self, retry_after=None):
+        super().__init__("429 Too Many Requests")
+        self.response = MagicMock(headers={"retry-after-ms": str(retry_after * 1000)} if retry_after else {})
+
+
+def test_token_bucket_refills_over_time():
+    clock = FakeClock()
+    bucket = TokenBucket(per_minute=60, clock=clock)
+    bucket.take(60)
+
+    assert bucket.wait_time(30) == pytest.approx(30.0)
+    clock.now = 10
+    assert bucket.wait_time(10) == 0
+    assert bucket.wait_time(10, floor=5) == pytest.approx(5.0)
+    assert bucket.wait_time(1000) == pytest.approx(50.0)  # oversized requests wait for a full bucket
+
+
+def test_aimd_grows_additively_and_halves_on_congestion():
+    clock = FakeClock()
+    limiter = AIMDLimiter(initial=4, maximum=8, latency_target=10, cooldown=5, clock=clock)
+    for _ in range(4):
+        limiter.on_success(latency=1)
+    assert limiter.current == 4 and limiter.limit > 4.9
+
+    limiter.on_congestion()
+    limiter.on_congestion()  # within the cooldown: one signal
+    assert limiter.current == 2
+    clock.now = 6
+    limiter.on_success(latency=30)  # too slow counts as congestion
+    assert limiter.current == 1
+
+
+def test_rate_limited_call_is_retried_and_shrinks_concurrency():
+    scheduler = RateScheduler("test", rpm=6000, tpm=10 ** 6, initial_concurrency=8, backoff_base=0.01)
+    outcomes = [RateLimitError(retry_after=0.01), RateLimitError(), "ok"]
+
+    def call():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert scheduler.call(call, tokens=10) == "ok"
+    stats = scheduler.stats()
+    assert stats["throttled"] == 2 and stats["completed"] == 1
+    assert stats["concurrency_limit"] == 4  # halved once; the second 429 fell in the cooldown
+
+
+def test_gives_up_after_max_retries():
+    scheduler = RateScheduler("test", rpm=6000, tpm=10 ** 6, max_retries=1, backoff_base=0.01)
+    fn = MagicMock(side_effect=RateLimitError())
+    with pytest.raises(RateLimited):
+        scheduler.call(fn)
+    assert fn.call_count == 2
+
+
+class InternalServerError(Exception):
+    """Stand-in for openai.InternalServerError"""
+    status_code = 503
+
+
+class APIConnectionError(Exception):
+    """Stand-in for openai.APIConnectionError, which carries no status code"""
+
+
+def test_transient_errors_are_retried_without_shrinking_concurrency():
+    scheduler = RateScheduler("test", rpm=6000, tpm=10 ** 6, initial_concurrency=8, backoff_base=0.01)
+    fn = MagicMock(side_effect=[InternalServerError(), APIConnectionError(), TimeoutError(), "ok"])
+
+    assert scheduler.call(fn, tokens=10) == "ok"
+    stats = scheduler.stats()
+    assert stats["retried"] == 3 and stats["throttled"] == 0 and stats["completed"] == 1
+    assert stats["concurrency_limit"] == 8 and stats["in_flight"] == 0
+
+
+def test_transient_error_is_raised_after_max_retries():
+    scheduler = RateScheduler("test", rpm=6000, tpm=10 ** 6, max_retries=1, backoff_base=0.01)
+    fn = MagicMock(side_effect=InternalServerError())
+    with pytest.raises(InternalServerError):
+        scheduler.call(fn)
+    assert fn.call_count == 2 and scheduler.stats()["in_flight"] == 0
+
+
+def test_other_errors_release_the_slot():
+    scheduler = RateScheduler("test", rpm=6000, tpm=10 ** 6)
+    with pytest.raises(ValueError):
+        scheduler.call(MagicMock(side_effect=ValueError("bad request")))
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_interactive_calls_overtake_waiting_bulk_calls():
+    scheduler = RateScheduler("test", rpm=6000, tpm=10 ** 6, initial_concurrency=1, max_concurrency=1)
+    order = []
+    scheduler.acquire(1, BULK)  # occupy the only slot
+
+    def run(name, priority):
+        scheduler.call(lambda: order.append(name), priority=priority)
+
+    bulk = threading.Thread(target=run, args=("bulk", BULK))
+    bulk.start()
+    time.sleep(0.05)
+    interactive = threading.Thread(target=run, args=("interactive", INTERACTIVE))
+    interactive.start()
+    time.sleep(0.05)
+    scheduler.release(latency=0.1)
+    bulk.join(5)
+    interactive.join(5)
+
+    assert order == ["interactive", "bulk"]
+
+
+def test_bulk_leaves_reserve_after_interactive_traffic():
+    clock = FakeClock()
+    scheduler = RateScheduler("test", rpm=100, tpm=1000, interactive_reserve=0.2, reserve_window=60, clock=clock)
+    assert scheduler._wait_time(900, BULK) == 0  # no live traffic: bulk may use the full budget
+
+    scheduler.call(lambda: None, tokens=10, priority=INTERACTIVE)
+    assert scheduler._wait_time(900, BULK) > 0
+    assert scheduler._wait_time(790, BULK) == 0
+    clock.now = 61
+    assert scheduler._wait_time(900, BULK) == 0
+
+
+def test_scheduled_embeddings_pack_batches():
+    underlying = MagicMock(model="fake-embedding")
+    underlying.embed_documents.side_effect = lambda texts: [[float(len(text))] for text in texts]
+    underlying.embed_query.side_effect = lambda text: [0.0]
+    scheduler = RateScheduler("test", rpm=6000, tpm=10 ** 6)
+    embeddings = ScheduledEmbeddings(underlying, scheduler, batch_size=3, batch_tokens=10,
+                                     count_tokens=lambda text: len(text))
+    texts = ["a", "bb", "ccc", "dddd", "eeeeeeeeee", "f", "g", "h"]
+
+    assert embeddings.embed_documents(texts) == [[float(len(text))] for text in texts]
+    batches = sorted(call.args[0] for call in underlying.embed_documents.call_args_list)
+    assert batches == sorted([["a", "bb", "ccc"], ["dddd"], ["eeeeeeeeee"], ["f", "g", "h"]])
+    assert embeddings.model == "fake-embedding"
+    embeddings.embed_query("q")
+    assert scheduler.stats()["completed"] == 5
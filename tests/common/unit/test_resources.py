@@ -0,0 +1,64 @@
+import threading
+from unittest.mock import MagicMock
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from services.common.resources import ResourceRegistry, get_vectorstore, release_vectorstores
+
+
+def test_registry_creates_each_handle_once_across_threads():
+    registry = ResourceRegistry()
+    factory = MagicMock(side_effect=lambda: object())
+    handles = []
+    threads = [threading.Thread(target=lambda: handles.append(registry.get("redis", factory))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert factory.call_count == 1
+    assert all(handle is handles[0] for handle in handles)
+
+
+def test_close_runs_closers_in_reverse_order_and_resets():
+    registry = ResourceRegistry()
+    closed = []
+    registry.get("first", lambda: "a", close=closed.append)
+    registry.get("second", lambda: "b", close=closed.append)
+
+    registry.close()
+
+    assert closed == ["b", "a"]
+    assert registry.get("first", lambda: "new") == "new"
+
+
+def test_discard_only_drops_matching_handles():
+    registry = ResourceRegistry()
+    closed = []
+    registry.get(("chroma", "summaries"), lambda: "store", close=closed.append)
+    registry.get("redis", lambda: "client")
+
+    registry.discard(lambda key: isinstance(key, tuple))
+
+    assert closed == ["store"]
+    assert registry.get("redis", lambda: "other") == "client"
+    assert registry.get(("chroma", "summaries"), lambda: "reopened") == "reopened"
+
+
+def test_vectorstore_is_shared_per_collection_and_folder(tmpdir):
+    embeddings = DeterministicFakeEmbedding(size=8)
+    summaries = get_vectorstore("summaries", str(tmpdir), embeddings)
+
+    assert get_vectorstore("summaries", str(tmpdir), embeddings) is summaries
+    assert get_vectorstore("chunks", str(tmpdir), embeddings) is not summaries
+
+    release_vectorstores()
+    assert get_vectorstore("summaries", str(tmpdir), embeddings) is not summaries
+
+
+def test_released_vectorstore_keeps_serving_searches(tmpdir):
+    embeddings = DeterministicFakeEmbedding(size=8)
+    old = get_vectorstore("summaries", str(tmpdir), embeddings)
+    old.add_texts(["warranty terms"], ids=["doc-1"])
+
+    release_vectorstores()  # e.g. a reload while this search is still running
+    assert [doc.page_content for doc in old.similarity_search("warranty terms", k=1)] == ["warranty terms"]
+    assert get_vectorstore("summaries", str(tmpdir), embeddings).similarity_search("warranty terms", k=1)
@@ -0,0 +1,184 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from unittest.mock import patch
+from services.common.helper import FileLock
+from services.common.document_registry import DocumentRegistry
+from services.common.vectordb_sync import VectorDBSync, MANIFEST_NAME
+
+SEGMENT_DIR = "0b1c5a7e-3f1d-4c1e-9c57-2a0f3b7d9e11"
+
+
+class InMemoryS3Handler:
+    """Stand-in for S3Handler keeping objects in a dict and counting uploads"""
+    def __init__(self):
+        self.objects = {}
+        self.uploads = []
+        self.lock = threading.Lock()
+
+    def upload_bytes(self, data, folder_prefix, object_name):
+        with self.lock:
+            self.objects[f"{folder_prefix}/{object_name}"] = bytes(data)
+            self.uploads.append(f"{folder_prefix}/{object_name}")
+        return True
+
+    def download_bytes(self, folder_prefix, object_name):
+        return self.objects.get(f"{folder_prefix}/{object_name}")
+
+    def delete_objects(self, folder_prefix, object_names):
+        for name in object_names:
+            self.objects.pop(f"{folder_prefix}/{name}", None)
+        return True
+
+    def blocks(self):
+        return [key for key in self.objects if key.startswith("vectorized_db/blocks/")]
+
+
+def write(folder, rel_path, data):
+    path = os.path.join(folder, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def read_tree(folder, rel_paths):
+    """File contents by path; SQLite databases are pushed as backup copies, so their dump is compared"""
+    tree = {}
+    for rel_path in rel_paths:
+        data = open(os.path.join(folder, rel_path), "rb").read()
+        if data.startswith(b"SQLite format 3"):
+            connection = sqlite3.connect(os.path.join(folder, rel_path))
+            data = list(connection.iterdump())
+            connection.close()
+        tree[rel_path] = data
+    return tree
+
+
+def make_db(folder):
+    write(folder, "chroma.sqlite3", b"".join(bytes([i]) * 1024 for i in range(8)))
+    write(folder, f"{SEGMENT_DIR}/data_level0.bin", b"vectors" * 100)
+    write(folder, "docstore/doc-1", b'{"page_content": "one"}')
+    write(folder, "upload.txt", b"not part of the vector db")
+
+
+def test_push_uploads_only_changed_blocks(tmpdir):
+    folder = str(tmpdir.mkdir("db"))
+    make_db(folder)
+    s3 = InMemoryS3Handler()
+    sync = VectorDBSync(folder, s3, block_size=1024, max_workers=4)
+
+    first = sync.push()
+    manifest = json.loads(s3.objects[f"vectorized_db/{MANIFEST_NAME}"])
+    assert "upload.txt" not in manifest["files"]
+    assert f"{SEGMENT_DIR}/data_level0.bin" in manifest["files"]
+    assert first["blocks_uploaded"] == len(s3.blocks())
+
+    # Rewrite one 1 KiB block of the database; nothing else may be uploaded
+    with open(os.path.join(folder, "chroma.sqlite3"), "r+b") as f:
+        f.seek(3 * 1024)
+        f.write(b"x" * 1024)
+    s3.uploads.clear()
+    second = VectorDBSync(folder, s3, block_size=1024).push()
+
+    assert second["blocks_uploaded"] == 1 and second["bytes_uploaded"] == 1024
+    assert second["changed_files"] == 1 and second["blocks_pruned"] == 1
+    assert len(s3.uploads) == 2  # the changed block and the manifest
+
+    s3.uploads.clear()
+    assert VectorDBSync(folder, s3, block_size=1024).push()["blocks_uploaded"] == 0
+    assert s3.uploads == []
+
+
+def test_pull_restores_and_removes_stale_files(tmpdir):
+    source = str(tmpdir.mkdir("source"))
+    make_db(source)
+    s3 = InMemoryS3Handler()
+    VectorDBSync(source, s3, block_size=1024).push()
+    tracked = VectorDBSync(source, s3).tracked_files()
+
+    target = str(tmpdir.mkdir("target"))
+    write(target, "docstore/deleted-doc", b"stale")
+    write(target, "chroma.sqlite3", bytes([0]) * 1024)  # first block already present locally
+    stats = VectorDBSync(target, s3, max_workers=4).pull()
+
+    assert read_tree(target, tracked) == read_tree(source, tracked)
+    assert not os.path.exists(os.path.join(target, "docstore", "deleted-doc"))
+    assert stats["files_removed"] == 1
+    assert stats["blocks_downloaded"] == len(s3.blocks()) - 1
+    assert not os.path.exists(os.path.join(target, ".sync_blocks"))
+
+
+def test_pull_without_manifest_returns_none(tmpdir):
+    assert VectorDBSync(str(tmpdir), InMemoryS3Handler()).pull() is None
+
+
+def test_push_snapshots_sqlite_files_consistently(tmpdir):
+    folder = str(tmpdir.mkdir("db"))
+    connection = sqlite3.connect(os.path.join(folder, "chroma.sqlite3"))
+    connection.execute("CREATE TABLE embeddings (id TEXT)")
+    connection.executemany("INSERT INTO embeddings VALUES (?)", [(str(i),) for i in range(1000)])
+    connection.commit()
+    connection.execute("INSERT INTO embeddings VALUES ('uncommitted')")  # a write still in progress
+    s3 = InMemoryS3Handler()
+    VectorDBSync(folder, s3, block_size=1024).push()
+    connection.rollback()
+
+    target = str(tmpdir.mkdir("target"))
+    VectorDBSync(target, s3).pull()
+    restored = sqlite3.connect(os.path.join(target, "chroma.sqlite3"))
+    assert restored.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    assert restored.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] == 1000
+    assert not [name for name in os.listdir(folder) if name.endswith(".sync_tmp")]
+
+
+def test_push_hashes_only_pages_changed_since_last_push(tmpdir):
+    folder = str(tmpdir.mkdir("db"))
+    connection = sqlite3.connect(os.path.join(folder, "chroma.sqlite3"))
+    connection.execute("CREATE TABLE embeddings (id TEXT)")
+    connection.executemany("INSERT INTO embeddings VALUES (?)", [(f"{i:0100d}",) for i in range(2000)])
+    connection.commit()
+    s3 = InMemoryS3Handler()
+    VectorDBSync(folder, s3, block_size=4096).push()
+    page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+
+    connection.execute("INSERT INTO embeddings VALUES ('new')")
+    connection.commit()
+    with patch('services.common.vectordb_sync.hashlib.sha256', wraps=hashlib.sha256) as sha256:
+        stats = VectorDBSync(folder, s3, block_size=4096).push()
+    assert 0 < sha256.call_count <= 4 < page_count
+    assert stats["blocks_uploaded"] == sha256.call_count
+
+    target = str(tmpdir.mkdir("target"))
+    VectorDBSync(target, s3).pull()
+    restored = sqlite3.connect(os.path.join(target, "chroma.sqlite3"))
+    assert restored.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] == 2001
+
+
+def test_pull_restores_sqlite_files_under_open_connections(tmpdir):
+    source = str(tmpdir.mkdir("source"))
+    DocumentRegistry.for_folder(source).add_many([("doc-1", {}), ("doc-2", {})])
+    s3 = InMemoryS3Handler()
+    VectorDBSync(source, s3).push()
+
+    target = str(tmpdir.mkdir("target"))
+    reader = DocumentRegistry(target)  # the connection another process holds
+    assert VectorDBSync(target, s3).pull()["changed_files"] == 1
+
+    assert sorted(reader.doc_ids()) == ["doc-1", "doc-2"]
+    assert VectorDBSync(target, s3).pull()["changed_files"] == 0  # the restored snapshot is reused
+    reader.close()
+
+
+def test_push_waits_for_sync_lock_of_other_process(tmpdir):
+    folder = str(tmpdir.mkdir("db"))
+    make_db(folder)
+    done = threading.Event()
+    # A second open file description, as another worker process would hold
+    with FileLock(os.path.join(folder, ".sync.lock")):
+        pusher = threading.Thread(target=lambda: (VectorDBSync(folder, InMemoryS3Handler()).push(), done.set()))
+        pusher.start()
+        assert not done.wait(0.3)
+    pusher.join(5)
+    assert done.is_set()
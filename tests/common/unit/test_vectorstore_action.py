@@ -0,0 +1,59 @@
+import os
+from unittest.mock import patch
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from services.common.document_registry import DocumentRegistry
+from services.common.resources import get_vectorstore, release_vectorstores
+from services.common.vectorstore_action import delete_document_by_id, get_documents_by_ids
+
+
+EMBEDDINGS = DeterministicFakeEmbedding(size=8)
+
+
+def chroma_store(local_folder, collection_name="summaries"):
+    """Shared handle of a real Chroma collection with offline embeddings"""
+    return get_vectorstore(collection_name, local_folder, EMBEDDINGS)
+
+
+def test_get_documents_by_ids_on_chroma(tmpdir):
+    store = chroma_store(str(tmpdir))
+    store.add_documents([Document(page_content="alpha", metadata={"doc_id": "doc-1"})], ids=["doc-1"])
+
+    docs = get_documents_by_ids(store, ["doc-1", "missing"])
+
+    assert [(doc.id, doc.page_content, doc.metadata["doc_id"]) for doc in docs] == [("doc-1", "alpha", "doc-1")]
+    release_vectorstores()
+
+
+def test_delete_document_by_id_on_chroma(tmpdir):
+    store = chroma_store(str(tmpdir))
+    store.add_documents([Document(page_content=text, metadata={"doc_id": doc_id})
+                         for doc_id, text in (("doc-1", "alpha"), ("doc-2", "beta"))], ids=["doc-1", "doc-2"])
+    DocumentRegistry.for_folder(str(tmpdir)).add("doc-1", name="a.txt")
+
+    with patch('services.common.vectorstore_action.LOCAL_FOLDER', str(tmpdir)), \
+         patch('services.common.vectorstore_action.get_vectorstore',
+               lambda collection_name, local_folder: chroma_store(local_folder, collection_name)):
+        assert delete_document_by_id("doc-1") is True
+        assert delete_document_by_id("doc-1") is None
+
+    assert [doc.id for doc in get_documents_by_ids(store, ["doc-1", "doc-2"])] == ["doc-2"]
+    assert "doc-1" not in DocumentRegistry.for_folder(str(tmpdir))
+    release_vectorstores()
+
+
+def test_delete_removes_chunks_and_parent_of_chunk_indexed_document(tmpdir):
+    chunks = chroma_store(str(tmpdir), "chunks")
+    chunks.add_documents([Document(page_content=f"passage {i}", metadata={"doc_id": doc_id, "chunk_index": i})
+                          for doc_id in ("doc-1", "doc-2") for i in range(2)],
+                         ids=[f"{doc_id}-{i}" for doc_id in ("doc-1", "doc-2") for i in range(2)])
+    tmpdir.mkdir("docstore").join("doc-1").write("parent")
+
+    with patch('services.common.vectorstore_action.LOCAL_FOLDER', str(tmpdir)), \
+         patch('services.common.vectorstore_action.get_vectorstore',
+               lambda collection_name, local_folder: chroma_store(local_folder, collection_name)):
+        assert delete_document_by_id("doc-1") is True
+
+    assert sorted(chunks.get()["ids"]) == ["doc-2-0", "doc-2-1"]
+    assert not os.path.exists(str(tmpdir.join("docstore", "doc-1")))
+    release_vectorstores()
@@ -0,0 +1,109 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from services.indexing.app import Preprocessor
+from services.indexing.batch_writer import VectorStoreBatchWriter
+
+
+def make_state(fail_read=False):
+    """Build a fake processing state that records nothing but returns fixed content"""
+    state = MagicMock()
+    state.iter_segments.side_effect = RuntimeError("read failed") if fail_read else (lambda path: iter([f"content of {path}"]))
+    state.preprocess_segments.side_effect = lambda segments: f"summary: {''.join(segments)}"
+    state.summary_documents.side_effect = lambda doc_id, content: [MagicMock(page_content=content)]
+    state.upload_original.return_value = True
+    state.ingest_metrics.return_value = {}
+    return state
+
+
+@pytest.fixture
+def mock_pipeline():
+    vectorstore = MagicMock()
+    with patch('services.indexing.app.open_vectorstore', return_value=vectorstore), \
+         patch('services.indexing.app.upload_vectorized_db') as mock_upload_db, \
+         patch('services.indexing.batch_writer.record_doc_ids') as mock_record, \
+         patch('services.indexing.app.hash_file', side_effect=lambda path: f"hash-of-{path.split('/')[-1]}"), \
+         patch('services.indexing.app.detect_file_type') as mock_detect:
+        mock_detect.side_effect = lambda path, mime_type=None: make_state(fail_read=path.endswith('bad.txt'))
+        yield vectorstore, mock_upload_db, mock_record
+
+
+def test_process_many_reports_each_file(mock_pipeline, tmpdir):
+    vectorstore, mock_upload_db, _ = mock_pipeline
+    paths = [f"doc_{i}.txt" for i in range(5)]
+
+    results = Preprocessor.process_many(paths, max_workers=3, local_folder=str(tmpdir), batch_size=2)
+
+    assert [r.file_path for r in results] == paths
+    assert all(r.status == "ok" for r in results)
+    assert all({"preprocess", "store_local", "store_cloud", "total"} <= set(r.timings) for r in results)
+    written_ids = [i for call in vectorstore.add_documents.call_args_list for i in call.kwargs['ids']]
+    assert sorted(written_ids) == sorted(r.doc_id for r in results)
+    mock_upload_db.assert_called_once()
+
+
+def test_process_many_isolates_failures(mock_pipeline, tmpdir):
+    results = Preprocessor.process_many(["good.txt", "bad.txt"], max_workers=2, local_folder=str(tmpdir))
+
+    assert results[0].status == "ok"
+    assert results[1].status == "error"
+    assert "read failed" in results[1].error
+
+
+def test_batch_writer_batches_and_flushes():
+    vectorstore = MagicMock()
+    with patch('services.indexing.batch_writer.record_doc_ids'):
+        writer = VectorStoreBatchWriter(vectorstore, "/fake/folder", batch_size=3)
+        for i in range(4):
+            writer.add([MagicMock()], [f"id{i}"])
+        assert vectorstore.add_documents.call_count == 1
+        writer.flush()
+    assert vectorstore.add_documents.call_count == 2
+    assert vectorstore.add_documents.call_args.kwargs['ids'] == ["id3"]
+
+
+def test_batch_writer_marks_failed_batch():
+    vectorstore = MagicMock()
+    vectorstore.add_documents.side_effect = Exception("chroma unavailable")
+    writer = VectorStoreBatchWriter(vectorstore, "/fake/folder", batch_size=10)
+    writer.add([MagicMock()], ["id0"])
+    writer.flush()
+    assert writer.failed("id0") == "chroma unavailable"
+    assert writer.failed("other") is None
+
+
+def test_process_many_skips_duplicate_content(mock_pipeline, tmpdir):
+    vectorstore, _, _ = mock_pipeline
+    first = Preprocessor.process_many(["a/report.txt"], local_folder=str(tmpdir))
+    second = Preprocessor.process_many(["b/report.txt", "c/other.txt"], local_folder=str(tmpdir))
+
+    assert first[0].status == "ok"
+    assert second[0].status == "duplicate"
+    assert second[0].doc_id == first[0].doc_id
+    assert second[1].status == "ok"
+    written_ids = [i for call in vectorstore.add_documents.call_args_list for i in call.kwargs['ids']]
+    assert written_ids.count(first[0].doc_id) == 1
+
+
+def test_failed_vector_write_uploads_nothing(mock_pipeline, tmpdir):
+    vectorstore, mock_upload_db, _ = mock_pipeline
+    vectorstore.add_documents.side_effect = Exception("chroma unavailable")
+    states = []
+    with patch('services.indexing.app.detect_file_type',
+               side_effect=lambda path, mime_type=None: states.append(make_state()) or states[-1]):
+        results = Preprocessor.process_many(["a.txt", "b.txt"], local_folder=str(tmpdir))
+
+    assert [r.status for r in results] == ["error", "error"]
+    assert all(r.error == "chroma unavailable" for r in results)
+    for state in states:
+        state.upload_original.assert_not_called()
+        state.upload_text.assert_not_called()
+    mock_upload_db.assert_not_called()
+
+
+def test_process_records_ingest_metrics(mock_pipeline, tmpdir):
+    preprocessor = Preprocessor("scan.pdf", local_folder=str(tmpdir))
+    preprocessor.state.ingest_metrics.return_value = {"pages": 3, "pages_per_sec": 12.5}
+
+    preprocessor.process()
+
+    assert preprocessor.metrics == {"pages": 3, "pages_per_sec": 12.5}
@@ -0,0 +1,44 @@
+import pytest
+from unittest.mock import patch
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from services.indexing.file_processing_states import TextFileState, open_multi_vector_retriever
+
+
+@pytest.fixture
+def text_state(tmpdir):
+    """TextFileState writing to a temporary vector store with offline embeddings"""
+    with patch('services.indexing.file_processing_states.get_embeddings',
+               return_value=DeterministicFakeEmbedding(size=32)):
+        state = TextFileState()
+    state.vectorize(str(tmpdir))
+    return state
+
+
+def test_chunk_documents_keep_parent_id(text_state):
+    content = "\n\n".join(f"Paragraph {i}. " + "word " * 150 for i in range(6))
+    segments = [content[i:i + 700] for i in range(0, len(content), 700)]
+    chunks, chunk_ids = zip(*text_state.iter_chunk_documents("doc-1", segments))
+
+    assert len(chunks) > 1
+    assert len(chunk_ids) == len(set(chunk_ids)) == len(chunks)
+    assert all(chunk.metadata["doc_id"] == "doc-1" for chunk in chunks)
+    assert [chunk.metadata["chunk_index"] for chunk in chunks] == list(range(len(chunks)))
+
+
+def test_store_chunks_links_passages_to_parent(text_state, tmpdir):
+    content = "The warranty covers parts for two years. " * 50
+    text_state.store_chunks("doc-1", iter([content[:500], content[500:]]), batch_size=4)
+
+    retriever = open_multi_vector_retriever(str(tmpdir), text_state.embeddings)
+    passages = retriever.vectorstore.similarity_search("warranty", k=2, filter={"doc_id": {"$in": ["doc-1"]}})
+    assert passages and all(p.metadata["doc_id"] == "doc-1" for p in passages)
+
+    parents = retriever.invoke("warranty")
+    assert [parent.metadata["doc_id"] for parent in parents] == ["doc-1"]
+    assert parents[0].page_content == content
+
+
+def test_empty_content_still_stores_parent(text_state, tmpdir):
+    text_state.store_chunks("empty-doc", "")
+    retriever = open_multi_vector_retriever(str(tmpdir), text_state.embeddings)
+    assert retriever.docstore.mget(["empty-doc"])[0].page_content == ""
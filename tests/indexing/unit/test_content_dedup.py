@@ -0,0 +1,108 @@
+import time
+import pytest
+from unittest.mock import patch
+from services.common.content_registry import ContentHashRegistry
+from services.common.helper import FileUUIDGenerator, hash_file
+
+
+def test_hash_file_matches_for_identical_bytes(tmpdir):
+    first = tmpdir.join("first.txt")
+    second = tmpdir.join("second.txt")
+    first.write_binary(b"same bytes" * 100000)
+    second.write_binary(b"same bytes" * 100000)
+
+    assert hash_file(str(first), chunk_size=4096) == hash_file(str(second))
+    second.write_binary(b"other bytes")
+    assert hash_file(str(first)) != hash_file(str(second))
+
+
+def test_content_uuid_is_deterministic():
+    generator = FileUUIDGenerator()
+    assert generator.generate_content_uuid("abc") == generator.generate_content_uuid("abc")
+    assert generator.generate_content_uuid("abc") != generator.generate_content_uuid("abd")
+
+
+def test_registry_claim_commit_and_persist(tmpdir):
+    registry = ContentHashRegistry(str(tmpdir))
+    assert registry.claim("h1", "doc-1") is None
+    # In-flight content is reported as a duplicate of the claiming document
+    assert registry.claim("h1", "doc-2") == "doc-1"
+    registry.commit("h1")
+
+    reloaded = ContentHashRegistry(str(tmpdir))
+    assert reloaded.lookup("h1") == "doc-1"
+
+
+def test_registry_release_and_remove(tmpdir):
+    registry = ContentHashRegistry(str(tmpdir))
+    registry.claim("h1", "doc-1")
+    registry.release("h1")
+    assert registry.claim("h1", "doc-2") is None
+    registry.commit("h1")
+
+    assert registry.remove_doc_id("doc-2") is True
+    assert registry.lookup("h1") is None
+    assert ContentHashRegistry(str(tmpdir)).lookup("h1") is None
+
+
+def test_claims_are_shared_between_worker_processes(tmpdir):
+    first = ContentHashRegistry(str(tmpdir))
+    second = ContentHashRegistry(str(tmpdir))  # as opened by another worker process
+    assert first.claim("h1", "doc-1") is None
+    # Deterministic ids are equal for both uploads; only one of them owns the claim
+    assert second.claim("h1", "doc-1") == "doc-1"
+    assert second.claim("h1", "doc-2") == "doc-1"
+    first.release("h1")
+    assert second.claim("h1", "doc-2") is None
+
+
+def test_stale_claim_is_taken_over(tmpdir):
+    registry = ContentHashRegistry(str(tmpdir), stale_seconds=0)
+    registry.claim("h1", "doc-1")
+    time.sleep(0.01)
+    assert registry.claim("h1", "doc-2") is None
+    registry.commit("h1")
+    assert registry.lookup("h1") == "doc-2"
+
+
+def test_failed_vector_write_does_not_commit_hash(tmpdir):
+    from services.indexing.app import Preprocessor
+    from services.indexing.file_processing_states import TextFileState
+    path = tmpdir.join("a.txt")
+    path.write("hello")
+    with patch('services.indexing.file_processing_states.get_embeddings'):
+        state = TextFileState()
+    state.preprocess_segments = lambda segments: "summary"
+    with patch('services.indexing.app.detect_file_type', return_value=state), \
+         patch('services.indexing.file_processing_states.open_vectorstore') as open_store:
+        open_store.return_value.add_documents.side_effect = RuntimeError("embedding service unavailable")
+        preprocessor = Preprocessor(str(path), local_folder=str(tmpdir), index_mode="summary")
+        with pytest.raises(RuntimeError):
+            preprocessor.process()
+
+    registry = ContentHashRegistry.for_folder(str(tmpdir))
+    assert registry.lookup(preprocessor.content_hash) is None
+    assert registry.claim(preprocessor.content_hash, "doc-2") is None
+
+
+def test_failed_upload_does_not_commit_hash(tmpdir):
+    from services.indexing.app import Preprocessor
+    from services.indexing.file_processing_states import TextFileState
+    path = tmpdir.join("a.txt")
+    path.write("hello")
+    with patch('services.indexing.file_processing_states.get_embeddings'):
+        state = TextFileState()
+    state.preprocess_segments = lambda segments: "summary"
+    with patch('services.indexing.app.detect_file_type', return_value=state), \
+         patch('services.indexing.file_processing_states.open_vectorstore'), \
+         patch('services.indexing.file_processing_states.get_s3_handler') as get_handler, \
+         patch('services.indexing.app.upload_vectorized_db') as push:
+        get_handler.return_value.upload_file.return_value = False
+        preprocessor = Preprocessor(str(path), local_folder=str(tmpdir), index_mode="summary")
+        with pytest.raises(RuntimeError, match="original file"):
+            preprocessor.process()
+
+    push.assert_not_called()
+    registry = ContentHashRegistry.for_folder(str(tmpdir))
+    assert registry.lookup(preprocessor.content_hash) is None
+    assert registry.claim(preprocessor.content_hash, "doc-2") is None
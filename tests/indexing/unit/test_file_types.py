@@ -0,0 +1,34 @@
+import sys
+from services.indexing.file_types import FileTypeRegistry, file_types
+
+
+class CustomState:
+    pass
+
+
+def test_lazy_target_is_imported_on_first_use(tmp_path, monkeypatch):
+    (tmp_path / "markdown_state.py").write_text("class MarkdownState:\n    pass\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    registry = FileTypeRegistry()
+    registry.register("markdown_state:MarkdownState", extensions=(".md",))
+
+    assert "markdown_state" not in sys.modules
+    state_class = registry.resolve("notes.MD")
+    assert state_class.__name__ == "MarkdownState"
+    assert "markdown_state" in sys.modules
+    assert registry.resolve("other.md") is state_class
+    monkeypatch.delitem(sys.modules, "markdown_state")
+
+
+def test_extension_before_mime_type():
+    registry = FileTypeRegistry()
+    registry.register(CustomState, extensions=(".md",), mime_types=("text/markdown",))
+
+    assert registry.resolve("notes.md") is CustomState
+    assert registry.resolve("upload.bin", mime_type="text/markdown") is CustomState
+    assert registry.resolve("upload.bin") is None
+
+
+def test_default_registrations():
+    assert file_types.extensions() == [".docx", ".pdf", ".txt"]
+    assert file_types.resolve("notes", mime_type="text/plain").__name__ == "TextFileState"
@@ -0,0 +1,113 @@
+import pytest
+import fakeredis
+from unittest.mock import patch, MagicMock
+from services.indexing.job_queue import IngestionQueue, IngestionWorker, DONE, DUPLICATE, FAILED, RETRYING, QUEUED
+
+
+@pytest.fixture
+def queue():
+    return IngestionQueue(client=fakeredis.FakeStrictRedis(decode_responses=True), max_attempts=2,
+                          retry_base_seconds=10, retry_max_seconds=60)
+
+
+def fake_preprocessor(fail=False, duplicate_of=None):
+    """Preprocessor double that walks through the pipeline stages"""
+    def build(file_path, **kwargs):
+        metrics = {} if duplicate_of else {"pages": 12, "pages_per_sec": 40.0}
+        preprocessor = MagicMock(duplicate_of=duplicate_of, metrics=metrics)
+
+        def process(on_stage):
+            for stage in ("preprocess", "vectorize", "store_local", "store_cloud"):
+                on_stage(stage)
+                if fail:
+                    raise RuntimeError("embedding service unavailable")
+            return duplicate_of or "doc-1"
+        preprocessor.process.side_effect = process
+        return preprocessor
+    return build
+
+
+def test_worker_completes_job_with_stage_timings(queue, tmpdir):
+    upload_folder = tmpdir.mkdir("job-1")
+    file_path = upload_folder.join("a.txt")
+    file_path.write("hello")
+    job_id = queue.enqueue(str(file_path), job_id="job-1")
+    assert queue.get(job_id)["status"] == QUEUED
+    assert queue.metrics()["queue_depth"] == 1
+
+    with patch('services.indexing.job_queue.Preprocessor', side_effect=fake_preprocessor()):
+        assert IngestionWorker(queue, local_folder=str(tmpdir)).run_once(poll_timeout=0.1) == job_id
+
+    job = queue.get(job_id)
+    assert job["status"] == DONE and job["doc_id"] == "doc-1" and job["progress"] == 1
+    assert set(job["timings"]) == {"preprocess", "vectorize", "store_local", "store_cloud"}
+    assert job["metrics"] == {"pages": 12, "pages_per_sec": 40.0}
+    assert not upload_folder.exists()  # the per-job upload folder is removed
+    metrics = queue.metrics()
+    assert metrics["queue_depth"] == 0 and metrics["running"] == 0 and metrics["completed"] == 1
+    assert metrics["stages"]["preprocess"]["count"] == 1
+    assert queue.index_version() == 1
+
+
+def test_upload_hash_and_mime_type_reach_the_preprocessor(queue, tmpdir):
+    queue.enqueue(str(tmpdir.join("scan")), content_hash="abc", mime_type="application/pdf", cleanup=False)
+    with patch('services.indexing.job_queue.Preprocessor', side_effect=fake_preprocessor()) as mock_preprocessor:
+        IngestionWorker(queue, local_folder=str(tmpdir)).run_once(poll_timeout=0.1)
+
+    kwargs = mock_preprocessor.call_args.kwargs
+    assert kwargs["content_hash"] == "abc" and kwargs["mime_type"] == "application/pdf"
+
+
+def test_duplicates_are_reported(queue, tmpdir):
+    job_id = queue.enqueue(str(tmpdir.join("a.txt")), cleanup=False)
+    with patch('services.indexing.job_queue.Preprocessor', side_effect=fake_preprocessor(duplicate_of="doc-0")):
+        IngestionWorker(queue).run_once(poll_timeout=0.1)
+    assert queue.get(job_id)["status"] == DUPLICATE
+    assert queue.get(job_id)["doc_id"] == "doc-0"
+    assert queue.index_version() == 0  # nothing new to see for the API server
+
+
+def test_index_versions_are_kept_per_workspace(queue, tmpdir):
+    for workspace in ("team-a", "team-a", "team-b"):
+        queue.enqueue(str(tmpdir.join("a.txt")), cleanup=False, workspace=workspace)
+    with patch('services.common.partitions.PARTITION_BY', "workspace"), \
+         patch('services.indexing.job_queue.Preprocessor', side_effect=fake_preprocessor()):
+        worker = IngestionWorker(queue)
+        for _ in range(3):
+            worker.run_once(poll_timeout=0.1)
+
+    assert queue.index_versions() == {"team-a": 2, "team-b": 1}
+    assert queue.index_version() == 3
+
+
+def test_failed_job_is_retried_with_backoff_then_failed(queue, tmpdir):
+    file_path = tmpdir.join("a.txt")
+    file_path.write("hello")
+    job_id = queue.enqueue(str(file_path))
+    worker = IngestionWorker(queue)
+
+    with patch('services.indexing.job_queue.Preprocessor', side_effect=fake_preprocessor(fail=True)):
+        worker.run_once(poll_timeout=0.1)
+        job = queue.get(job_id)
+        assert job["status"] == RETRYING and "unavailable" in job["error"]
+        assert job["retry_at"] > job["started_at"] + 5
+        assert worker.run_once(poll_timeout=0.1) is None  # not due yet
+        assert file_path.exists()  # kept for the retry
+
+        queue.promote_due(now=job["retry_at"] + 1)
+        worker.run_once(poll_timeout=0.1)
+
+    job = queue.get(job_id)
+    assert job["status"] == FAILED and job["attempts"] == 2
+    assert not file_path.exists()
+    assert queue.metrics()["failed"] == 1 and queue.metrics()["retried"] == 1
+
+
+def test_stale_jobs_are_requeued(queue, tmpdir):
+    job_id = queue.enqueue(str(tmpdir.join("a.txt")))
+    assert queue.claim(timeout=0.1) == job_id
+    assert queue.recover_stale(stale_seconds=60) == []
+
+    heartbeat = queue.get(job_id)["heartbeat"]
+    assert queue.recover_stale(stale_seconds=60, now=heartbeat + 61) == [job_id]
+    assert queue.claim(timeout=0.1) == job_id
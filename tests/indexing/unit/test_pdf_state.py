@@ -0,0 +1,97 @@
+import pytest
+from unittest.mock import patch
+from concurrent.futures import ProcessPoolExecutor
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from services.indexing.readers import iter_pdf_pages
+from services.indexing.file_processing_states import PDFFileState
+from services.indexing.file_types import detect_file_type
+
+
+def write_pdf(path, page_texts):
+    """Write a minimal PDF with one line of Helvetica text per page"""
+    page_count = len(page_texts)
+    font_id = 3 + 2 * page_count
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % (3 + 2 * i) for i in range(page_count))
+        + b"] /Count %d >>" % page_count,
+    ]
+    for i, text in enumerate(page_texts):
+        stream = b"BT /F1 12 Tf 72 720 Td (" + text.encode("latin-1") + b") Tj ET"
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (4 + 2 * i, font_id))
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    data, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+@pytest.fixture
+def pdf_state(tmpdir):
+    with patch('services.indexing.file_processing_states.get_embeddings',
+               return_value=DeterministicFakeEmbedding(size=32)):
+        state = PDFFileState()
+    state.vectorize(str(tmpdir))
+    return state
+
+
+def test_pdf_routes_to_pdf_state():
+    with patch('services.indexing.file_processing_states.get_embeddings'):
+        assert isinstance(detect_file_type("report.pdf"), PDFFileState)
+
+
+def test_parallel_extraction_keeps_page_order(tmpdir):
+    texts = [f"Page number {i}" for i in range(1, 8)]
+    path = write_pdf(str(tmpdir.join("doc.pdf")), texts)
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        pages = list(iter_pdf_pages(path, executor=executor, pages_per_task=2, parallel_min_pages=2, max_in_flight=2))
+
+    assert [number for number, _ in pages] == list(range(1, 8))
+    assert [text.strip() for _, text in pages] == texts
+
+
+def test_chunks_carry_page_numbers(pdf_state, tmpdir):
+    path = write_pdf(str(tmpdir.join("doc.pdf")), ["Warranty terms", "Shipping policy"])
+
+    assert pdf_state.read(path).split() == ["Warranty", "terms", "Shipping", "policy"]
+    metrics = pdf_state.ingest_metrics()
+    assert metrics["pages"] == 2 and metrics["pages_per_sec"] > 0
+
+    with patch('services.indexing.file_processing_states.iter_pdf_pages') as mock_pages:
+        chunks = [chunk for chunk, _ in pdf_state.iter_chunk_documents("doc-1", pdf_state.iter_segments(path))]
+        mock_pages.assert_not_called()  # second pass replays the extracted pages
+    assert [(chunk.page_content, chunk.metadata["page"]) for chunk in chunks] == [
+        ("Warranty terms", 1), ("Shipping policy", 2)
+    ]
+    assert pdf_state.summary_documents("doc-1", "summary")[0].metadata["page_count"] == 2
+
+
+def test_page_spool_is_closed(pdf_state, tmpdir):
+    first = write_pdf(str(tmpdir.join("first.pdf")), ["Warranty terms", "Shipping policy"])
+    second = write_pdf(str(tmpdir.join("second.pdf")), ["Return policy"])
+
+    pdf_state.read(first)
+    spool = pdf_state._page_spool
+    pdf_state.read(second)
+    assert spool.closed  # replaced by the spool of the second file
+
+    abandoned = pdf_state.iter_segments(first)
+    next(abandoned)
+    abandoned.close()
+    assert pdf_state._page_spool is None  # a partial spool is never kept for replay
+
+    pdf_state.read(first)
+    spool = pdf_state._page_spool
+    pdf_state.release()
+    assert spool.closed and pdf_state._page_spool is None
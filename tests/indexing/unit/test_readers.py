@@ -0,0 +1,55 @@
+import zipfile
+from services.indexing.readers import iter_text_segments, iter_docx_segments, join_lines, split_segments
+
+DOCUMENT_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+    '<w:p><w:r><w:t>First</w:t></w:r><w:r><w:tab/><w:t xml:space="preserve">paragraph</w:t></w:r></w:p>'
+    '<w:tbl><w:tr>'
+    '<w:tc><w:p><w:r><w:t>A1</w:t></w:r></w:p></w:tc>'
+    '<w:tc><w:p><w:r><w:t>B1</w:t></w:r></w:p><w:p><w:r><w:t>more</w:t></w:r></w:p></w:tc>'
+    '</w:tr></w:tbl>'
+    '<w:p><w:r><w:t>Last</w:t></w:r></w:p>'
+    '</w:body></w:document>'
+)
+
+
+def write_docx(path):
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr("word/document.xml", DOCUMENT_XML)
+    return path
+
+
+def test_text_segments_are_bounded_and_lossless(tmpdir):
+    content = "".join(f"line {i} " + "x" * (i % 40) + "\n" for i in range(500))
+    path = tmpdir.join("big.txt")
+    path.write_text(content, encoding="utf-8")
+
+    segments = list(iter_text_segments(str(path), segment_chars=256))
+
+    assert "".join(segments) == content
+    assert len(segments) > 1
+    assert all(len(segment) <= 256 for segment in segments)
+    assert all(segment.endswith("\n") for segment in segments)
+
+
+def test_docx_segments_include_tables(tmpdir):
+    path = write_docx(str(tmpdir.join("doc.docx")))
+
+    text = "".join(iter_docx_segments(path, segment_chars=8))
+
+    assert text == "First\tparagraph\nA1\tB1 more\nLast"
+
+
+def test_join_lines_matches_newline_join():
+    lines = [f"row {i}" for i in range(100)]
+    assert "".join(join_lines(lines, segment_chars=30)) == "\n".join(lines)
+
+
+def test_split_segments_ignores_segment_boundaries():
+    words = " ".join(f"w{i}" for i in range(200))
+    split_text = lambda text: [text[i:i + 50] for i in range(0, len(text), 50)]
+    segments = [words[i:i + 37] for i in range(0, len(words), 37)]
+
+    assert "".join(split_segments(segments, split_text)) == words
+    assert all(len(chunk) <= 50 for chunk in split_segments(segments, split_text))
@@ -0,0 +1,103 @@
+import threading
+import time
+import pytest
+from langchain_core.runnables import RunnableLambda
+from services.indexing.summarizer import Summarizer, count_tokens
+
+
+class RecordingLLM:
+    """Fake chat model that records prompts and tracks concurrent calls"""
+    def __init__(self, delay=0.0):
+        self.prompts = []
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, prompt_value):
+        prompt = prompt_value.to_string()
+        with self.lock:
+            self.prompts.append(prompt)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        return f"summary#{len(self.prompts)}"
+
+    def runnable(self):
+        return RunnableLambda(self)
+
+
+def test_short_document_uses_single_call():
+    llm = RecordingLLM()
+    summarizer = Summarizer(llm=llm.runnable(), max_tokens=1000, chunk_tokens=100)
+
+    assert summarizer.summarize("A short document.") == "summary#1"
+    assert len(llm.prompts) == 1
+    assert llm.prompts[0].startswith("Human: Summarize the following document:")
+
+
+def test_long_document_is_map_reduced_concurrently():
+    llm = RecordingLLM(delay=0.02)
+    summarizer = Summarizer(llm=llm.runnable(), max_tokens=200, chunk_tokens=100, fan_out=3)
+    content = "\n\n".join(f"Section {i}. " + "lorem ipsum dolor sit amet " * 20 for i in range(12))
+
+    summary = summarizer.summarize(content)
+
+    map_calls = [p for p in llm.prompts if "part of a longer document" in p]
+    reduce_calls = [p for p in llm.prompts if "Combine them" in p]
+    assert len(map_calls) > 3
+    assert reduce_calls
+    assert summary == f"summary#{len(llm.prompts)}"
+    assert 1 < llm.max_active <= 3
+
+
+def test_reduce_is_recursive_when_partials_do_not_fit():
+    llm = RecordingLLM()
+    summarizer = Summarizer(llm=llm.runnable(), max_tokens=5, chunk_tokens=5, fan_out=2)
+
+    summarizer.summarize_chunks(iter(["chunk one", "chunk two", "chunk three", "chunk four", "chunk five"]))
+
+    reduce_calls = [p for p in llm.prompts if "Combine them" in p]
+    assert len(reduce_calls) > 1
+
+
+def test_empty_chunks_return_empty_summary():
+    llm = RecordingLLM()
+    assert Summarizer(llm=llm.runnable()).summarize_chunks(iter([])) == ""
+    assert count_tokens("") == 0
+
+
+def test_segments_stream_into_map_reduce_only_when_too_long():
+    llm = RecordingLLM()
+    summarizer = Summarizer(llm=llm.runnable(), max_tokens=200, chunk_tokens=100, fan_out=2)
+    assert summarizer.summarize_segments(iter(["short ", "document"])) == "summary#1"
+    assert "short document" in llm.prompts[0]
+
+    segments = (f"Section {i}. " + "lorem ipsum dolor sit amet " * 20 + "\n\n" for i in range(12))
+    summarizer.summarize_segments(segments)
+    assert any("part of a longer document" in p for p in llm.prompts)
+
+
+def test_rate_limited_call_is_retried_through_scheduler():
+    from services.common.rate_limiter import RateScheduler
+
+    class Throttled(Exception):
+        status_code = 429
+
+    llm = RecordingLLM()
+    calls = []
+
+    def flaky(prompt_value):
+        calls.append(prompt_value)
+        if len(calls) == 1:
+            raise Throttled()
+        return llm(prompt_value)
+
+    scheduler = RateScheduler("summary", rpm=6000, tpm=10 ** 6, backoff_base=0.01)
+    summarizer = Summarizer(llm=RunnableLambda(flaky), max_tokens=1000, chunk_tokens=100, scheduler=scheduler)
+
+    assert summarizer.summarize("A short document.") == "summary#1"
+    assert len(calls) == 2
+    assert scheduler.stats()["throttled"] == 1
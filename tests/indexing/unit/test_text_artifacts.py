@@ -0,0 +1,54 @@
+import os
+from unittest.mock import MagicMock, patch
+from docx import Document
+from services.common.content_registry import ContentHashRegistry
+from services.common.document_registry import DocumentRegistry
+from services.common.text_artifacts import load_text, text_path
+
+
+def make_word_state(tmpdir):
+    from services.indexing.file_processing_states import WordFileState
+    with patch('services.indexing.file_processing_states.get_embeddings'):
+        state = WordFileState()
+    state.local_folder = str(tmpdir.join("db"))
+    state.content_hash = "h1"
+    return state
+
+
+def test_store_text_writes_artifact_and_registers_counts(tmpdir):
+    path = str(tmpdir.join("report.docx"))
+    document = Document()
+    document.add_paragraph("Quarterly revenue grew by twelve percent.")
+    document.add_paragraph("Churn fell to two percent.")
+    document.save(path)
+    state = make_word_state(tmpdir)
+    registry = ContentHashRegistry.for_folder(state.local_folder)
+    registry.claim("h1", "doc-1", {"name": "report.docx"})
+
+    tokens = state.store_text("doc-1", state.iter_segments(path))
+    registry.commit("h1")
+
+    text = load_text(text_path(state.local_folder, "doc-1"))
+    assert "Quarterly revenue grew" in text and "Churn fell" in text
+    record = DocumentRegistry.for_folder(state.local_folder).get("doc-1")
+    assert record["chars"] == len(text) and record["tokens"] == tokens > 0
+
+
+def test_full_document_uses_text_artifact_without_s3(tmpdir):
+    from services.retrieval.app import Retriever
+    state = make_word_state(tmpdir)
+    state.store_text("doc-2", ["Plain text ", "extracted at ingest."])
+    dst = tmpdir.mkdir("dst")
+    with patch('services.retrieval.app.RedisClient'), \
+         patch('services.retrieval.app.VectorStore', return_value=MagicMock(local_folder=state.local_folder)), \
+         patch('services.retrieval.app.get_s3_handler') as s3_handler, \
+         patch('services.retrieval.app.get_result_cache'):
+        retriever = Retriever()
+
+    with patch('services.retrieval.app.get_document_cache') as document_cache:
+        assert retriever.full_document("doc-2", str(dst))
+
+    assert os.listdir(str(dst)) == ["doc-2.txt"]
+    assert dst.join("doc-2.txt").read() == "Plain text extracted at ingest."
+    document_cache.assert_not_called()
+    s3_handler.return_value.download_file.assert_not_called()
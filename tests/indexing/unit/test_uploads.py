@@ -0,0 +1,44 @@
+import io
+import os
+import hashlib
+from werkzeug.test import EnvironBuilder
+from werkzeug.formparser import parse_form_data
+from services.indexing.uploads import UploadBatch, sniff_mime_type, safe_file_name, remove_upload, DOCX_MIME_TYPE
+
+
+def test_sniff_mime_type():
+    assert sniff_mime_type(b"%PDF-1.7\n...", "report.txt") == "application/pdf"
+    assert sniff_mime_type(b"PK\x03\x04....word/document.xml", "upload") == DOCX_MIME_TYPE
+    assert sniff_mime_type(b"PK\x03\x04....", "archive.zip") == "application/zip"
+    assert sniff_mime_type("Grüße".encode("utf-8")[:-1], None) == "text/plain"  # cut inside a character
+    assert sniff_mime_type(b"\x00\x01\x02", "blob") == "application/octet-stream"
+
+
+def test_safe_file_name():
+    assert safe_file_name("../../etc/passwd") == "passwd"
+    assert safe_file_name("C:\\Users\\me\\报告 (1).pdf") == "报告 (1).pdf"
+    assert safe_file_name("..") == "upload"
+
+
+def test_multipart_files_are_spooled_hashed_and_sniffed(tmpdir):
+    pdf = b"%PDF-1.4\n" + os.urandom(300_000)
+    text = b"plain text notes\n" * 1000
+    builder = EnvironBuilder(method="POST", data={
+        "file": [(io.BytesIO(pdf), "scan.pdf"), (io.BytesIO(text), "notes.txt"), (io.BytesIO(text), "notes.txt")]
+    })
+    batch = UploadBatch(upload_folder=str(tmpdir), chunk_size=4096)
+    _, _, files = parse_form_data(builder.get_environ(), stream_factory=batch.stream_factory)
+
+    uploads = [file.stream for file in files.getlist("file")]
+    assert uploads == batch.files
+    for upload in uploads:
+        upload.close()
+    assert [upload.mime_type for upload in uploads] == ["application/pdf", "text/plain", "text/plain"]
+    assert uploads[0].content_hash == hashlib.sha256(pdf).hexdigest() and uploads[0].size == len(pdf)
+    assert uploads[1].file_path != uploads[2].file_path  # same name, separate folders
+    with open(uploads[0].file_path, "rb") as f:
+        assert f.read() == pdf
+
+    for upload in uploads:
+        remove_upload(upload.file_path, str(tmpdir))
+    assert os.listdir(str(tmpdir)) == []  # the request folder goes with its last file
@@ -0,0 +1,113 @@
+import os
+import threading
+from services.retrieval.document_cache import DocumentCache
+
+
+class FakeS3:
+    """Objects of the "files" folder as {key: (etag, bytes)}, counting requests."""
+    def __init__(self, objects):
+        self.objects = objects
+        self.calls = {"list": 0, "head": 0, "download": 0}
+
+    def list_objects(self, folder_prefix, object_name_prefix=""):
+        self.calls["list"] += 1
+        return [{"Key": key, "ETag": etag, "Size": len(data)}
+                for key, (etag, data) in self.objects.items() if key.startswith(f"user/{folder_prefix}/{object_name_prefix}")]
+
+    def object_etag(self, object_key):
+        self.calls["head"] += 1
+        return self.objects[object_key][0] if object_key in self.objects else None
+
+    def download_object(self, object_key, file_name):
+        self.calls["download"] += 1
+        with open(file_name, 'wb') as f:
+            f.write(self.objects[object_key][1])
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(tmpdir, objects, **kwargs):
+    s3 = FakeS3(objects)
+    clock = Clock()
+    cache = DocumentCache(str(tmpdir.join("cache")), s3, revalidate_seconds=60, clock=clock, **kwargs)
+    dst = tmpdir.mkdir("dst")
+    return cache, s3, clock, str(dst)
+
+
+def test_second_fetch_is_served_from_disk(tmpdir):
+    cache, s3, _, dst = make_cache(tmpdir, {"user/files/doc-1.docx": ('"e1"', b"report")})
+
+    path = cache.fetch("doc-1", dst)
+    os.unlink(path)  # the caller cleans its folder after every request
+    path = cache.fetch("doc-1", dst)
+
+    assert open(path, 'rb').read() == b"report" and os.path.basename(path) == "doc-1.docx"
+    assert s3.calls == {"list": 1, "head": 0, "download": 1}
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_removed_document_is_downloaded_again(tmpdir):
+    cache, s3, _, dst = make_cache(tmpdir, {"user/files/doc-1.docx": ('"e1"', b"report")})
+    os.unlink(cache.fetch("doc-1", dst))
+
+    assert cache.remove("doc-1") is True and cache.remove("doc-1") is False
+    assert cache.stats()["entries"] == 0 and os.listdir(cache.blob_folder) == []
+    del s3.objects["user/files/doc-1.docx"]
+    assert cache.fetch("doc-1", dst) is None
+
+
+def test_revalidates_by_etag_after_ttl(tmpdir):
+    objects = {"user/files/doc-1.txt": ('"e1"', b"v1")}
+    cache, s3, clock, dst = make_cache(tmpdir, objects)
+    cache.fetch("doc-1", dst)
+
+    clock.now += 61
+    cache.fetch("doc-1", dst)
+    assert s3.calls["download"] == 1 and s3.calls["head"] == 1  # unchanged: one HEAD, no download
+
+    objects["user/files/doc-1.txt"] = ('"e2"', b"v2")
+    clock.now += 61
+    path = cache.fetch("doc-1", dst)
+    assert open(path, 'rb').read() == b"v2" and s3.calls["download"] == 2
+    assert len(os.listdir(cache.blob_folder)) == 1  # the old version was dropped
+
+    del objects["user/files/doc-1.txt"]
+    clock.now += 61
+    assert cache.fetch("doc-1", dst) is None and cache.stats()["entries"] == 0
+
+
+def test_evicts_least_recently_used(tmpdir):
+    objects = {f"user/files/doc-{i}.txt": (f'"e{i}"', b"x" * 100) for i in range(3)}
+    cache, s3, clock, dst = make_cache(tmpdir, objects, max_bytes=250)
+    cache.fetch("doc-0", dst)
+    clock.now += 1
+    cache.fetch("doc-1", dst)
+    clock.now += 1
+    cache.fetch("doc-0", dst)  # doc-1 is now the least recently used
+    clock.now += 1
+    cache.fetch("doc-2", dst)
+
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["entries"] == 2 and stats["bytes"] == 200
+    cache.fetch("doc-1", dst)
+    assert s3.calls["download"] == 4
+
+
+def test_concurrent_fetches_download_once(tmpdir):
+    cache, s3, _, _ = make_cache(tmpdir, {"user/files/doc-1.pdf": ('"e1"', b"%PDF")})
+    folders = [str(tmpdir.mkdir(f"reader-{i}")) for i in range(8)]
+
+    threads = [threading.Thread(target=cache.fetch, args=("doc-1", folder)) for folder in folders]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert s3.calls["download"] == 1
+    assert all(open(os.path.join(folder, "doc-1.pdf"), 'rb').read() == b"%PDF" for folder in folders)
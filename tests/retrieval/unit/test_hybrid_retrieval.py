@@ -0,0 +1,76 @@
+from unittest.mock import MagicMock, patch
+from langchain_core.documents import Document
+from services.common.keyword_index import KeywordIndex
+from services.common.local_embeddings import HashingEmbeddings
+from services.common.resources import release_vectorstores
+from services.retrieval.query_cache import QueryVectorCache
+from services.retrieval.app import Retriever, reciprocal_rank_fusion
+from services.retrieval.result_cache import SemanticResultCache
+
+
+def doc(doc_id):
+    return Document(page_content=f"summary of {doc_id}", metadata={"doc_id": doc_id})
+
+
+def make_retriever(tmpdir, vector_ids):
+    vector_store = MagicMock(local_folder=str(tmpdir))
+    vector_store.embed_query.return_value = [1.0, 0.0]
+    vector_store.similarity_search_by_vector.side_effect = \
+        lambda embedding, content_keys, k: [doc(doc_id) for doc_id in vector_ids if not content_keys or doc_id in content_keys][:k]
+    vector_store.get_documents.side_effect = lambda doc_ids: [doc(doc_id) for doc_id in doc_ids]
+    with patch('services.retrieval.app.RedisClient'), \
+         patch('services.retrieval.app.VectorStore', return_value=vector_store), \
+         patch('services.retrieval.app.get_s3_handler'), \
+         patch('services.retrieval.app.get_result_cache', return_value=SemanticResultCache()):
+        retriever = Retriever()
+    index = KeywordIndex(str(tmpdir))
+    index.add_document("manual", "Error E42: replace part AB-1234.")
+    index.add_document("faq", "How to charge the battery.")
+    return retriever, vector_store, index
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    assert reciprocal_rank_fusion([["a", "b"], ["b", "c"]]) == ["b", "a", "c"]
+
+
+def test_hybrid_finds_keyword_match_missed_by_vectors(tmpdir):
+    retriever, vector_store, index = make_retriever(tmpdir, ["faq", "policy"])
+    with patch.object(Retriever, 'keyword_index', index):
+        docs = retriever.hybrid_search("part AB-1234", [1.0, 0.0], k=3)
+
+    assert [d.metadata["doc_id"] for d in docs] == ["faq", "manual", "policy"]
+    vector_store.get_documents.assert_called_once_with(["manual"])
+
+
+def test_hybrid_promotes_document_found_by_both(tmpdir):
+    retriever, _, index = make_retriever(tmpdir, ["policy", "manual"])
+    with patch.object(Retriever, 'keyword_index', index):
+        assert retriever.retrieve("part AB-1234", mode="hybrid")[0].metadata["doc_id"] == "manual"
+
+
+def test_prefilter_restricts_vector_search_to_keyword_hits(tmpdir):
+    retriever, vector_store, index = make_retriever(tmpdir, ["faq", "manual"])
+    with patch.object(Retriever, 'keyword_index', index):
+        assert retriever.retrieve("error E42", mode="prefilter")[0].metadata["doc_id"] == "manual"
+        assert retriever.retrieve("nothing matches", mode="prefilter")[0].metadata["doc_id"] == "faq"
+
+
+def test_hybrid_loads_keyword_only_hits_from_chroma(tmpdir):
+    from services.retrieval.vector_store import VectorStore
+    embeddings = HashingEmbeddings(dim=64)
+    with patch('services.retrieval.vector_store.get_embeddings', return_value=embeddings), \
+         patch('services.retrieval.vector_store.get_query_cache', return_value=QueryVectorCache(embeddings)):
+        vector_store = VectorStore(str(tmpdir))
+    vector_store.vectorstore.add_documents([doc("faq"), doc("manual")], ids=["faq", "manual"])
+    _, _, index = make_retriever(tmpdir, [])
+    with patch('services.retrieval.app.RedisClient'), \
+         patch('services.retrieval.app.VectorStore', return_value=vector_store), \
+         patch('services.retrieval.app.get_s3_handler'), \
+         patch('services.retrieval.app.get_result_cache', return_value=SemanticResultCache()), \
+         patch.object(Retriever, 'keyword_index', index), \
+         patch.object(vector_store, 'similarity_search_by_vector', return_value=[doc("faq")]):
+        docs = Retriever().hybrid_search("part AB-1234", vector_store.embed_query("part AB-1234"), k=2)
+
+    assert [(d.metadata["doc_id"], d.page_content) for d in docs] == [("faq", "summary of faq"),
+                                                                      ("manual", "summary of manual")]
+    release_vectorstores()
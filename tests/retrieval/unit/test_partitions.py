@@ -0,0 +1,64 @@
+from unittest.mock import patch
+from services.common.document_registry import DocumentRegistry
+from services.common.flat_index import NumpyFlatIndex
+from services.common.local_embeddings import HashingEmbeddings
+from services.common.partitions import partition_name
+from services.retrieval.query_cache import QueryVectorCache
+
+DOCUMENTS = {
+    "acme": {"acme-warranty": "Our warranty covers parts for two years.",
+             "acme-shipping": "Shipping takes five business days."},
+    "globex": {"globex-shipping": "Shipping is free on orders over fifty dollars.",
+               "globex-refunds": "Refunds are issued to the original payment method."},
+}
+
+
+def test_partition_names():
+    assert partition_name("summaries") == "summaries"
+    assert partition_name("summaries", "acme") == "summaries--acme"
+    unsafe = partition_name("summaries", "Team A/B")
+    assert unsafe.startswith("summaries--Team_A_B_") and unsafe != partition_name("summaries", "Team A_B")
+    assert partition_name("chunks", "x" * 100)[-1].isalnum()
+
+
+def make_vector_store(tmpdir, workspace="acme"):
+    from services.retrieval.vector_store import VectorStore
+    embeddings = HashingEmbeddings(dim=128)
+    registry = DocumentRegistry.for_folder(str(tmpdir))
+    stores = {}
+    for ws, texts in DOCUMENTS.items():
+        name = partition_name("summaries", ws)
+        store = NumpyFlatIndex(embeddings, str(tmpdir.join(name)), collection_name=name)
+        store.add_texts(list(texts.values()), [{"doc_id": doc_id} for doc_id in texts], ids=list(texts))
+        stores[name] = store
+        registry.add_many([(doc_id, {"workspace": ws}) for doc_id in texts])
+    with patch('services.retrieval.vector_store.get_embeddings', return_value=embeddings), \
+         patch('services.retrieval.vector_store.get_vectorstore', side_effect=lambda name, *args: stores[name]), \
+         patch('services.retrieval.vector_store.get_query_cache', return_value=QueryVectorCache(embeddings)), \
+         patch('services.common.partitions.PARTITION_BY', "workspace"):
+        vector_store = VectorStore(str(tmpdir), workspace=workspace)
+    return vector_store, stores
+
+
+@patch('services.retrieval.vector_store.PARTITION_BY', "workspace")
+def test_search_stays_in_own_partition(tmpdir):
+    vector_store, stores = make_vector_store(tmpdir)
+    with patch('services.retrieval.vector_store.get_vectorstore', side_effect=lambda name, *args: stores[name]):
+        results = vector_store.similarity_search("free shipping on orders", k=4)
+
+    assert {doc.metadata["doc_id"] for doc in results} == {"acme-warranty", "acme-shipping"}
+
+
+@patch('services.retrieval.vector_store.PARTITION_BY', "workspace")
+def test_content_keys_route_to_their_partitions(tmpdir):
+    vector_store, stores = make_vector_store(tmpdir)
+
+    assert vector_store.routes(["acme-warranty", "acme-shipping"]) == {"acme": None}  # whole partition: no filter
+    assert vector_store.routes(["globex-refunds", "unknown"]) == {"globex": ["globex-refunds"], None: ["unknown"]}
+
+    with patch('services.retrieval.vector_store.get_vectorstore', side_effect=lambda name, *args: stores[name]):
+        results = vector_store.similarity_search("shipping", ["acme-shipping", "globex-shipping"], k=2)
+        documents = vector_store.get_documents(["globex-refunds", "acme-warranty"])
+
+    assert {doc.metadata["doc_id"] for doc in results} == {"acme-shipping", "globex-shipping"}
+    assert {doc.id for doc in documents} == {"globex-refunds", "acme-warranty"}
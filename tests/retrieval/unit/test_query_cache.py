@@ -0,0 +1,83 @@
+import pytest
+import fakeredis
+from unittest.mock import MagicMock, patch
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from services.retrieval.query_cache import QueryVectorCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def embeddings():
+    model = MagicMock(model="fake-model")
+    model.embed_query.side_effect = lambda text: [float(len(text)), 0.5]
+    return model
+
+
+def test_normalized_repeats_hit_the_cache(embeddings):
+    cache = QueryVectorCache(embeddings)
+
+    assert cache.embed_query("What is the  warranty?") == [21.0, 0.5]
+    assert cache.embed_query("  what is the WARRANTY? ") == [21.0, 0.5]
+    embeddings.embed_query.assert_called_once_with("what is the warranty?")
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1 and cache.stats()["hit_rate"] == 0.5
+
+
+def test_lru_eviction_and_ttl(embeddings):
+    clock = FakeClock()
+    cache = QueryVectorCache(embeddings, max_entries=2, ttl_seconds=10, clock=clock)
+    for query in ("a", "b", "a", "c"):  # "b" is least recently used when "c" arrives
+        cache.embed_query(query)
+    assert cache.stats()["entries"] == 2
+    cache.embed_query("b")
+    assert embeddings.embed_query.call_count == 4
+
+    clock.now = 11
+    cache.embed_query("b")
+    assert embeddings.embed_query.call_count == 5
+
+
+def test_redis_tier_is_shared_between_processes(embeddings):
+    client = fakeredis.FakeStrictRedis(decode_responses=True)
+    QueryVectorCache(embeddings, redis_client=client).embed_query("shipping time")
+
+    other_process = QueryVectorCache(embeddings, redis_client=client)
+    assert other_process.embed_query("Shipping time") == [13.0, 0.5]
+    assert embeddings.embed_query.call_count == 1
+    assert other_process.stats()["redis_hits"] == 1
+
+
+def test_vector_store_searches_by_cached_vector(tmpdir):
+    from langchain_chroma import Chroma
+    from services.retrieval.vector_store import VectorStore
+
+    embeddings = DeterministicFakeEmbedding(size=16)
+    store = Chroma(collection_name="summaries", embedding_function=embeddings, persist_directory=str(tmpdir))
+    store.add_texts(["returns policy", "shipping policy"], metadatas=[{"doc_id": "a"}, {"doc_id": "b"}], ids=["a", "b"])
+    cache = QueryVectorCache(embeddings)
+    with patch('services.retrieval.vector_store.get_embeddings', return_value=embeddings), \
+         patch('services.retrieval.vector_store.get_vectorstore', return_value=store), \
+         patch('services.retrieval.vector_store.get_query_cache', return_value=cache):
+        vector_store = VectorStore(local_folder=str(tmpdir))
+
+    assert vector_store.similarity_search("shipping policy")[0].metadata["doc_id"] == "b"
+    assert vector_store.similarity_search("Shipping  policy", content_keys=["a"])[0].metadata["doc_id"] == "a"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_batch_embeds_only_misses_in_one_call(embeddings):
+    embeddings.embed_queries.side_effect = lambda texts: [[float(len(text)), 1.0] for text in texts]
+    cache = QueryVectorCache(embeddings, redis_client=fakeredis.FakeStrictRedis())
+    cache.embed_query("warranty")
+
+    vectors = cache.embed_queries(["Warranty", "shipping time", "shipping  time"])
+
+    assert vectors == [[8.0, 0.5], [13.0, 1.0], [13.0, 1.0]]
+    embeddings.embed_queries.assert_called_once_with(["shipping time"])
+    assert QueryVectorCache(embeddings, redis_client=cache.redis_client).embed_queries(["shipping time"]) == [[13.0, 1.0]]
@@ -0,0 +1,94 @@
+import numpy as np
+from unittest.mock import MagicMock, patch
+from langchain_core.documents import Document
+from services.retrieval.result_cache import SemanticResultCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def doc(doc_id):
+    return Document(page_content=f"content of {doc_id}", metadata={"doc_id": doc_id})
+
+
+def test_near_duplicate_query_reuses_results():
+    cache = SemanticResultCache(threshold=0.95)
+    key = cache.search_key("summaries", 1, ["b", "a"])
+    cache.put([1.0, 0.0, 0.0], key, [doc("a")])
+
+    assert cache.get([0.99, 0.05, 0.0], key)[0].metadata["doc_id"] == "a"
+    assert cache.get([0.99, 0.05, 0.0], cache.search_key("summaries", 1, ["a", "b"])) is not None  # same filter
+    assert cache.get([0.99, 0.05, 0.0], cache.search_key("summaries", 1, ["a"])) is None  # other filter
+    assert cache.get([0.5, 0.5, 0.0], key) is None  # below threshold
+    assert cache.stats()["hits"] == 2
+
+
+def test_lru_eviction_and_ttl():
+    clock = FakeClock()
+    cache = SemanticResultCache(threshold=0.99, max_entries=2, ttl_seconds=10, clock=clock)
+    key = cache.search_key("summaries", 1)
+    cache.put([1.0, 0.0], key, [doc("a")])
+    cache.put([0.0, 1.0], key, [doc("b")])
+    assert cache.get([1.0, 0.0], key) is not None  # "a" becomes most recently used
+    clock.now = 5
+    cache.put([-1.0, 0.0], key, [doc("c")])
+
+    assert cache.get([0.0, 1.0], key) is None
+    assert cache.get([1.0, 0.0], key) is not None
+    clock.now = 11
+    assert cache.get([1.0, 0.0], key) is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_deleting_a_document_invalidates_its_results():
+    cache = SemanticResultCache()
+    key = cache.search_key("passages", 4)
+    cache.put([1.0, 0.0], key, [doc("a"), doc("b")])
+    cache.put([0.0, 1.0], key, [doc("b")])
+    cache.put([-1.0, 0.0], key, [doc("c")])
+
+    assert cache.invalidate_document("b") == 2
+    assert cache.get([1.0, 0.0], key) is None and cache.get([0.0, 1.0], key) is None
+    assert cache.get([-1.0, 0.0], key) is not None
+
+
+def test_new_documents_invalidate_only_their_workspace():
+    cache = SemanticResultCache()
+    team_a = cache.search_key("summaries", 1, workspace="team-a")
+    team_b = cache.search_key("summaries", 1, workspace="team-b")
+    cache.put([1.0, 0.0], team_a, [doc("a")])
+    cache.put([1.0, 0.0], cache.search_key("passages", 4, workspace="team-a"), [doc("a")])
+    cache.put([1.0, 0.0], team_b, [doc("b")])
+
+    assert cache.invalidate_workspace("team-a") == 2
+    assert cache.get([1.0, 0.0], team_a) is None
+    assert cache.get([1.0, 0.0], team_b) is not None
+    assert cache.invalidate_workspace("team-c") == 0
+
+
+def test_many_distinct_filters_do_not_grow_without_bound():
+    cache = SemanticResultCache(max_entries=4)
+    for i in range(100):
+        cache.put(np.random.rand(8), cache.search_key("summaries", 1, [f"doc-{i}"]), [doc(f"doc-{i}")])
+    assert cache.stats()["entries"] == 4 and len(cache._key_ids) <= 8
+    assert cache.get(np.ones(8), cache.search_key("summaries", 1, ["doc-0"])) is None
+
+
+def test_retriever_skips_search_for_paraphrase():
+    from services.retrieval.app import Retriever
+    vector_store = MagicMock()
+    vector_store.embed_query.side_effect = [[1.0, 0.0], [0.98, 0.1]]
+    vector_store.similarity_search_by_vector.return_value = [doc("a")]
+    with patch('services.retrieval.app.RedisClient'), \
+         patch('services.retrieval.app.VectorStore', return_value=vector_store), \
+         patch('services.retrieval.app.get_s3_handler'), \
+         patch('services.retrieval.app.get_result_cache', return_value=SemanticResultCache(threshold=0.95)):
+        retriever = Retriever()
+
+    assert retriever.retrieve("what is the warranty", ["a"]) == retriever.retrieve("warranty terms?", ["a"])
+    vector_store.similarity_search_by_vector.assert_called_once()
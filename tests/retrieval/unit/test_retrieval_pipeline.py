@@ -0,0 +1,73 @@
+import time
+import json
+import asyncio
+from unittest.mock import MagicMock
+import fakeredis
+from langchain_core.documents import Document
+from services.retrieval.pipeline import RetrievalPipeline
+from services.retrieval.redis_client import AsyncRedisClient
+
+
+def make_retriever(delay=0.05):
+    retriever = MagicMock()
+    retriever.vector_store.embed_query.side_effect = lambda query: time.sleep(delay) or [0.1, 0.2]
+    retriever.retrieve_passages.return_value = []
+    retriever.retrieve.return_value = [Document(page_content="summary", metadata={"doc_id": "doc-1"})]
+    retriever.full_document.side_effect = lambda doc_id, dst_folder: time.sleep(delay) or True
+    return retriever
+
+
+def test_async_redis_client_stores_queries_in_sequence():
+    async def store():
+        client = AsyncRedisClient(fakeredis.FakeAsyncRedis(decode_responses=True))
+        keys = [await client.store_query("first", "block-1", sender_id="ann"),
+                await client.store_query("second", "block-1")]
+        return keys, await client.client.hget("block-1", "1")
+
+    keys, stored = asyncio.run(store())
+    assert keys == ["block-1:0", "block-1:1"]
+    assert json.loads(stored)["query"] == "second"
+
+
+def test_document_is_fetched_before_generation_and_stages_are_timed(tmpdir):
+    retriever = make_retriever()
+    generated = []
+    pipeline = RetrievalPipeline(retriever, AsyncRedisClient(fakeredis.FakeAsyncRedis(decode_responses=True)),
+                                 lambda redis_key, directory_path=None: generated.append((redis_key, directory_path))
+                                 or "42")
+
+    answer = asyncio.run(pipeline.run("meaning of life", str(tmpdir), conversation_block_id="block-1",
+                                      content_keys=["doc-1"]))
+
+    assert answer == "42" and generated == [("block-1:0", str(tmpdir))]
+    retriever.full_document.assert_called_once_with("doc-1", str(tmpdir))
+    assert set(pipeline.timings) == {"store_query", "embed", "search", "fetch", "generate"}
+
+
+def test_passages_skip_full_document_and_missing_document_raises(tmpdir):
+    retriever = make_retriever(delay=0)
+    retriever.retrieve_passages.return_value = [Document(page_content="passage", metadata={"doc_id": "doc-1"})]
+    pipeline = RetrievalPipeline(retriever, AsyncRedisClient(fakeredis.FakeAsyncRedis(decode_responses=True)),
+                                 lambda redis_key, directory_path=None: "ok")
+
+    assert asyncio.run(pipeline.run("q", str(tmpdir), "block-1", content_keys=["doc-1"])) == "ok"
+    retriever.save_passages.assert_called_once()
+    retriever.full_document.assert_not_called()
+
+    retriever.retrieve_passages.return_value = []
+    retriever.retrieve.return_value = []
+    try:
+        asyncio.run(pipeline.run("q", str(tmpdir), "block-1", content_keys=["doc-1"]))
+        assert False, "expected LookupError"
+    except LookupError:
+        pass
+
+
+def test_without_content_keys_only_generates(tmpdir):
+    retriever = make_retriever()
+    pipeline = RetrievalPipeline(retriever, AsyncRedisClient(fakeredis.FakeAsyncRedis(decode_responses=True)),
+                                 lambda redis_key, directory_path=None: f"gpt:{redis_key}:{directory_path}")
+
+    assert asyncio.run(pipeline.run("hello", str(tmpdir), "block-2")) == "gpt:block-2:0:None"
+    assert set(pipeline.timings) == {"store_query", "generate"}
+    retriever.vector_store.embed_query.assert_not_called()
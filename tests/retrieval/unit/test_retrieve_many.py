@@ -0,0 +1,47 @@
+from unittest.mock import patch
+from services.common.flat_index import NumpyFlatIndex
+from services.common.local_embeddings import HashingEmbeddings
+from services.retrieval.query_cache import QueryVectorCache
+from services.retrieval.result_cache import SemanticResultCache
+
+TEXTS = {"warranty": "Our warranty covers parts for two years.", "shipping": "Shipping takes five business days.",
+         "refunds": "Refunds are issued to the original payment method."}
+
+
+def make_retriever(tmpdir):
+    from services.retrieval.app import Retriever
+    from services.retrieval.vector_store import VectorStore
+    embeddings = HashingEmbeddings(dim=128)
+    index = NumpyFlatIndex(embeddings, str(tmpdir))
+    index.add_texts(list(TEXTS.values()), [{"doc_id": doc_id} for doc_id in TEXTS], ids=list(TEXTS))
+    with patch('services.retrieval.vector_store.get_embeddings', return_value=embeddings), \
+         patch('services.retrieval.vector_store.get_vectorstore', return_value=index), \
+         patch('services.retrieval.vector_store.get_query_cache', return_value=QueryVectorCache(embeddings)):
+        vector_store = VectorStore(str(tmpdir))
+    with patch('services.retrieval.app.RedisClient'), \
+         patch('services.retrieval.app.VectorStore', return_value=vector_store), \
+         patch('services.retrieval.app.get_s3_handler'), \
+         patch('services.retrieval.app.get_result_cache', return_value=SemanticResultCache()):
+        return Retriever(), embeddings
+
+
+def test_results_in_input_order_without_duplicates(tmpdir):
+    retriever, embeddings = make_retriever(tmpdir)
+    queries = ["how long does shipping take", "shipping business days", "warranty for parts"]
+
+    with patch.object(embeddings, 'embed_documents', wraps=embeddings.embed_documents) as embed:
+        results = retriever.retrieve_many(queries)
+
+    assert len({doc.metadata["doc_id"] for docs in results for doc in docs}) == 3
+    assert results[0][0].metadata["doc_id"] == "shipping" and results[2][0].metadata["doc_id"] == "warranty"
+    embed.assert_called_once()
+
+
+def test_content_keys_and_k_apply_to_every_query(tmpdir):
+    retriever, _ = make_retriever(tmpdir)
+
+    results = retriever.retrieve_many(["payment refund", "parts warranty"], content_keys=["refunds", "warranty"], k=2)
+
+    assert [doc.metadata["doc_id"] for doc in results[0]] == ["refunds", "warranty"]
+    assert results[1] == []
+    assert retriever.retrieve_many([]) == []
@@ -0,0 +1,47 @@
+import time
+import asyncio
+import pytest
+from services.retrieval.stage_runner import StageRunner, server_timing
+
+
+def test_independent_stages_overlap_and_results_flow():
+    async def sleep(value, seconds=0.05):
+        await asyncio.sleep(seconds)
+        return value
+
+    runner = StageRunner()
+    runner.add("a", lambda: sleep(1))
+    runner.add("b", lambda: sleep(2))
+    runner.add("c", lambda a, b: sleep(a + b, 0), after=("a", "b"))
+
+    start = time.perf_counter()
+    results = asyncio.run(runner.run())
+
+    assert results == {"a": 1, "b": 2, "c": 3}
+    assert time.perf_counter() - start < 0.09  # a and b ran concurrently
+    assert set(runner.timings) == {"a", "b", "c"} and runner.timings["a"] >= 45
+
+
+def test_failure_cancels_running_stages():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def fail():
+        raise LookupError("nothing found")
+
+    runner = StageRunner().add("slow", slow).add("fail", fail)
+    with pytest.raises(LookupError):
+        asyncio.run(runner.run())
+    assert cancelled == [True]
+
+
+def test_unknown_dependency_and_header():
+    with pytest.raises(ValueError):
+        StageRunner().add("search", lambda embed: None, after=("embed",))
+    assert server_timing({"embed": 12.5, "search": 3.1}) == "embed;dur=12.5, search;dur=3.1"